@@ -0,0 +1,26 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import process_time
+from random import randrange
+
+# Aggregate cost should follow the size of the summed range, not the size of the table
+db = Database()
+
+table_sizes = [10000, 50000, 100000]
+range_sizes = [10, 100, 1000]
+number_of_aggregates = 100
+
+for table_size in table_sizes:
+    grades_table = db.create_table('Grades%d' % table_size, 5, 0)
+    query = Query(grades_table)
+    for i in range(0, table_size):
+        query.insert(906659671 + i, 93, 0, 0, 0)
+
+    for range_size in range_sizes:
+        agg_time_0 = process_time()
+        for i in range(0, number_of_aggregates):
+            start_value = 906659671 + randrange(0, table_size - range_size)
+            end_value = start_value + range_size
+            result = query.sum(start_value, end_value - 1, randrange(0, 5))
+        agg_time_1 = process_time()
+        print("Table %7d rows, %d aggregates of %4d records took:\t" % (table_size, number_of_aggregates, range_size), agg_time_1 - agg_time_0)
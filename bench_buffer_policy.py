@@ -0,0 +1,60 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from time import perf_counter
+from random import choice, seed
+import os
+import shutil
+
+# Point selects on a small hot set, interleaved with full scans of an un-indexed column.
+# The buffer pool holds the hot set but not the scanned column, so the hit rate shows
+# how much of the hot set survives each scan under every replacement policy.
+number_of_records = 50000
+hot_records = 4096
+buffer_frames = 128
+rounds = 20
+selects_per_round = 500
+
+path = "./BenchBufferPolicy"
+if os.path.exists(path):
+    shutil.rmtree(path)
+db = Database(path)
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+keys = []
+for i in range(0, number_of_records):
+    query.insert(906659671 + i, 93, i % 100, 0, 0)
+    keys.append(906659671 + i)
+db.close()
+hot_keys = keys[:hot_records]
+
+for policy in ["lru", "clock", "2q", "lru-k"]:
+    seed(551)
+    db = Database(path, buffer_pool_bytes=buffer_frames * Config.PAGE_SIZE, buffer_policy=policy)
+    db.open(path)
+    grades_table = db.get_table('Grades')
+    query = Query(grades_table)
+    pool = db.buffer_pool
+
+    # warm up the hot set, then measure
+    for key in hot_keys:
+        query.select(key, 0, [1, 1, 1, 1, 1])
+    pool.reset_stats()
+
+    select_hits = select_misses = 0
+    time_0 = perf_counter()
+    for _ in range(rounds):
+        for _ in range(selects_per_round):
+            query.select(choice(hot_keys), 0, [1, 1, 1, 1, 1])
+        select_hits += pool.hits
+        select_misses += pool.misses
+        # un-indexed column, locate scans every base page
+        grades_table.index.locate(2, -1)
+        pool.reset_stats()
+    time_1 = perf_counter()
+
+    print("%-6s point select hit rate: %.3f 	(%d misses)	 took: %f" % (policy, select_hits / (select_hits + select_misses), select_misses, time_1 - time_0))
+    db.close()
+
+shutil.rmtree(path)
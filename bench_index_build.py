@@ -0,0 +1,41 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+import os
+import shutil
+
+# create_index on columns 2-4 (as m3_tester_part_1.py does) of a large table, built in this
+# thread and by worker processes. The gain depends on the number of CPUs.
+number_of_records = 300000
+
+def main():
+    path = "./BenchIndexBuild"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    for i in range(0, number_of_records):
+        query.insert(906659671 + i, 93, (i * 7919) % 100000, i % 100, i % 7)
+    db.close()
+
+    print("cpus:", os.cpu_count())
+    for workers in [1, 2, 4]:
+        db = Database(path)
+        db.open(path)
+        grades_table = db.get_table('Grades')
+        time_0 = perf_counter()
+        for column in [2, 3, 4]:
+            grades_table.index.create_index(column, workers=workers)
+        time_1 = perf_counter()
+        print("%d worker(s): create_index on columns 2-4 took: %f" % (workers, time_1 - time_0))
+        for column in [2, 3, 4]:
+            grades_table.index.drop_index(column)
+        db.close()
+
+    shutil.rmtree(path)
+
+# the index build workers import this module
+if __name__ == "__main__":
+    main()
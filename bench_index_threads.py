@@ -0,0 +1,55 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import randrange
+import os
+import shutil
+import threading
+
+# Point lookups (Index.locate) and key ranges (locate_range) on the key index from 1-8 threads.
+# "global lock" wraps every call in one mutex, as Index.lock did for every lookup before; without
+# it readers only share the GIL (and a CPU each on a free-threaded build). Lookups per second.
+number_of_records = 100000
+lookups_per_thread = 40000
+range_every = 100
+
+path = "./BenchIndexThreads"
+if os.path.exists(path):
+    shutil.rmtree(path)
+db = Database(path)
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+for i in range(0, number_of_records):
+    query.insert(906659671 + i, 93, i % 100, 0, 0)
+index = grades_table.index
+global_mutex = threading.Lock()
+
+def reader(global_lock):
+    for i in range(lookups_per_thread):
+        key = 906659671 + randrange(number_of_records)
+        if global_lock:
+            with global_mutex:
+                if i % range_every == 0:
+                    index.locate_range(key, key + 100, 0)
+                else:
+                    index.locate(0, key)
+        elif i % range_every == 0:
+            index.locate_range(key, key + 100, 0)
+        else:
+            index.locate(0, key)
+
+print("cpus:", os.cpu_count())
+for global_lock in [True, False]:
+    for num_threads in [1, 2, 4, 8]:
+        threads = [threading.Thread(target=reader, args=(global_lock,)) for _ in range(num_threads)]
+        time_0 = perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        time_1 = perf_counter()
+        print("%-12s %d thread(s): %d lookups/s" % ("global lock" if global_lock else "lock-free", num_threads, num_threads * lookups_per_thread / (time_1 - time_0)))
+
+db.close()
+shutil.rmtree(path)
@@ -0,0 +1,108 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from time import perf_counter
+import copy
+import math
+import os
+import shutil
+import sys
+
+# Table.merge on a table with millions of tail records: the array kernel against the per-record
+# merge it replaced (kept below as merge_per_record). Both run on the same copy of the table, fresh
+# from disk. python bench_merge.py [number of updates]
+number_of_records = 100000
+number_of_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+def merge_per_record(self):
+    # the previous Table.merge: a deep copy of every base page touched, then a read, a schema test
+    # and an update per tail record and column
+    merge_start = self.page_directory.merged_tail_records
+    merge_end = self.page_directory.num_tail_records
+    merge_tail_page_indices = list(range(merge_start // Config.PAGE_CAPACITY, math.ceil(merge_end / Config.PAGE_CAPACITY)))
+    merge_tail_page_indices.reverse()
+    base_page_copies = [{} for _ in range(self.num_columns)]
+    consolidated_rids = {}
+
+    for col_idx in range(self.num_columns):
+        updated_in_this_col = set()
+        for tail_page_idx in merge_tail_page_indices:
+            tail_page = self.page_directory.get_page(tail_page_idx, "Tail", [
+                Config.RID_COLUMN, Config.SCHEMA_ENCODING_COLUMN, Config.BASE_RID_COLUMN, col_idx + Config.USER_COLUMN_START
+            ], pin=True)
+            if tail_page is None: continue
+            tail_col_data = tail_page.get_a_page(col_idx + Config.USER_COLUMN_START)
+            tail_rids = tail_page.get_a_page(Config.RID_COLUMN)
+            tail_base_rids = tail_page.get_a_page(Config.BASE_RID_COLUMN)
+            tail_schemas = tail_page.get_a_page(Config.SCHEMA_ENCODING_COLUMN)
+            page_start = tail_page_idx * Config.PAGE_CAPACITY
+            first = max(merge_start - page_start, 0)
+            last = min(merge_end - page_start, tail_col_data.num_items)
+            for rec_idx in range(last - 1, first - 1, -1):
+                if tail_rids.read(rec_idx) == -1:
+                    continue
+                base_rid = tail_base_rids.read(rec_idx)
+                if base_rid < 0 or base_rid in updated_in_this_col:
+                    continue
+                schema_val = tail_schemas.read(rec_idx)
+                if (schema_val >> col_idx) & 1:
+                    base_page_idx = base_rid // Config.PAGE_CAPACITY
+                    if base_page_idx not in base_page_copies[col_idx]:
+                        with self.page_directory.pinned_page(base_page_idx, "Base", [col_idx + Config.USER_COLUMN_START]) as base_page:
+                            if base_page is None:
+                                continue
+                            base_page_copies[col_idx][base_page_idx] = copy.deepcopy(base_page.physical_pages[col_idx + Config.USER_COLUMN_START])
+                    base_page_copies[col_idx][base_page_idx].update(base_rid % Config.PAGE_CAPACITY, tail_col_data.read(rec_idx))
+                    updated_in_this_col.add(base_rid)
+                    consolidated_rids[base_rid] = max(consolidated_rids.get(base_rid, -1), page_start + rec_idx)
+            self.page_directory.Buffer.unpin(tail_page_idx, "Tail")
+
+    for col_idx in range(self.num_columns):
+        for base_page_idx, phy_page in base_page_copies[col_idx].items():
+            with self.page_directory.pinned_page(base_page_idx, "Base", [col_idx + Config.USER_COLUMN_START]):
+                self.page_directory.Buffer.set(base_page_idx, phy_page, col_idx + Config.USER_COLUMN_START, "Base")
+
+    for rid, tail_rid in consolidated_rids.items():
+        page_idx, rec_idx = divmod(rid, Config.PAGE_CAPACITY)
+        record = self.page_directory.read_base_record(page_idx, rec_idx)
+        if record is None or record['indirection'] != tail_rid:
+            continue
+        self.page_directory.update_base_indirection(page_idx, rec_idx, -1)
+        self.page_directory.update_base_schema_encoding(page_idx, rec_idx, 0)
+    self.page_directory.merged_tail_records = merge_end
+
+path = "./BenchMerge"
+if os.path.exists(path):
+    shutil.rmtree(path)
+db = Database(path)
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+for i in range(0, number_of_records):
+    query.insert(906659671 + i, 93, 0, 0, 0)
+time_0 = perf_counter()
+for i in range(0, number_of_updates):
+    query.update(906659671 + (i * 7919) % number_of_records, None, i, None, i % 100 if i % 3 == 0 else None, None)
+print("%d updates took: %f" % (number_of_updates, perf_counter() - time_0))
+db.close()
+
+results = {}
+for name, merge in [("per-record", merge_per_record), ("array kernel", lambda table: table.merge())]:
+    run_path = path + "Run"
+    if os.path.exists(run_path):
+        shutil.rmtree(run_path)
+    shutil.copytree(path, run_path)
+    db = Database(run_path)
+    db.open(run_path)
+    grades_table = db.get_table('Grades')
+    time_0 = perf_counter()
+    merge(grades_table)
+    time_1 = perf_counter()
+    print("%s merge of %d tail records took: %f" % (name, number_of_updates, time_1 - time_0))
+    query = Query(grades_table)
+    results[name] = [query.select(906659671 + i, 0, [1, 1, 1, 1, 1])[0].columns for i in range(0, number_of_records, 97)]
+    db.close()
+    shutil.rmtree(run_path)
+
+assert results["per-record"] == results["array kernel"]
+shutil.rmtree(path)
@@ -0,0 +1,43 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from time import perf_counter
+import os
+import shutil
+
+# Cold open of a table: a fresh Database opens it and answers one point select. Without saved
+# indexes get_table rebuilds the key index (and create_index the secondary one) by reading
+# every base and tail page, with them it loads one file.
+number_of_records = 200000
+number_of_updates = 50000
+
+path = "./BenchOpen"
+if os.path.exists(path):
+    shutil.rmtree(path)
+db = Database(path)
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+grades_table.index.create_index(2)
+query = Query(grades_table)
+for i in range(0, number_of_records):
+    query.insert(906659671 + i, 93, i % 100, 0, 0)
+for i in range(0, number_of_updates):
+    query.update(906659671 + i * 4, None, None, None, i % 50, None)
+db.close()
+
+for persist in [False, True]:
+    Config.PERSIST_INDEXES = persist
+    time_0 = perf_counter()
+    db = Database(path)
+    db.open(path)
+    grades_table = db.get_table('Grades')
+    if grades_table.index.indices[2] is None:
+        grades_table.index.create_index(2)
+    Query(grades_table).select(906659671, 0, [1, 1, 1, 1, 1])
+    time_1 = perf_counter()
+    print("%-14s cold open took: %f" % ("saved indexes" if persist else "rebuild", time_1 - time_0))
+    # keep the saved file for the next round
+    Config.PERSIST_INDEXES = True
+    db.close()
+
+shutil.rmtree(path)
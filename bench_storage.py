@@ -0,0 +1,46 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import choice, randrange, seed
+import os
+import shutil
+
+# Compare the one-file-per-page layout with (memory-mapped) segment files on the same workload
+number_of_records = 20000
+seed(551)
+
+for engine in ["file", "segment", "mmap"]:
+    path = "./BenchStorage_" + engine
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    db = Database(path, storage_engine=engine)
+    db.open(path)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    keys = []
+    for i in range(0, number_of_records):
+        query.insert(906659671 + i, 93, 0, 0, 0)
+        keys.append(906659671 + i)
+    for i in range(0, number_of_records):
+        query.update(choice(keys), None, randrange(0, 100), None, None, None)
+
+    close_time_0 = perf_counter()
+    db.close()
+    close_time_1 = perf_counter()
+
+    db = Database(path)
+    db.open(path)
+    open_time_0 = perf_counter()
+    grades_table = db.get_table('Grades')
+    query = Query(grades_table)
+    for key in keys:
+        query.select(key, 0, [1, 1, 1, 1, 1])
+    open_time_1 = perf_counter()
+
+    num_files = sum(len(files) for _, _, files in os.walk(path))
+    print("%-8s close (write back) took:\t\t" % engine, close_time_1 - close_time_0)
+    print("%-8s reopen + select all took:\t\t" % engine, open_time_1 - open_time_0)
+    print("%-8s files on disk:\t\t\t\t" % engine, num_files)
+
+    shutil.rmtree(path)
@@ -1,42 +1,525 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from lstore.config import Config
+import heapq
 import threading
 
-class LRUCache:
+# Replacement policies decide which frame the buffer pool evicts next. A frame is
+# (cache, page_type, key, column_idx), the pool tells the policy about every frame it
+# admits, references again (hit) or drops, and asks victim() for an unpinned frame to evict.
+
+class LRUPolicy:
+    # strict least recently used, a single scan replaces the whole working set
     def __init__(self, capacity):
         self.capacity = capacity
+        # least recently used first
+        self.frames = OrderedDict()
+
+    def __contains__(self, frame):
+        return frame in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def admit(self, frame):
+        self.frames[frame] = None
+
+    def hit(self, frame):
+        self.frames.move_to_end(frame)
+
+    def remove(self, frame):
+        self.frames.pop(frame, None)
+
+    def victim(self, is_pinned):
+        return _pop_unpinned(self.frames, is_pinned)
+
+class ClockPolicy:
+    # second chance: a hit only sets the frame's reference bit, the hand clears set bits
+    # and evicts the first frame it finds with a clear one. Frames come in with a clear bit,
+    # so pages read once by a scan go before pages that were referenced again.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # frame -> reference bit, the front is under the clock hand
+        self.frames = OrderedDict()
+
+    def __contains__(self, frame):
+        return frame in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def admit(self, frame):
+        self.frames[frame] = False
+
+    def hit(self, frame):
+        self.frames[frame] = True
+
+    def remove(self, frame):
+        self.frames.pop(frame, None)
+
+    def victim(self, is_pinned):
+        # two sweeps clear every bit, after that only pinned frames are left
+        for _ in range(2 * len(self.frames)):
+            frame, referenced = next(iter(self.frames.items()))
+            if not referenced and not is_pinned(frame):
+                del self.frames[frame]
+                return frame
+            self.frames[frame] = False
+            self.frames.move_to_end(frame)
+        return None
+
+class TwoQueuePolicy:
+    # 2Q: new frames enter a FIFO (a1in) and move to the main LRU (am) once they are referenced
+    # again, frames evicted from a1in are remembered in a ghost list (a1out) and go straight to am
+    # when they come back. A scan reads each page once, so it cycles through a1in without
+    # touching the hot pages in am.
+    def __init__(self, capacity, in_ratio=0.25, out_ratio=0.5):
+        self.in_ratio = in_ratio
+        self.out_ratio = out_ratio
+        self.capacity = capacity
+        self.a1in = OrderedDict()
+        self.a1out = OrderedDict()
+        self.am = OrderedDict()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        self._capacity = capacity
+        self.in_size = max(1, int(capacity * self.in_ratio))
+        self.out_size = max(1, int(capacity * self.out_ratio))
+
+    def __contains__(self, frame):
+        return frame in self.am or frame in self.a1in
+
+    def __len__(self):
+        return len(self.a1in) + len(self.am)
+
+    def __iter__(self):
+        yield from self.a1in
+        yield from self.am
+
+    def admit(self, frame):
+        if frame in self.a1out:
+            del self.a1out[frame]
+            self.am[frame] = None
+        else:
+            self.a1in[frame] = None
+
+    def hit(self, frame):
+        if frame in self.am:
+            self.am.move_to_end(frame)
+        else:
+            del self.a1in[frame]
+            self.am[frame] = None
+
+    def remove(self, frame):
+        self.a1in.pop(frame, None)
+        self.am.pop(frame, None)
+
+    def victim(self, is_pinned):
+        if len(self.a1in) > self.in_size or not self.am:
+            frame = self._evict_a1in(is_pinned)
+            if frame is not None:
+                return frame
+        frame = _pop_unpinned(self.am, is_pinned)
+        if frame is None:
+            frame = self._evict_a1in(is_pinned)
+        return frame
+
+    def _evict_a1in(self, is_pinned):
+        frame = _pop_unpinned(self.a1in, is_pinned)
+        if frame is not None:
+            self.a1out[frame] = None
+            while len(self.a1out) > self.out_size:
+                self.a1out.popitem(last=False)
+        return frame
+
+class LRUKPolicy:
+    # LRU-K: evicts the frame whose K-th most recent reference is the oldest. Frames with fewer
+    # than K references go first (least recently used among them), so pages a scan reads once
+    # never displace pages that are referenced repeatedly. The reference history of evicted frames
+    # is retained for a while so a page that comes back is not treated as new.
+    def __init__(self, capacity, k=2):
+        self.capacity = capacity
+        self.k = k
+        # logical time, advanced on every reference
+        self.clock = 0
+        # resident frame -> last k reference times
+        self.history = {}
+        # evicted frame -> last k reference times, oldest first
+        self.retained = OrderedDict()
+        # (k-th reference time or 0, last reference time, frame), one entry per admitted frame.
+        # A hit only extends the history, keys only grow, so an entry whose key is out of date is
+        # pushed again with its current key when it reaches the top.
+        self.heap = []
+
+    def __contains__(self, frame):
+        return frame in self.history
+
+    def __len__(self):
+        return len(self.history)
+
+    def __iter__(self):
+        return iter(self.history)
+
+    def _key(self, history):
+        return (history[0] if len(history) == self.k else 0, history[-1])
+
+    def admit(self, frame):
+        history = self.retained.pop(frame, None)
+        if history is None:
+            history = deque(maxlen=self.k)
+        self.history[frame] = history
+        self.clock += 1
+        history.append(self.clock)
+        heapq.heappush(self.heap, self._key(history) + (frame,))
+
+        # drop the entries of removed frames once they dominate the heap
+        if len(self.heap) > 2 * len(self.history) + 64:
+            self.heap = [self._key(h) + (f,) for f, h in self.history.items()]
+            heapq.heapify(self.heap)
+
+    def hit(self, frame):
+        self.clock += 1
+        self.history[frame].append(self.clock)
+
+    def remove(self, frame):
+        self.history.pop(frame, None)
+
+    def victim(self, is_pinned):
+        skipped = []
+        victim = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            frame = entry[2]
+            history = self.history.get(frame)
+            if history is None:
+                continue
+            key = self._key(history)
+            if entry[:2] != key:
+                heapq.heappush(self.heap, key + (frame,))
+                continue
+            if is_pinned(frame):
+                skipped.append(entry)
+                continue
+            victim = frame
+            del self.history[frame]
+            self.retained[frame] = history
+            while len(self.retained) > self.capacity:
+                self.retained.popitem(last=False)
+            break
+
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return victim
+
+def _pop_unpinned(frames, is_pinned):
+    # remove and return the oldest unpinned frame, pinned ones are moved to the back
+    for _ in range(len(frames)):
+        frame = next(iter(frames))
+        if not is_pinned(frame):
+            del frames[frame]
+            return frame
+        frames.move_to_end(frame)
+    return None
+
+REPLACEMENT_POLICIES = {
+    "lru": LRUPolicy,
+    "clock": ClockPolicy,
+    "2q": TwoQueuePolicy,
+    "lru-k": LRUKPolicy,
+}
+
+class BufferPool:
+    # Frame accounting shared by the caches of every table in a database.
+    # A frame is one physical column page; the pool keeps at most budget_bytes
+    # worth of frames and evicts unpinned ones in the order the replacement policy picks.
+    def __init__(self, budget_bytes, policy=None):
+        policy = policy or Config.BUFFER_POLICY
+        if policy not in REPLACEMENT_POLICIES:
+            raise ValueError(f"Unknown buffer replacement policy: {policy}")
+        self.budget_bytes = budget_bytes
+        self.policy_name = policy
+        self.frames = REPLACEMENT_POLICIES[policy](max(1, budget_bytes // Config.PAGE_SIZE))
+        # (cache, page_type, key) -> pin count, pinned pages are never evicted
+        self.pins = {}
+        # Hits are batched per page: (cache, page_type, key) -> [columns (None: all), references],
+        # in the order the pages were last referenced. The policy hears about them (once per page,
+        # k times for LRU-K) before it admits or evicts anything, so it decides on the same order.
+        self.referenced = OrderedDict()
+        self.references_per_hit = getattr(self.frames, "k", 1)
+        # frame references served from memory / that had to register a new frame
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    @property
+    def capacity(self):
+        return self.frames.capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        self.frames.capacity = capacity
+
+    def pin(self, cache, key, page_type):
+        with self.lock:
+            pin_key = (cache, page_type, key)
+            self.pins[pin_key] = self.pins.get(pin_key, 0) + 1
+
+    def unpin(self, cache, key, page_type):
+        with self.lock:
+            pin_key = (cache, page_type, key)
+            count = self.pins.get(pin_key, 0) - 1
+            if count > 0:
+                self.pins[pin_key] = count
+            else:
+                self.pins.pop(pin_key, None)
+
+    def _is_pinned(self, frame):
+        return frame[:3] in self.pins
+
+    def reference(self, cache, key, page, page_type, column_indices):
+        # hit on a resident page: counted now, passed on to the policy by _apply_references()
+        physical_pages = page.physical_pages
+        if column_indices is None:
+            column_indices = range(len(physical_pages))
+        hits = sum(physical_pages[c] is not None for c in column_indices)
+        self.hits += hits
+        cache.stats[page_type]["hits"] += hits
+
+        ref = (cache, page_type, key)
+        entry = self.referenced.get(ref)
+        if entry is None:
+            self.referenced[ref] = [column_indices, 1]
+            return
+        self.referenced.move_to_end(ref)
+        columns = entry[0]
+        if columns != column_indices:
+            if not isinstance(columns, set):
+                columns = entry[0] = set(columns)
+            columns.update(column_indices)
+        entry[1] += 1
+
+    def _apply_references(self):
+        if not self.referenced:
+            return
+        frames = self.frames
+        for (cache, page_type, key), (column_indices, count) in self.referenced.items():
+            for column_idx in column_indices:
+                frame = (cache, page_type, key, column_idx)
+                # dropped or evicted meanwhile
+                if frame in frames:
+                    for _ in range(min(count, self.references_per_hit)):
+                        frames.hit(frame)
+        self.referenced.clear()
+
+    def touch(self, cache, key, page, page_type, column_indices):
+        # reference loaded columns, registering new ones
+        self._apply_references()
+        if column_indices is None:
+            column_indices = range(len(page.physical_pages))
+        for column_idx in column_indices:
+            if page.physical_pages[column_idx] is None:
+                continue
+            frame = (cache, page_type, key, column_idx)
+            if frame in self.frames:
+                self.hits += 1
+                cache.stats[page_type]["hits"] += 1
+                self.frames.hit(frame)
+            else:
+                self.misses += 1
+                cache.stats[page_type]["misses"] += 1
+                self.frames.admit(frame)
+
+    def drop_frames(self, cache, key, page, page_type):
+        for column_idx in range(len(page.physical_pages)):
+            self.frames.remove((cache, page_type, key, column_idx))
+
+    def evict(self):
+        # returns the evicted frames as a list of (owner, key, physical_page, page_type, column_idx)
+        evicted = []
+        if len(self.frames) > self.capacity:
+            self._apply_references()
+        while len(self.frames) > self.capacity:
+            frame = self.frames.victim(self._is_pinned)
+            if frame is None:
+                # everything left is pinned
+                break
+            cache, page_type, key, column_idx = frame
+
+            pages = cache.base_cache if page_type == "Base" else cache.tail_cache
+            page = pages.get(key)
+            if page is None or page.physical_pages[column_idx] is None:
+                continue
+            # drop the column from the page, and the page once nothing is loaded
+            evicted.append((cache.owner, key, page.physical_pages[column_idx], page_type, column_idx))
+            cache.stats[page_type]["evictions"] += 1
+            page.physical_pages[column_idx] = None
+            if all(p is None for p in page.physical_pages):
+                del pages[key]
+        return evicted
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def used_bytes(self):
+        return len(self.frames) * Config.PAGE_SIZE
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "policy": self.policy_name,
+                "budget_bytes": self.budget_bytes,
+                "capacity_frames": self.capacity,
+                "used_frames": len(self.frames),
+                "used_bytes": self.used_bytes(),
+                "pinned_pages": len(self.pins),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+            }
+
+class LRUCache:
+    # Pages are cached as objects (base_cache / tail_cache), but capacity and
+    # replacement are tracked per physical column page ("frame") in a BufferPool,
+    # so the cold columns of a hot page can be evicted on their own.
+    def __init__(self, capacity=None, pool=None):
+        # capacity: number of physical column pages for a private pool, ignored when sharing a pool
+        self.pool = pool if pool is not None else BufferPool(capacity * Config.PAGE_SIZE)
         self.base_cache = OrderedDict()
         self.tail_cache = OrderedDict()
-        self.lock = threading.Lock()
-    
-    def get(self, key, page_type):
+        # PageRange that writes back frames evicted from this cache
+        self.owner = None
+        # frame hits, misses and evictions of this cache's pages, by page type
+        self.stats = {page_type: {"hits": 0, "misses": 0, "evictions": 0} for page_type in ("Base", "Tail")}
+        self.lock = self.pool.lock
+
+    @property
+    def capacity(self):
+        return self.pool.capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        self.pool.capacity = capacity
+
+    @property
+    def frames(self):
+        # (page_type, key, column_idx) of the frames this cache holds
+        with self.lock:
+            return [frame[1:] for frame in self.pool.frames if frame[0] is self]
+
+    def get(self, key, page_type, column_indices=None, pin=False):
         with self.lock:
             cache = self.base_cache if page_type == "Base" else self.tail_cache
             if key not in cache:
                 return None
             # Move key to end (most recently used)
             cache.move_to_end(key)
+            page = cache[key]
+            self.pool.reference(self, key, page, page_type, column_indices)
+            if pin:
+                pins = self.pool.pins
+                pin_key = (self, page_type, key)
+                pins[pin_key] = pins.get(pin_key, 0) + 1
             # print(cache[key], page_type)
-            return cache[key]
+            return page
 
-    def put(self, key, page, page_type):
+    def put(self, key, page, page_type, pin=False):
+        # returns the evicted frames as a list of (owner, key, physical_page, page_type, column_idx)
         with self.lock:
             # print(page, page_type)
             cache = self.base_cache if page_type == "Base" else self.tail_cache
             if key in cache:
                 # Update and move to end
                 cache.move_to_end(key)
+                if cache[key] is not page:
+                    self.pool.drop_frames(self, key, cache[key], page_type)
             cache[key] = page
+            self.pool.touch(self, key, page, page_type, None)
+            if pin:
+                self.pool.pin(self, key, page_type)
 
             # Evict least recently used
-            total_num_pages = len(self.base_cache) + len(self.tail_cache)
-            if total_num_pages > self.capacity:
-                return cache.popitem(last=False)
-            return None
-    
+            return self.pool.evict()
+
+    def add_columns(self, key, page_type, column_indices):
+        # register columns faulted into an already cached page
+        with self.lock:
+            cache = self.base_cache if page_type == "Base" else self.tail_cache
+            if key not in cache:
+                return []
+            self.pool.touch(self, key, cache[key], page_type, column_indices)
+            return self.pool.evict()
+
+    def remove(self, key, page_type):
+        # take a page out of the buffer, returns its loaded columns to write back (as evict() does),
+        # None if it is pinned (still in use)
+        with self.lock:
+            if (self, page_type, key) in self.pool.pins:
+                return None
+            cache = self.base_cache if page_type == "Base" else self.tail_cache
+            page = cache.pop(key, None)
+            if page is None:
+                return []
+            self.pool.drop_frames(self, key, page, page_type)
+            return [(self.owner, key, physical_page, page_type, column_idx)
+                    for column_idx, physical_page in enumerate(page.physical_pages) if physical_page is not None]
+
+    def discard(self, key, page_type):
+        # drop a page without writing it back, False if it is pinned (still in use)
+        return self.remove(key, page_type) is not None
+
+    def swap(self, key, page, new_page, page_type):
+        # replace the cached page object by a new version of it in one step (the frames stay, both
+        # versions have the same columns loaded), False if key no longer maps to page
+        with self.lock:
+            cache = self.base_cache if page_type == "Base" else self.tail_cache
+            if cache.get(key) is not page:
+                return False
+            cache[key] = new_page
+            return True
+
+    def pin(self, key, page_type):
+        self.pool.pin(self, key, page_type)
+
+    def unpin(self, key, page_type):
+        self.pool.unpin(self, key, page_type)
+
     def set(self, key, page, column_index, page_type):
-        cache = self.base_cache if page_type == "Base" else self.tail_cache
-        if key in cache:
-            cache.move_to_end(key)
-            cache[key].physical_pages[column_index] = page
-            return
-        return False
+        with self.lock:
+            cache = self.base_cache if page_type == "Base" else self.tail_cache
+            if key in cache:
+                cache.move_to_end(key)
+                cache[key].physical_pages[column_index] = page
+                self.pool.touch(self, key, cache[key], page_type, [column_index])
+                return
+            return False
+
+    def get_stats(self):
+        # counters plus what is resident right now, by page type
+        with self.lock:
+            stats = {}
+            for page_type, cache in (("Base", self.base_cache), ("Tail", self.tail_cache)):
+                frames = sum(p is not None for page in cache.values() for p in page.physical_pages)
+                stats[page_type] = dict(self.stats[page_type], pages=len(cache), frames=frames, bytes=frames * Config.PAGE_SIZE)
+            return stats
+
+    def reset_stats(self):
+        with self.lock:
+            for stats in self.stats.values():
+                for name in stats:
+                    stats[name] = 0
@@ -0,0 +1,47 @@
+import threading
+import traceback
+from lstore.config import Config
+
+class Checkpointer:
+    # Background thread that takes fuzzy checkpoints of a database while transactions keep running:
+    # every `interval` seconds, or sooner once the log has grown by `log_bytes` since the last
+    # checkpoint. Nothing is done while the log has not grown.
+    def __init__(self, db, interval=None, log_bytes=None):
+        self.db = db
+        self.interval = Config.CHECKPOINT_INTERVAL if interval is None else interval
+        self.log_bytes = log_bytes or Config.CHECKPOINT_LOG_BYTES
+        # how often the log size is checked against log_bytes
+        self.poll = min(self.interval, 1.0) if self.interval else 1.0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.thread is None and self.db.wal is not None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def __run(self):
+        wal = self.db.wal
+        last_lsn = wal.end_lsn
+        waited = 0.0
+        while not self.stopped.wait(self.poll):
+            waited += self.poll
+            grown = wal.end_lsn - last_lsn
+            if grown == 0:
+                continue
+            if grown < self.log_bytes and (not self.interval or waited < self.interval):
+                continue
+            try:
+                self.db.checkpoint()
+            except Exception as e:
+                print(f"Checkpoint error: {e}")
+                traceback.print_exc()
+            last_lsn = wal.end_lsn
+            waited = 0.0
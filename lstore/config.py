@@ -8,4 +8,75 @@ class Config:
 
     # COL_OFFSET = 5
 
-    PAGE_CAPACITY = 4096 // 8
\ No newline at end of file
+    PAGE_SIZE = 4096
+    PAGE_CAPACITY = 4096 // 8
+
+    # Use NumPy int64 views for batch page reads/writes when NumPy is installed
+    USE_NUMPY = True
+
+    # Page storage layout: "file" (one file per physical page), "segment" (slots in segment files)
+    # or "mmap" (memory-mapped segment files, pages use the mapping as their buffer)
+    STORAGE_ENGINE = "file"
+    # Slots per segment file (1 GiB) and how many slots a segment grows by at a time
+    SEGMENT_MAX_SLOTS = 262144
+    SEGMENT_GROW_SLOTS = 256
+    # Slots per memory-mapped segment (64 MiB), segments are mapped at full size
+    MMAP_SEGMENT_SLOTS = 16384
+
+    # Write evicted dirty pages from a background thread instead of the evicting thread
+    ASYNC_FLUSH = True
+    # Pages the flusher queue holds before submit() blocks, and pages written per batch
+    FLUSH_QUEUE_SIZE = 1024
+    FLUSH_BATCH_SIZE = 64
+
+    # Memory budget of a database's buffer pool, shared by all of its tables
+    BUFFER_POOL_BYTES = 128 * 1024 * 1024
+    # Buffer pool replacement policy: "lru", "clock", "2q" or "lru-k" (LRU-2), the last three keep
+    # pages read once by a scan from evicting the pages that are referenced repeatedly
+    BUFFER_POLICY = "lru"
+
+    # Index built on the key column of every table: "ordered" (sorted keys, fast ranges for sum) or
+    # "hash" (compact open addressing with lock striping, equality only, ranges scan the keys)
+    KEY_INDEX_TYPE = "ordered"
+    # Independently locked segments of a hash index
+    HASH_INDEX_SEGMENTS = 64
+
+    # Save the indexes of a table on close and load them on open instead of scanning every page,
+    # a saved index is only used while the record counts of the table still match it
+    PERSIST_INDEXES = True
+
+    # Worker processes that build an index on a large table (1: none, the calling thread builds it,
+    # 0: one per CPU), tables with fewer pages than INDEX_BUILD_MIN_PAGES are indexed by the calling
+    # thread either way
+    INDEX_BUILD_WORKERS = 1
+    INDEX_BUILD_MIN_PAGES = 256
+
+    # Log inserts, updates and deletes to <db>/wal.log, Transaction.commit waits for its commit record
+    WAL_ENABLED = True
+    # Seconds a group commit leader waits for more commits before its fsync (0: sync right away,
+    # commits that arrive during an fsync still share the next one)
+    WAL_GROUP_COMMIT_DELAY = 0
+    # Size at which the log starts a new segment file, segments before the last checkpoint are deleted
+    WAL_SEGMENT_BYTES = 16 * 1024 * 1024
+
+    # Background fuzzy checkpoints, taken every CHECKPOINT_INTERVAL seconds (0: only on close) or
+    # once the log has grown by CHECKPOINT_LOG_BYTES since the last one; they bound recovery time and log size
+    CHECKPOINT_INTERVAL = 30
+    CHECKPOINT_LOG_BYTES = 64 * 1024 * 1024
+
+    # Merge tail records into base pages from a background thread (see lstore/merge_scheduler.py). Off
+    # by default, merges run when asked for; either way older relative versions stay readable, a merge
+    # keeps the version chains of the records it consolidates
+    MERGE_IN_BACKGROUND = False
+    # Seconds between checks, and the most a check is postponed by while writes keep coming in
+    MERGE_POLL = 1.0
+    MERGE_BACKOFF_MAX = 16.0
+    # New tail pages needed for a merge, and the count at which it merges regardless of reads
+    MERGE_MIN_TAIL_PAGES = 4
+    MERGE_MAX_TAIL_PAGES = 1024
+    # Merge once reads walk this many tail records per updated record read, or read this many records
+    # (base and tail) per base record read
+    MERGE_CHAIN_LENGTH = 2.0
+    MERGE_READ_AMPLIFICATION = 1.5
+    # New tail records per second above which a check backs off
+    MERGE_BACKOFF_WRITES = 20000
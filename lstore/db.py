@@ -2,19 +2,54 @@ import os
 import json
 import pickle
 import struct
+import threading
 from lstore.table import Table
 from lstore.config import Config
+from lstore.flusher import PageFlusher
+from lstore.cache_policy import BufferPool
+from lstore.wal import WriteAheadLog
+from lstore.recovery import recover
+from lstore.checkpointer import Checkpointer
 
 class Database():
 
-    def __init__(self, path= "./DefaultDB"):
+    def __init__(self, path= "./DefaultDB", storage_engine = None, buffer_pool_bytes = None, buffer_policy = None):
         self.tables = {}
         self.path = path
+        # page layout for tables created by this database: "file" or "segment"
+        self.storage_engine = storage_engine or Config.STORAGE_ENGINE
+        # background writer shared by all tables of this database
+        self.flusher = PageFlusher() if Config.ASYNC_FLUSH else None
+        # one memory budget for the pages of all tables, buffer_policy picks the replacement policy
+        self.buffer_pool = BufferPool(buffer_pool_bytes or Config.BUFFER_POOL_BYTES, buffer_policy)
         if (not os.path.exists(path)):
             os.makedirs(self.path, exist_ok=True)
+        # write-ahead log shared by all tables, from open() to close()
+        self.wal = None
+        # what recovery replayed when the database was opened, None if nothing
+        self.recovery = None
+        # tables dropped in this session, left out of the metadata
+        self.dropped = set()
+        # fuzzy checkpoints in the background, one checkpoint (or close) at a time
+        self.checkpoint_lock = threading.RLock()
+        self.checkpointer = Checkpointer(self)
 
     def _meta_path(self):
         return os.path.join(self.path, "db_meta.json")
+
+    def _open_wal(self):
+        if not Config.WAL_ENABLED:
+            return
+        wal_path = os.path.join(self.path, "wal.log")
+        if self.wal is not None:
+            if self.wal.path == wal_path:
+                return
+            self.checkpointer.stop()
+            self.wal.close()
+        self.wal = WriteAheadLog(wal_path)
+        # tables still open from before a close log to the new one
+        for table in self.tables.values():
+            table.wal = table.page_directory.wal = self.wal
     
     def open(self, path):
         """
@@ -24,6 +59,7 @@ class Database():
         self.path = path
         if (not os.path.exists(path)):
             os.makedirs(self.path, exist_ok=True)
+        self._open_wal()
 
         meta_file = self._meta_path()
         if not os.path.exists(meta_file):
@@ -31,6 +67,10 @@ class Database():
             self.tables = {}
             return
 
+        # replay what the log holds past the last checkpoint (after a crash)
+        self.recovery = recover(self)
+        self.checkpointer.start()
+
     def close(self):
         """
         Save all tables + metadata.
@@ -38,37 +78,130 @@ class Database():
         if not self.path:
             return
 
-        # save each table as a separate file
-        for name, table in self.tables.items():
-            table_path = os.path.join(self.path, f"{name}")
-            if (not os.path.exists(table_path)):
-                os.makedirs(table_path)
-            table.close()
-        
-        # save meta data to json
+        self.checkpointer.stop()
+        with self.checkpoint_lock:
+            checkpoint_lsn = self.wal.begin_checkpoint() if self.wal else None
+
+            # flush barrier: every evicted page queued so far reaches the disk
+            if self.flusher:
+                self.flusher.flush()
+
+            # save each table as a separate file
+            for name, table in self.tables.items():
+                table_path = os.path.join(self.path, f"{name}")
+                if (not os.path.exists(table_path)):
+                    os.makedirs(table_path)
+                table.close()
+
+            # records of queries outside of transactions are only buffered until here
+            if self.wal:
+                self.wal.flush()
+            # pages evicted by the last saves, on disk before the checkpoint LSN moves on
+            if self.flusher:
+                self.flusher.flush()
+            for table in self.tables.values():
+                table.page_directory.close()
+
+            self._write_meta(checkpoint_lsn)
+
+            # pages and counts are on disk, recovery starts at checkpoint_lsn
+            if self.wal:
+                self.wal.end_checkpoint(checkpoint_lsn)
+                self.wal.close()
+                self.wal = None
+
+    def checkpoint(self):
+        """
+        Fuzzy checkpoint: write the dirty pages and table counts while queries keep running, then
+        log where recovery has to start and delete the log segments before it. Returns that LSN.
+        """
+        with self.checkpoint_lock:
+            # changes are logged before they are made, the LSN stays before the record of a change still
+            # being made (WriteAheadLog.change), so everything logged before it is in the pages
+            checkpoint_lsn = self.wal.begin_checkpoint() if self.wal else None
+
+            for table in list(self.tables.values()):
+                # indexes are only saved by close, the ones saved before no longer match
+                table.index.discard_saved()
+                table.page_directory.save_to_disk()
+            # pages evicted while the tables were being saved
+            if self.flusher:
+                self.flusher.flush()
+            # every page is on disk before the checkpoint LSN moves on and the log before it goes
+            for table in list(self.tables.values()):
+                table.page_directory.storage.flush()
+
+            self._write_meta(checkpoint_lsn)
+            if self.wal:
+                self.wal.end_checkpoint(checkpoint_lsn)
+            return checkpoint_lsn
+
+    def _write_meta(self, checkpoint_lsn=None):
+        # save meta data to json, tables that were not opened in this session keep their entry
         meta = {"tables": {}}
-        for name, table in self.tables.items():
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path(), "r") as f:
+                meta["tables"] = {name: info for name, info in json.load(f).get("tables", {}).items() if name not in self.dropped}
+        for name, table in list(self.tables.items()):
             meta["tables"][name] = {
                 "num_columns": table.num_columns,
                 "key_index": table.key,
                 "num_base_records": table.page_directory.num_base_records,
-                "num_tail_records": table.page_directory.num_tail_records
+                "num_tail_records": table.page_directory.num_tail_records,
+                "merged_tail_records": table.page_directory.saved_merged_tail_records,
+                "dead_tail_records": table.page_directory.saved_dead_tail_records,
+                "storage_engine": table.storage_engine
             }
+        # where recovery starts reading the log
+        if checkpoint_lsn is not None:
+            meta["checkpoint_lsn"] = checkpoint_lsn
 
-        with open(self._meta_path(), "w") as f:
+        tmp_path = self._meta_path() + ".tmp"
+        with open(tmp_path, "w") as f:
             json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._meta_path())
+
+    def get_stats(self):
+        """
+        Buffer pool counters and per table buffer / disk I/O statistics.
+        """
+        stats = {
+            "buffer_pool": self.buffer_pool.get_stats(),
+            "flush_queue": self.flusher.queue.qsize() if self.flusher else 0,
+            "wal": dict(self.wal.stats) if self.wal else None,
+            "tables": {name: table.get_stats() for name, table in self.tables.items()},
+        }
+        return stats
+
+    def dump_stats(self, path=None):
+        """
+        Write get_stats() as JSON, to <db path>/stats.json unless a path is given.
+        """
+        stats = self.get_stats()
+        with open(path or os.path.join(self.path, "stats.json"), "w") as f:
+            json.dump(stats, f, indent=2)
+        return stats
+
+    def reset_stats(self):
+        self.buffer_pool.reset_stats()
+        for table in self.tables.values():
+            table.reset_stats()
 
     def create_table(self, name, num_columns, key_index):
         if name in self.tables:
             raise ValueError(f"Table {name} is already existed.")
+        self.dropped.discard(name)
 
         # table = Table(name, num_columns, key_index)
-        table = Table(name, self.path, num_columns, key_index)
+        table = Table(name, self.path, num_columns, key_index, storage_engine=self.storage_engine, flusher=self.flusher, buffer_pool=self.buffer_pool, wal=self.wal)
         self.tables[name] = table
 
-        # persist right away
+        # persist right away, the indexes are only saved by close
         if self.path:
-            self.close()
+            self.checkpoint()
+        self.checkpointer.start()
 
         return table
 
@@ -76,6 +209,7 @@ class Database():
         if name not in self.tables:
             raise ValueError(f"No table named: {name} found!")
         del self.tables[name]
+        self.dropped.add(name)
 
         # delete the table file too
         if self.path:
@@ -83,9 +217,13 @@ class Database():
             table_file = os.path.join(self.path, f"{name}")
             if os.path.exists(table_file):
                 os.remove(table_file)
-            self.close()
+            self.checkpoint()
 
     def get_table(self, name):
+        # already open (created or recovered in this session)
+        if name in self.tables:
+            return self.tables[name]
+
         table_path = os.path.join(self.path, name)
         
         if (name not in self.tables) and (not os.path.exists(table_path)):
@@ -101,9 +239,13 @@ class Database():
                     key = info["key_index"]
                     num_base_records = info["num_base_records"]
                     num_tail_records = info["num_tail_records"]
+                    storage_engine = info.get("storage_engine", "file")
+                    merged_tail_records = info.get("merged_tail_records", 0)
+                    dead_tail_records = info.get("dead_tail_records", {})
             
-                    table = Table(name, self.path, num_columns, key, num_base_records, num_tail_records)
+                    table = Table(name, self.path, num_columns, key, num_base_records, num_tail_records, storage_engine, self.flusher, self.buffer_pool, self.wal, merged_tail_records, dead_tail_records)
                     self.tables[name] = table
+                    self.checkpointer.start()
 
                     return table
             
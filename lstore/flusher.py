@@ -0,0 +1,60 @@
+import queue
+import threading
+import traceback
+from lstore.config import Config
+
+class PageFlusher:
+    # Background writer for dirty physical pages evicted from the buffer.
+    # Foreground threads hand evicted pages over through a bounded queue and continue,
+    # submit() blocks once the queue is full (back-pressure) and flush() is a barrier
+    # that returns when every submitted page has been written.
+    def __init__(self, queue_size=None, batch_size=None):
+        self.queue = queue.Queue(maxsize=queue_size or Config.FLUSH_QUEUE_SIZE)
+        self.batch_size = batch_size or Config.FLUSH_BATCH_SIZE
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def _start(self):
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run, daemon=True)
+                self.thread.start()
+
+    def submit(self, page_range, page_idx, column_idx, physical_page, page_type):
+        if self.thread is None:
+            self._start()
+        self.queue.put((page_range, page_idx, column_idx, physical_page, page_type))
+
+    def flush(self):
+        # wait until all queued pages are on disk
+        if self.thread is not None:
+            self.queue.join()
+
+    def __run(self):
+        while True:
+            # block for the first page, then take whatever else is already queued
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # write in page order for locality, the sort is stable so repeated pages keep their order
+            batch.sort(key=lambda item: (id(item[0]), item[4], item[2], item[1]))
+
+            # write-ahead rule: one log flush covers the whole batch
+            for page_range in {id(item[0]): item[0] for item in batch}.values():
+                try:
+                    page_range.flush_log()
+                except Exception as e:
+                    print(f"Log flush error: {e}")
+                    traceback.print_exc()
+            for page_range, page_idx, column_idx, physical_page, page_type in batch:
+                try:
+                    page_range.flush_pending(page_idx, column_idx, physical_page, page_type)
+                except Exception as e:
+                    print(f"Page flush error: {page_type} page {page_idx} column {column_idx}: {e}")
+                    traceback.print_exc()
+                finally:
+                    self.queue.task_done()
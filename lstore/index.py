@@ -2,9 +2,28 @@
 A data strucutre holding indices for various columns of a table. Key column should be indexd by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
 
-from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
 from lstore.config import Config
+from lstore.storage import open_storage
+import ast
+import functools
+import gc
+import heapq
+import math
+import multiprocessing
+import os
+import pickle
+import sys
 import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # INDIRECTION_COLUMN = 0
 # RID_COLUMN = 1
@@ -14,42 +33,142 @@ import threading
 # USER_COLUMN_START = 5
 
 # data structure used to store the index
-class OrderedDictList:
+class SortedDictList:
     """
         self.data = {
             key1: [[base_rid1, base_rid2, ...], [tail_rid1, tail_rid2, ...]],
             key2: [[base_rid3, base_rid4, ...], [tail_rid3, tail_rid4, ...]],
             ...
         }
+        self.keys = [key1, key2, ...]   (sorted, used by range lookups)
+
+    Point lookups go straight to the dict. New keys are appended to an
+    unsorted overflow run, range lookups scan it next to the sorted key array
+    and fold it in once it holds MERGE_THRESHOLD keys, so a range costs
+    O(log N + k + MERGE_THRESHOLD) and inserts share the cost of a merge.
+    Lookups return copies of the rid lists.
     """
+    # overflow runs up to this size are folded in with insort, larger ones are sorted and merged
+    INSORT_THRESHOLD = 64
+    # range lookups leave shorter overflow runs unmerged
+    MERGE_THRESHOLD = 512
+    # not safe for concurrent use, Index.lock serializes access
+    thread_safe = False
+
     def __init__(self):
-         self.data = OrderedDict()
-    
+        self.data = {}
+        self.keys = []
+        self.pending = []
+        # deleted keys still sitting in self.keys
+        self.num_stale = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key):
+        # [[base_rids], [tail_rids]] of key (a copy), None if not indexed
+        values = self.data.get(key)
+        if values is None:
+            return None
+        return [list(values[0]), list(values[1])]
+
     def add(self, key, value, page_type):
+        if page_type != 'Base' and page_type != 'Tail':
+            return False
+
         if key not in self.data:
-            # self.data[key] = []
             self.data[key] = [[],[]]
-        
+            self.pending.append(key)
+
         if(page_type == 'Base'):
             self.data[key][0].append(value)
-        elif(page_type == 'Tail'):
-            self.data[key][1].append(value)
         else:
-            return False
+            self.data[key][1].append(value)
+
+    def add_sorted(self, pairs, page_type):
+        # bulk add of (key, value) pairs in key order, the new keys form one sorted overflow run
+        slot = 0 if page_type == 'Base' else 1
+        data = self.data
+        pending = self.pending
+        for key, value in pairs:
+            values = data.get(key)
+            if values is None:
+                values = data[key] = [[], []]
+                pending.append(key)
+            values[slot].append(value)
 
-        # print("After add index value: ", key, self.data[key])
+    def needs_merge(self):
+        return len(self.pending) >= self.MERGE_THRESHOLD or self.num_stale > len(self.keys) // 2
+
+    def _merge_pending(self):
+        # fold the overflow run into the sorted key array. The array is replaced, never changed in
+        # place, so readers holding the previous one (read_range) keep a consistent snapshot
+        if self.pending:
+            if len(self.pending) <= self.INSORT_THRESHOLD:
+                keys = self.keys.copy()
+                for key in self.pending:
+                    pos = bisect_left(keys, key)
+                    if pos < len(keys) and keys[pos] == key:
+                        # key was deleted and re-added, the stale slot is live again
+                        self.num_stale -= 1
+                        continue
+                    keys.insert(pos, key)
+                self.keys = keys
+            else:
+                # timsort merges the two sorted runs in linear time (the run is sorted into a copy,
+                # read_range may be reading it)
+                merged = sorted(self.keys + sorted(self.pending))
+                self.keys = [k for i, k in enumerate(merged) if i == 0 or k != merged[i - 1]]
+                self.num_stale = len(self.keys) - len(self.data)
+            self.pending = []
+
+        # drop deleted keys once they make up half of the array
+        if self.num_stale > len(self.keys) // 2:
+            self.keys = [k for k in self.keys if k in self.data]
+            self.num_stale = 0
 
     def value_in_range(self, begin, end):
+        if self.needs_merge():
+            self._merge_pending()
+        return self.read_range(begin, end)
+
+    def read_range(self, begin, end):
+        # range over the last merged key array and the overflow run without merging, safe next to a
+        # writer (a key added meanwhile may or may not be seen). The overflow run is read first: a
+        # merge publishes the new key array before it empties the run, every key is in one of them
+        pending = [key for key in self.pending if begin <= key <= end]
+        keys = self.keys
+        data = self.data
+        lo = bisect_left(keys, begin)
+        hi = bisect_right(keys, end)
+
+        found = keys[lo:hi]
+        if pending:
+            # a deleted and re-added key can be in both
+            found = sorted(set(found).union(pending))
         res = []
-        for key, values in self.data.items():
-            if begin <= key <= end:
-                res.append(self.data[key])
+        for key in found:
+            values = data.get(key)
+            if values is not None:
+                res.append([list(values[0]), list(values[1])])
         return res
-    
+
+    def items(self):
+        # (key, [[base_rids], [tail_rids]]) in key order
+        self._merge_pending()
+        for key in self.keys:
+            values = self.data.get(key)
+            if values is not None:
+                yield key, values
+
     # remove rid from key
-    def remove_rid(self, key, rid):
+    def remove_rid(self, key, rid, page_type=None):
         """
-        Remove the given rid from the lists associated with the key.
+        Remove the given rid from the lists associated with the key (only from the
+        list of page_type if one is given, base and tail rids are numbered separately).
         If both lists become empty after removal, the key is deleted from the data.
         Returns True if the rid was found and removed, False otherwise.
         """
@@ -59,90 +178,441 @@ class OrderedDictList:
         removed = False
         
         # Remove from base
-        if rid in self.data[key][0]:
+        if page_type != 'Tail' and rid in self.data[key][0]:
             self.data[key][0].remove(rid)
             removed = True
         
         # Remove from tail
-        if rid in self.data[key][1]:
+        if page_type != 'Base' and rid in self.data[key][1]:
             self.data[key][1].remove(rid)
             removed = True
         
-        # If both empty, delete the key
+        # If both empty, delete the key (its slot in self.keys is reclaimed lazily)
         if not self.data[key][0] and not self.data[key][1]:
             del self.data[key]
+            self.num_stale += 1
         
         return removed
 
+class HashIndex:
+    """
+    Equality index over 64-bit integer keys with less memory per key than SortedDictList.
+    Keys and base rids sit in two int64 arrays, with open addressing and linear probing. Most keys
+    have one rid. A key with several rids keeps them in an overflow dict. Tail rids are not indexed.
+
+    The table is split into HashIndex.SEGMENTS independent segments, each with its own arrays and
+    its own lock (lock striping). A key's hash picks the segment, so point operations on different
+    keys rarely wait for each other and a segment grows without stopping the others. Ranges are
+    answered by scanning the key arrays.
+    """
+    SEGMENTS = 64
+    # slot states in the rid array, real rids are >= 0
+    EMPTY = -1
+    DELETED = -2
+    MULTI = -3
+    # grow a segment once this share of its slots is taken (deleted slots included)
+    MAX_LOAD = 0.7
+    thread_safe = True
+
+    def __init__(self, segments=None, capacity=16):
+        self.num_segments = segments or Config.HASH_INDEX_SEGMENTS
+        # segment bits of the hash, the segment count is rounded up to a power of two
+        self.segment_shift = 64 - max(1, (self.num_segments - 1).bit_length())
+        self.num_segments = 1 << (64 - self.segment_shift)
+        self.segments = [_HashSegment(capacity) for _ in range(self.num_segments)]
+
+    @staticmethod
+    def _hash(key):
+        # Fibonacci hashing, spreads sequential keys over segments and slots
+        return (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+
+    def _segment(self, key):
+        h = self._hash(key)
+        return self.segments[h >> self.segment_shift], h
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments)
+
+    def __contains__(self, key):
+        segment, h = self._segment(key)
+        with segment.lock:
+            return segment.find(key, h) >= 0
+
+    def __getstate__(self):
+        # locks cannot be pickled (Index.save), the arrays are
+        return {"num_segments": self.num_segments, "segment_shift": self.segment_shift,
+                "segments": [segment.__getstate__() for segment in self.segments]}
+
+    def __setstate__(self, state):
+        self.num_segments = state["num_segments"]
+        self.segment_shift = state["segment_shift"]
+        self.segments = []
+        for segment_state in state["segments"]:
+            segment = _HashSegment.__new__(_HashSegment)
+            segment.__setstate__(segment_state)
+            self.segments.append(segment)
+
+    def get(self, key):
+        # [[base_rids], []] of key (a copy), None if not indexed
+        segment, h = self._segment(key)
+        with segment.lock:
+            slot = segment.find(key, h)
+            if slot < 0:
+                return None
+            rid = segment.rids[slot]
+            return [list(segment.overflow[key]) if rid == self.MULTI else [rid], []]
+
+    def add(self, key, value, page_type):
+        if page_type != 'Base':
+            return False
+        segment, h = self._segment(key)
+        with segment.lock:
+            segment.add(key, value, h)
+
+    def add_sorted(self, pairs, page_type):
+        for key, value in pairs:
+            self.add(key, value, page_type)
+
+    def remove_rid(self, key, rid, page_type=None):
+        if page_type == 'Tail':
+            return False
+        segment, h = self._segment(key)
+        with segment.lock:
+            return segment.remove(key, rid, h)
+
+    def items(self):
+        # (key, [[base_rids], []]) in key order
+        entries = []
+        for segment in self.segments:
+            with segment.lock:
+                entries.extend(segment.entries())
+        entries.sort(key=lambda entry: entry[0])
+        return iter(entries)
+
+    def value_in_range(self, begin, end):
+        entries = []
+        for segment in self.segments:
+            with segment.lock:
+                entries.extend(segment.entries(begin, end))
+        entries.sort(key=lambda entry: entry[0])
+        return [values for _, values in entries]
+
+class _HashSegment:
+    # one stripe of a HashIndex, every method but entries() is called with self.lock held
+
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = array('q', bytes(8 * capacity))
+        self.rids = array('q', [HashIndex.EMPTY]) * capacity
+        # live keys, and slots that are not EMPTY (live + DELETED)
+        self.count = 0
+        self.used = 0
+        # key -> [base rids] of keys with more than one rid
+        self.overflow = {}
+
+    def __getstate__(self):
+        return {"keys": self.keys, "rids": self.rids, "count": self.count, "used": self.used, "overflow": self.overflow}
+
+    def __setstate__(self, state):
+        self.lock = threading.Lock()
+        self.keys = state["keys"]
+        self.rids = state["rids"]
+        self.capacity = len(self.keys)
+        self.mask = self.capacity - 1
+        self.count = state["count"]
+        self.used = state["used"]
+        self.overflow = state["overflow"]
+
+    def find(self, key, h):
+        # slot of key, -1 if absent
+        keys, rids, mask = self.keys, self.rids, self.mask
+        slot = h & mask
+        while True:
+            rid = rids[slot]
+            if rid == HashIndex.EMPTY:
+                return -1
+            if rid != HashIndex.DELETED and keys[slot] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def add(self, key, rid, h):
+        slot = self.find(key, h)
+        if slot >= 0:
+            current = self.rids[slot]
+            if current == HashIndex.MULTI:
+                self.overflow[key].append(rid)
+            else:
+                self.overflow[key] = [current, rid]
+                self.rids[slot] = HashIndex.MULTI
+            return
+
+        if (self.used + 1) > self.capacity * HashIndex.MAX_LOAD:
+            self._grow()
+        # first free slot on the probe path, a deleted one is reused
+        keys, rids, mask = self.keys, self.rids, self.mask
+        slot = h & mask
+        while rids[slot] >= 0 or rids[slot] == HashIndex.MULTI:
+            slot = (slot + 1) & mask
+        if rids[slot] == HashIndex.EMPTY:
+            self.used += 1
+        keys[slot] = key
+        rids[slot] = rid
+        self.count += 1
+
+    def remove(self, key, rid, h):
+        slot = self.find(key, h)
+        if slot < 0:
+            return False
+        current = self.rids[slot]
+        if current == HashIndex.MULTI:
+            rids = self.overflow[key]
+            if rid not in rids:
+                return False
+            rids.remove(rid)
+            if len(rids) == 1:
+                self.rids[slot] = rids[0]
+                del self.overflow[key]
+            return True
+        if current != rid:
+            return False
+        self.rids[slot] = HashIndex.DELETED
+        self.count -= 1
+        return True
+
+    def _grow(self):
+        # rehash into a table twice the size of the live keys, deleted slots are dropped
+        old_keys, old_rids, overflow = self.keys, self.rids, self.overflow
+        capacity = self.capacity
+        while self.count >= capacity * HashIndex.MAX_LOAD / 2:
+            capacity *= 2
+        self._allocate(capacity)
+        self.overflow = overflow
+        keys, rids, mask = self.keys, self.rids, self.mask
+        for key, rid in zip(old_keys, old_rids):
+            if rid == HashIndex.EMPTY or rid == HashIndex.DELETED:
+                continue
+            slot = HashIndex._hash(key) & mask
+            while rids[slot] != HashIndex.EMPTY:
+                slot = (slot + 1) & mask
+            keys[slot] = key
+            rids[slot] = rid
+            self.count += 1
+        self.used = self.count
+
+    def entries(self, begin=None, end=None):
+        # (key, [[base_rids], []]) of the live keys in [begin, end] (all if None), in slot order
+        if np is not None and Config.USE_NUMPY:
+            keys = np.frombuffer(self.keys, dtype=np.int64)
+            rids = np.frombuffer(self.rids, dtype=np.int64)
+            live = (rids >= 0) | (rids == HashIndex.MULTI)
+            if begin is not None:
+                live &= (keys >= begin) & (keys <= end)
+            slots = np.flatnonzero(live).tolist()
+        else:
+            slots = [slot for slot, rid in enumerate(self.rids)
+                     if (rid >= 0 or rid == HashIndex.MULTI) and (begin is None or begin <= self.keys[slot] <= end)]
+        entries = []
+        for slot in slots:
+            key, rid = self.keys[slot], self.rids[slot]
+            entries.append((key, [list(self.overflow[key]) if rid == HashIndex.MULTI else [rid], []]))
+        return entries
+
+# index kinds create_index can build
+INDEX_TYPES = {
+    "ordered": SortedDictList,
+    "hash": HashIndex,
+}
+
 class Index:
 
+    # file in the table directory that holds the indices saved by Table.close
+    INDEX_FILE = "index.pkl"
+
     def __init__(self, table):
         # One index for each table. All our empty initially.
         self.indices = [None] *  table.num_columns
         self.table = table
-
-        self.create_index(self.table.key, "Base")
-        
         self.lock = threading.Lock()
+
+        # the indices saved when the table was last closed if they still match its records, the ones
+        # they list are rebuilt from the pages otherwise
+        if not self.load():
+            self.create_index(self.table.key, "Base", kind=Config.KEY_INDEX_TYPE)
         pass
+
+    def _index_path(self):
+        return os.path.join(self.table.table_path, self.INDEX_FILE)
+
+    def _version(self):
+        # the saved indices are only valid for the record counts they were built from
+        page_range = self.table.page_directory
+        return [self.table.num_columns, self.table.key, page_range.num_base_records, page_range.num_tail_records]
+
+    def _layout(self):
+        # column -> kind of every index, enough to rebuild them
+        kinds = {index_type: kind for kind, index_type in INDEX_TYPES.items()}
+        return {column: kinds[type(index)] for column, index in enumerate(self.indices) if index is not None}
+
+    def _write(self, saved):
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path())
+
+    def save(self):
+        """
+        Write the indices next to the pages, called by Table.close once the pages are saved.
+        """
+        if not Config.PERSIST_INDEXES or not os.path.isdir(self.table.table_path):
+            return False
+        with self.lock:
+            indices = {}
+            for column, index in enumerate(self.indices):
+                if index is not None:
+                    # pickled with a sorted key array, loading needs no merge
+                    if isinstance(index, SortedDictList):
+                        index._merge_pending()
+                    indices[column] = index
+            self._write({"version": self._version(), "layout": self._layout(), "indices": indices})
+        return True
+
+    def load(self):
+        # False (the caller builds the key index) when there is no saved file or it is unreadable. A
+        # stale file still names the indexed columns, those indexes are rebuilt from the pages.
+        if not Config.PERSIST_INDEXES or not os.path.exists(self._index_path()):
+            return False
+        # the load allocates a few lists per key, cyclic gc passes over them would dominate
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self._index_path(), "rb") as f:
+                saved = pickle.load(f)
+        except Exception:
+            return False
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if saved.get("version") != self._version():
+            layout = dict(saved.get("layout", {}))
+            layout.setdefault(self.table.key, Config.KEY_INDEX_TYPE)
+            # the stale indices go before the rebuild
+            saved = None
+            for column, kind in sorted(layout.items()):
+                self.create_index(column, "Base", kind=kind)
+            return True
+        for column, index in saved["indices"].items():
+            self.indices[column] = index
+        return True
+
+    def discard_saved(self):
+        # the table changes after this, a crash must not leave an index file that looks current. The
+        # layout stays behind so the indexes are rebuilt after one.
+        if Config.PERSIST_INDEXES and os.path.isdir(self.table.table_path):
+            with self.lock:
+                self._write({"version": None, "layout": self._layout()})
         
     """
     # returns the location of all records with the given value on column "column"
     """     
 
+    def _lock_for(self, index):
+        # ordered indexes share Index.lock, a hash index locks its own segments
+        return nullcontext() if index.thread_safe else self.lock
+
     def locate(self, column, value):
-        with self.lock:
-            if column >= len(self.indices):
-                ValueError('Invalid column index')
-            
-            if self.indices[column]:
-                if value not in self.indices[column].data.keys():
-                    return [[], []]
-                res = self.indices[column].data[value]
-                # print('locate func: ', value, res)
-                return res
-            else:
-                # testM2: if column index not exist, return all records with the target value
-                res = [[],[]]
-                for rid, col_value in self.table.col_iterator(column):
-                    if value == col_value:
-                        res[0].append(rid)
-                return res
+        # Lock-free for readers: a dict lookup (ordered index) is atomic, a hash index only locks the
+        # segment of the key. Writers still serialize on Index.lock (ordered) or the segment locks.
+        if column >= len(self.indices):
+            ValueError('Invalid column index')
+
+        index = self.indices[column]
+        if index is not None:
+            res = index.get(value)
+            if res is None:
+                return [[], []]
+            # print('locate func: ', value, res)
+            return res
+        else:
+            # testM2: if column index not exist, return all records with the target value,
+            # pages whose zone map rules the value out are skipped
+            res = [[],[]]
+            for rid, col_value in self.table.col_iterator(column, latest=True, begin=value, end=value):
+                if value == col_value and rid != -1:
+                    res[0].append(rid)
+            return res
 
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
     """
 
     def locate_range(self, begin, end, column):
-        with self.lock:
-            if column > len(self.indices):
-                ValueError('Invalid column index')
-            
-            if self.indices[column]:
-                return self.indices[column].value_in_range(begin, end)
-            else:
-                return None
+        if column > len(self.indices):
+            ValueError('Invalid column index')
+
+        index = self.indices[column]
+        if index is None:
+            # scan the pages whose zone map overlaps the range, grouped by value as an index returns them
+            groups = {}
+            for rid, value in self.table.col_iterator(column, latest=True, begin=begin, end=end):
+                if begin <= value <= end and rid != -1:
+                    groups.setdefault(value, [[], []])[0].append(rid)
+            return [groups[value] for value in sorted(groups)]
+        if index.thread_safe:
+            return index.value_in_range(begin, end)
+
+        # a long overflow run is merged under the writers' lock, the range itself is read from the
+        # published key array and the overflow run without it
+        if index.needs_merge():
+            with self.lock:
+                index._merge_pending()
+        return index.read_range(begin, end)
 
     """
     # optional: Create index on specific column
     """
 
-    def create_index(self, column_number, page_tye="Base"):
+    def create_index(self, column_number, page_tye="Base", workers=None, kind="ordered"):
+        # kind: "ordered" (sorted key array + dict, ranges) or "hash" (HashIndex, equality only)
         # print("creat index begin")
         if self.indices[column_number]:
             raise ValueError(f"Key {column_number} already has a index")
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index kind: {kind}")
         
-        # use OrderedDict for index
-        self.indices[column_number] = OrderedDictList()
+        # built aside, the column only gets an index once the build has finished
+        index = INDEX_TYPES[kind]()
+
+        # large tables are read by worker processes (Config.INDEX_BUILD_WORKERS), in this thread when
+        # the pool cannot run them
+        workers = self._build_workers(workers)
+        if workers > 1:
+            try:
+                self._build_parallel(index, column_number, workers)
+            except BrokenProcessPool:
+                index = INDEX_TYPES[kind]()
+                workers = 1
+        if workers <= 1:
+            self._build_serial(index, column_number, page_tye)
+        self.indices[column_number] = index
 
-        # get column value and rid from table (return nothing)
-        res = list(self.table.col_iterator(column_number))
+    def _build_serial(self, index, column_number, page_tye):
+        # get column value and rid from table (return nothing), updated records under their current value
+        res = list(self.table.col_iterator(column_number, latest=True))
         # print(res)
         res.sort(key = lambda res: res[0])
         
-        # insert rid and value into dict
+        # insert rid and value into dict, deleted records (rid -1) are left out
         for rid, value in res:
-            self.indices[column_number].add(value, rid, page_tye)
+            if rid == -1:
+                continue
+            index.add(value, rid, page_tye)
 
         # insert tail rid and tail value into dict 
         if(self.table.page_directory.num_tail_records != 0):
@@ -150,11 +620,50 @@ class Index:
             res.sort(key = lambda res: res[0])
 
             for rid, value in res:
-                self.indices[column_number].add(value, rid, "Tail")
+                if rid == -1:
+                    continue
+                index.add(value, rid, "Tail")
         
         # print("creat index begin end")
         # print(self.indices)
 
+    def _build_workers(self, workers):
+        # worker processes for a build, 1 (build in this thread) unless Config.INDEX_BUILD_WORKERS opts
+        # in and the table is large
+        if workers is None:
+            if Config.INDEX_BUILD_WORKERS == 1:
+                return 1
+            page_range = self.table.page_directory
+            num_pages = math.ceil(max(page_range.num_base_records, page_range.num_tail_records) / Config.PAGE_CAPACITY)
+            if num_pages < Config.INDEX_BUILD_MIN_PAGES:
+                return 1
+            workers = Config.INDEX_BUILD_WORKERS or os.cpu_count() or 1
+        # the workers import the main module, one that runs code outside of an if __name__ == "__main__"
+        # guard would run it again in each of them
+        if workers > 1 and not _main_guarded():
+            return 1
+        return workers
+
+    def _build_parallel(self, index, column_number, workers):
+        # Each worker reads the rid column and the indexed column of a run of pages straight from the
+        # page files and returns its (value, rid) pairs sorted, the runs are merged in key order here.
+        page_range = self.table.page_directory
+        # the workers only see the disk, dirty pages are written first (retired tail pages are left
+        # to the next checkpoint, reclaiming them is not this build's business)
+        page_range.write_dirty_pages()
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_build_context()) as pool:
+            for page_type, num_records in (("Base", page_range.num_base_records), ("Tail", page_range.num_tail_records)):
+                num_pages = math.ceil(num_records / Config.PAGE_CAPACITY)
+                # a few runs per worker, so one slow run does not hold up the others
+                run_pages = max(1, math.ceil(num_pages / (workers * 4)))
+                tasks = [
+                    (self.table.table_path, self.table.storage_engine, page_type, column_number, first, min(first + run_pages, num_pages), num_records)
+                    for first in range(0, num_pages, run_pages)
+                ]
+                runs = list(pool.map(_build_run, tasks))
+                index.add_sorted(_merge_runs(runs), page_type)
+
     """
     # optional: Drop index of specific column
     """
@@ -167,39 +676,159 @@ class Index:
         rids = self.locate(self.table.key, primary_key)
         # print(rids)
         
-        base_rids = rids[0]
-        tail_rids = rids[1]
+        base_rids, tail_rids = rids
 
-        if len(base_rids) != 0:
+        index = self.indices[self.table.key]
+        with self._lock_for(index):
             for rid in base_rids:
-                self.indices[self.table.key].data[primary_key][0].remove(rid)
+                index.remove_rid(primary_key, rid, "Base")
         
-        # Yanliang's Modification here: Fix typo of tail_rids here
-        if len(tail_rids) != 0:
+            # Yanliang's Modification here: Fix typo of tail_rids here
             for rid in tail_rids:
-                self.indices[self.table.key].data[primary_key][1].remove(rid)
+                index.remove_rid(primary_key, rid, "Tail")
         
         return True
     
     def insert_value(self, columns, rid, page_tye):
-        with self.lock:
-            for col_idx, col_value in enumerate(columns):
-                if self.indices[col_idx] != None:
-                    # print(col_idx, col_value, rid)
-                    self.indices[col_idx].add(col_value, rid, page_tye)
-            return True
+        for col_idx, col_value in enumerate(columns):
+            index = self.indices[col_idx]
+            if index != None:
+                # print(col_idx, col_value, rid)
+                with self._lock_for(index):
+                    index.add(col_value, rid, page_tye)
+        return True
     
     def update_index(self, column_number, key, value, page_tye):
-        with self.lock:
-            self.indices[column_number].add(key, value, page_tye)
+        index = self.indices[column_number]
+        with self._lock_for(index):
+            index.add(key, value, page_tye)
             
             
+    def move_value(self, column_number, old_value, new_value, rid):
+        """
+        Re-point a base rid from old_value to new_value in the index on column_number (an update).
+        """
+        index = self.indices[column_number]
+        if index is not None:
+            with self._lock_for(index):
+                index.remove_rid(old_value, rid, "Base")
+                index.add(new_value, rid, "Base")
+
     def remove_from_index(self, rid, columns):
         """
         Remove the given rid from the index for the specified columns.
         """
-        with self.lock:
-            for col_idx, col_value in enumerate(columns):
-                if self.indices[col_idx] != None:
-                    self.indices[col_idx].remove_rid(col_value, rid)
-            return True
+        for col_idx, col_value in enumerate(columns):
+            index = self.indices[col_idx]
+            if index != None:
+                with self._lock_for(index):
+                    index.remove_rid(col_value, rid)
+        return True
+
+def _main_guarded():
+    # True when importing the main module again (as the spawned workers do) only defines things: every
+    # top level statement is an import, a def or class, an assignment without calls, a docstring, or
+    # the if __name__ == "__main__" block. No main file (interactive) is nothing to import.
+    main_path = getattr(sys.modules.get("__main__"), "__file__", None)
+    if main_path is None:
+        return True
+    return _source_guarded(os.path.abspath(main_path))
+
+@functools.lru_cache(maxsize=None)
+def _source_guarded(path):
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return False
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+            continue
+        if isinstance(node, (ast.Assign, ast.AnnAssign)):
+            if not any(isinstance(child, ast.Call) for child in ast.walk(node)):
+                continue
+            return False
+        if isinstance(node, ast.If) and _is_main_guard(node.test):
+            continue
+        return False
+    return True
+
+def _is_main_guard(test):
+    # __name__ == "__main__", either way round
+    if not (isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq)):
+        return False
+    sides = [test.left, test.comparators[0]]
+    return (
+        any(isinstance(side, ast.Name) and side.id == "__name__" for side in sides)
+        and any(isinstance(side, ast.Constant) and side.value == "__main__" for side in sides)
+    )
+
+def _build_context():
+    # Workers must not be forked: the merge, flusher and WAL threads may hold locks at that moment,
+    # a forked child would inherit them locked. A fork server (a new process, started once)
+    # with only this module loaded hands out the workers, spawn where there is none. Like any
+    # spawned process the workers import the main module, the build stays in the calling thread
+    # when that would run more than definitions (_main_guarded).
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["lstore.index"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+def _build_run(task):
+    # worker process: values and rids of pages [first_page, end_page) sorted by (value, rid) as two
+    # int64 arrays (bytes pickle cheaply), deleted records left out
+    table_path, storage_engine, page_type, column_number, first_page, end_page, num_records = task
+    storage = open_storage(table_path, storage_engine)
+    values = array('q')
+    rids = array('q')
+    try:
+        indirections = array('q')
+        tps = array('q')
+        for page_idx in range(first_page, end_page):
+            rid_data = storage.read(page_type, Config.RID_COLUMN, page_idx)
+            value_data = storage.read(page_type, Config.USER_COLUMN_START + column_number, page_idx)
+            if rid_data is None or value_data is None:
+                continue
+            n = min(Config.PAGE_CAPACITY, num_records - page_idx * Config.PAGE_CAPACITY)
+            rids.frombytes(memoryview(rid_data)[:n * 8])
+            values.frombytes(memoryview(value_data)[:n * 8])
+            if page_type == "Base":
+                indirections.frombytes(memoryview(storage.read(page_type, Config.INDIRECTION_COLUMN, page_idx))[:n * 8])
+                tps.frombytes(memoryview(storage.read(page_type, Config.BASE_RID_COLUMN, page_idx))[:n * 8])
+
+        # updated base records are indexed under the value of their newest tail record, unless a merge
+        # folded it into the base record (up to its TPS)
+        tail_pages = {}
+        for i, indirection in enumerate(indirections):
+            if indirection > tps[i] and rids[i] != -1:
+                tail_page_idx, tail_record_idx = divmod(indirection, Config.PAGE_CAPACITY)
+                if tail_page_idx not in tail_pages:
+                    tail_pages[tail_page_idx] = memoryview(bytes(storage.read("Tail", Config.USER_COLUMN_START + column_number, tail_page_idx))).cast('q')
+                values[i] = tail_pages[tail_page_idx][tail_record_idx]
+    finally:
+        storage.close()
+
+    if np is not None and Config.USE_NUMPY:
+        values = np.frombuffer(values, dtype=np.int64)
+        rids = np.frombuffer(rids, dtype=np.int64)
+        live = rids != -1
+        values, rids = values[live], rids[live]
+        # rids grow with the page index, a stable sort on the value keeps them ascending per value
+        order = np.argsort(values, kind="stable")
+        return values[order].tobytes(), rids[order].tobytes()
+
+    run = sorted((value, rid) for value, rid in zip(values, rids) if rid != -1)
+    return array('q', [value for value, _ in run]).tobytes(), array('q', [rid for _, rid in run]).tobytes()
+
+def _merge_runs(runs):
+    # (value, rid) pairs of all runs in (value, rid) order
+    if np is not None and Config.USE_NUMPY:
+        values = np.frombuffer(b"".join(run[0] for run in runs), dtype=np.int64)
+        rids = np.frombuffer(b"".join(run[1] for run in runs), dtype=np.int64)
+        # the runs are in page order, a stable sort merges them without reordering equal values
+        order = np.argsort(values, kind="stable")
+        return zip(values[order].tolist(), rids[order].tolist())
+    return heapq.merge(*[zip(array('q', run[0]), array('q', run[1])) for run in runs])
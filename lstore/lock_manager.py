@@ -63,6 +63,11 @@ class LockManager:
                     # EXCLUSIVE lock has already been assigned to other resource
                     return False
     
+    def exclusive_lock_ids(self):
+        # ids locked exclusively right now (by transactions that have not ended)
+        with self.lock:
+            return {lock_id for lock_id, lock_info in self.locks.items() if lock_info['type'] == LockType.EXCLUSIVE}
+
     def release_lock(self, lock_id, transaction_id):
         # Release a specific lock
         with self.lock:
@@ -0,0 +1,94 @@
+import math
+import threading
+import traceback
+from time import perf_counter
+from lstore.config import Config
+
+class MergeScheduler:
+    # Background thread that merges the tail records of a table's page range into its base pages once
+    # that pays off. Every `poll` seconds it looks at the tail pages past the merge watermark and at the
+    # version reads since its last look:
+    #   - fewer than min_tail_pages new tail pages: nothing to gain yet
+    #   - max_tail_pages or more: merge, whatever the reads look like
+    #   - otherwise merge when reads walk long tail chains (tail records read per updated record read
+    #     >= chain_length) or read too many records (records read per base record >= read_amplification)
+    # Under write-heavy load (more than backoff_writes new tail records per second) the decision is
+    # postponed, the wait doubling up to backoff_max seconds, so merges leave the GIL to the writers.
+    def __init__(self, table, poll=None, min_tail_pages=None, max_tail_pages=None, chain_length=None,
+                 read_amplification=None, backoff_writes=None, backoff_max=None):
+        self.table = table
+        self.poll = poll or Config.MERGE_POLL
+        self.min_tail_pages = Config.MERGE_MIN_TAIL_PAGES if min_tail_pages is None else min_tail_pages
+        self.max_tail_pages = max_tail_pages or Config.MERGE_MAX_TAIL_PAGES
+        self.chain_length = chain_length or Config.MERGE_CHAIN_LENGTH
+        self.read_amplification = read_amplification or Config.MERGE_READ_AMPLIFICATION
+        self.backoff_writes = backoff_writes or Config.MERGE_BACKOFF_WRITES
+        self.backoff_max = backoff_max or Config.MERGE_BACKOFF_MAX
+        self.thread = None
+        self.stopped = threading.Event()
+
+        # seconds until the next check, grows while backing off
+        self.delay = self.poll
+        # counters as of the last check
+        self.last_reads = dict(table.page_directory.get_read_stats())
+        self.last_tail_records = table.page_directory.num_tail_records
+        self.last_check = perf_counter()
+
+        self.stats = {"checks": 0, "merges": 0, "backoffs": 0, "last_reason": None}
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def check(self):
+        # why the table should be merged now ("tail pages", "chain length", "read amplification"),
+        # None if not; also sets the delay until the next check
+        page_directory = self.table.page_directory
+        reads = page_directory.get_read_stats()
+        tail_records = page_directory.num_tail_records
+        now = perf_counter()
+
+        # activity since the last check
+        delta = {name: max(reads[name] - self.last_reads.get(name, 0), 0) for name in reads}
+        written = max(tail_records - self.last_tail_records, 0)
+        elapsed = max(now - self.last_check, 1e-6)
+        self.last_reads, self.last_tail_records, self.last_check = dict(reads), tail_records, now
+        self.stats["checks"] += 1
+
+        pending_pages = math.ceil((tail_records - page_directory.merged_tail_records) / Config.PAGE_CAPACITY)
+        reason = None
+        if pending_pages >= self.max_tail_pages:
+            reason = "tail pages"
+        elif pending_pages >= max(self.min_tail_pages, 1):
+            if written / elapsed >= self.backoff_writes:
+                self.delay = min(self.delay * 2, self.backoff_max)
+                self.stats["backoffs"] += 1
+                return None
+            if delta["chains"] and delta["tail_reads"] / delta["chains"] >= self.chain_length:
+                reason = "chain length"
+            elif delta["base_reads"] and (delta["base_reads"] + delta["tail_reads"]) / delta["base_reads"] >= self.read_amplification:
+                reason = "read amplification"
+
+        self.delay = self.poll
+        return reason
+
+    def __run(self):
+        while not self.stopped.wait(self.delay):
+            reason = self.check()
+            if reason is None:
+                continue
+            try:
+                self.table.merge()
+                self.stats["merges"] += 1
+                self.stats["last_reason"] = reason
+            except Exception as e:
+                print(f"Merge error: {e}")
+                traceback.print_exc()
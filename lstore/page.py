@@ -1,6 +1,12 @@
 # BasePage is only a container in physical view
+from array import array
 from lstore.config import Config
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class Page:
     # Page has a fixed size of 4096 bytes
     # All columns are 64-bit integers
@@ -14,6 +20,37 @@ class Page:
         # Considering set the first 8 bytes as header within the file
         # self.max_items = 4096 // 8
         self.max_items = Config.PAGE_CAPACITY
+        # set by every modification, cleared once the page is written back (a new page is not on disk yet)
+        self.dirty = True
+        # data is a slice of a memory-mapped file (attach_data), copied before the first modification
+        self.attached = False
+        self._bind_views()
+
+    def _bind_views(self):
+        # int64 views over self.data, cells share memory with the byte buffer
+        # memoryview uses native byte order, which is little-endian on every host we run on
+        self.cells = memoryview(self.data).cast('q')
+        self._array = None
+
+    @property
+    def array(self):
+        # NumPy int64 view over the same buffer, built on first batch access
+        if self._array is None and np is not None and Config.USE_NUMPY:
+            self._array = np.frombuffer(self.data, dtype='<i8')
+        return self._array
+
+    def __getstate__(self):
+        # views cannot be pickled/deep-copied, rebuild them on the copy instead
+        state = self.__dict__.copy()
+        state['data'] = bytearray(self.data)
+        state['attached'] = False
+        del state['cells']
+        del state['_array']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind_views()
 
     def has_capacity(self):
         return self.num_items < self.max_items
@@ -28,11 +65,11 @@ class Page:
         # Make sure we have space
         if not self.has_capacity():
             return False
+        if self.attached:
+            self._detach()
 
-        offset = self.num_items * 8
-
-        value_bytes = value.to_bytes(8, byteorder="little", signed=True)
-        self.data[offset : offset + 8] = value_bytes
+        self.cells[self.num_items] = value
+        self.dirty = True
 
         self.num_items += 1
         return True
@@ -40,19 +77,63 @@ class Page:
     def read(self, index):
         if index < 0 or index >= self.num_items:
             return None
-        offset = index * 8
-        return int.from_bytes(
-            self.data[offset:offset + 8],
-            byteorder='little',
-            signed=True
-        )
+        return self.cells[index]
         
     def update(self, index, value):
         if index < 0 or index >= self.num_items:
             return False
-        offset = index * 8
-        value_bytes = value.to_bytes(8, byteorder='little', signed=True)
-        self.data[offset:offset + 8] = value_bytes
+        if self.attached:
+            self._detach()
+        self.cells[index] = value
+        self.dirty = True
+        return True
+
+    # Batch helper functions, operate on whole column slices
+    def column_slice(self, start=0, stop=None):
+        # zero-copy slice: ndarray when NumPy is enabled, memoryview otherwise
+        stop = self.num_items if stop is None else min(stop, self.num_items)
+        if self.array is not None:
+            return self.array[start:stop]
+        return self.cells[start:stop]
+
+    def read_batch(self, start=0, stop=None):
+        # values in [start, stop) as a list of python ints
+        return self.column_slice(start, stop).tolist()
+
+    def write_batch(self, values):
+        # append as many values as fit, return how many were written
+        n = min(len(values), self.max_items - self.num_items)
+        if n <= 0:
+            return 0
+        if self.attached:
+            self._detach()
+        start = self.num_items
+        if self.array is not None:
+            self.array[start:start + n] = values[:n]
+        else:
+            self.cells[start:start + n] = array('q', values[:n])
+        self.dirty = True
+        self.num_items += n
+        return n
+
+    def gather(self, indices):
+        # values at the given record indices as a list of python ints
+        if self.array is not None:
+            return self.array[np.asarray(indices, dtype=np.int64)].tolist()
+        cells = self.cells
+        return [cells[i] for i in indices]
+
+    def scatter(self, indices, values):
+        # overwrite the given record indices, every index must already be written
+        if self.attached:
+            self._detach()
+        self.dirty = True
+        if self.array is not None:
+            self.array[np.asarray(indices, dtype=np.int64)] = values
+            return True
+        cells = self.cells
+        for i, value in zip(indices, values):
+            cells[i] = value
         return True
     
     # Persistence helper functions for read and write raw bytearray
@@ -60,8 +141,35 @@ class Page:
         return self.data
     
     def set_data(self, data, num_items):
+        # data comes from disk, so the page starts clean
         self.data = bytearray(data)
         self.num_items = num_items
+        self.dirty = False
+        self.attached = False
+        self._bind_views()
+
+    def attach_data(self, buffer, num_items):
+        # use a buffer (e.g. a slice of a memory-mapped file) without copying it, for reads only: the
+        # first modification copies it (_detach), so changes reach the file through the normal write
+        # back, after the log records they depend on
+        self.data = buffer
+        self.num_items = num_items
+        self.dirty = False
+        self.attached = True
+        self._bind_views()
+
+    def _detach(self):
+        self.data = bytearray(self.data)
+        self.attached = False
+        self._bind_views()
+
+    def copy(self):
+        # standalone page with the same values (dirty, it replaces this one), cheaper than copy.deepcopy
+        page = Page()
+        page.data[:] = self.data
+        page.num_items = self.num_items
+        page.max_items = self.max_items
+        return page
         
 
     
@@ -69,10 +177,11 @@ class Page:
 # Notice: We also import metadata columns from L-store design
 class BasePage():
     # Only write when insert new records
-    def __init__(self, num_columns):
+    def __init__(self, num_columns, allocate=True):
         self.num_columns = num_columns
         
-        self.physical_pages = [Page() for _ in range(Config.USER_COLUMN_START + num_columns)]
+        # allocate=False leaves every column unloaded (None) until it is read from disk
+        self.physical_pages = [Page() if allocate else None for _ in range(Config.USER_COLUMN_START + num_columns)]
         self.num_records = 0
         
     def has_capacity(self):
@@ -95,21 +204,49 @@ class BasePage():
         self.num_records += 1
         return True
     
+    def missing_columns(self, column_indices=None):
+        # columns among column_indices (all if None) that are not loaded yet
+        if column_indices is None:
+            column_indices = range(len(self.physical_pages))
+        return [c for c in column_indices if self.physical_pages[c] is None]
+    
+    def read_column(self, column_index, start=0, stop=None):
+        # whole column slice of this page as a list of python ints
+        if column_index >= len(self.physical_pages):
+            return None
+        return self.physical_pages[column_index].read_batch(start, stop)
+    
+    def gather_column(self, column_index, record_indices):
+        if column_index >= len(self.physical_pages):
+            return None
+        return self.physical_pages[column_index].gather(record_indices)
+    
     # Persistence helper functions for BasePage
     def get_a_page(self, column_index):
         if column_index >= len(self.physical_pages):
             return None
         return self.physical_pages[column_index]
     
+    def set_a_page(self, column_index, physical_page):
+        if column_index >= len(self.physical_pages):
+            return False
+        self.physical_pages[column_index] = physical_page
+        self.num_records = physical_page.num_items
+        return True
+
     def get_page_data(self, column_index):
         if column_index >= len(self.physical_pages):
             return None
+        if self.physical_pages[column_index] is None:
+            return None
         return self.physical_pages[column_index].get_data()
     
     def set_page_data(self, column_index, data, num_records):
         if column_index >= len(self.physical_pages):
             return False
         
+        if self.physical_pages[column_index] is None:
+            self.physical_pages[column_index] = Page()
         self.physical_pages[column_index].set_data(data, num_records)
         # Align num of records with the first column
         # if column_index == 0:
@@ -118,16 +255,27 @@ class BasePage():
         return True
     
     
+    def attach_page_data(self, column_index, buffer, num_records):
+        if column_index >= len(self.physical_pages):
+            return False
+        
+        if self.physical_pages[column_index] is None:
+            self.physical_pages[column_index] = Page()
+        self.physical_pages[column_index].attach_data(buffer, num_records)
+        self.num_records = num_records
+        return True
+    
     # # Maybe we should define read()
     # def read_record():
     
 
 class TailPage():
     # Only write when update existing records
-    def __init__(self, num_columns):
+    def __init__(self, num_columns, allocate=True):
         self.num_columns = num_columns
             
-        self.physical_pages = [Page() for _ in range(Config.USER_COLUMN_START + num_columns)]
+        # allocate=False leaves every column unloaded (None) until it is read from disk
+        self.physical_pages = [Page() if allocate else None for _ in range(Config.USER_COLUMN_START + num_columns)]
         self.num_records = 0
         
     def has_capacity(self):
@@ -150,21 +298,49 @@ class TailPage():
         self.num_records += 1
         return True
     
+    def missing_columns(self, column_indices=None):
+        # columns among column_indices (all if None) that are not loaded yet
+        if column_indices is None:
+            column_indices = range(len(self.physical_pages))
+        return [c for c in column_indices if self.physical_pages[c] is None]
+    
+    def read_column(self, column_index, start=0, stop=None):
+        # whole column slice of this page as a list of python ints
+        if column_index >= len(self.physical_pages):
+            return None
+        return self.physical_pages[column_index].read_batch(start, stop)
+    
+    def gather_column(self, column_index, record_indices):
+        if column_index >= len(self.physical_pages):
+            return None
+        return self.physical_pages[column_index].gather(record_indices)
+    
     # Persistence helper functions for TailPage
     def get_a_page(self, column_index):
         if column_index >= len(self.physical_pages):
             return None
         return self.physical_pages[column_index]
 
+    def set_a_page(self, column_index, physical_page):
+        if column_index >= len(self.physical_pages):
+            return False
+        self.physical_pages[column_index] = physical_page
+        self.num_records = physical_page.num_items
+        return True
+
     def get_page_data(self, column_index):
         if column_index >= len(self.physical_pages):
             return None
+        if self.physical_pages[column_index] is None:
+            return None
         return self.physical_pages[column_index].get_data()
     
     def set_page_data(self, column_index, data, num_records):
         if column_index >= len(self.physical_pages):
             return False
         
+        if self.physical_pages[column_index] is None:
+            self.physical_pages[column_index] = Page()
         self.physical_pages[column_index].set_data(data, num_records)
         # Align num of records with the first column
         # if column_index == 0:
@@ -172,6 +348,16 @@ class TailPage():
         self.num_records = num_records
         return True
     
+    def attach_page_data(self, column_index, buffer, num_records):
+        if column_index >= len(self.physical_pages):
+            return False
+        
+        if self.physical_pages[column_index] is None:
+            self.physical_pages[column_index] = Page()
+        self.physical_pages[column_index].attach_data(buffer, num_records)
+        self.num_records = num_records
+        return True
+    
     # # Maybe we should define read()
     # def read_record():
 
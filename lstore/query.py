@@ -76,7 +76,14 @@ class Query:
             }
             )
         
-        self.table.delete(primary_key)
+        # write-ahead: logged before the pages change
+        with self.table.logged_change():
+            if self.table.wal is not None:
+                self.table.wal.log_delete(self.table.name, transaction.transaction_id if transaction else None, rid)
+            self.table.delete(primary_key)
+        # final outside of a transaction, Transaction.commit retires the chain otherwise
+        if transaction is None:
+            self.table.retire_deleted(rid)
         return True
     
     
@@ -99,8 +106,15 @@ class Query:
         # new_rid = self.table.page_directory.num_base_records
         new_timestamp = int(datetime.now().timestamp())
         
+        # write-ahead: the record is logged once its rid is allocated, before it is written
+        log = None
+        if self.table.wal is not None:
+            txn = transaction.transaction_id if transaction else None
+            log = lambda rid: self.table.wal.log_insert(self.table.name, txn, rid, new_timestamp, columns)
+
         # Allocate rid atomically and insert under lock protection
-        result = self.table.page_directory.insert_base_record_with_rid_alloc(new_timestamp, columns)
+        with self.table.logged_change():
+            result = self.table.page_directory.insert_base_record_with_rid_alloc(new_timestamp, columns, log)
         if result is None:
             return False
         
@@ -169,19 +183,28 @@ class Query:
                 if not lock_acquired:
                     return False
 
+        # Only read the projected columns plus the search column used for filtering
+        read_columns = list(projected_columns_index)
+        read_columns[search_key_index] = 1
+
         records_list = []
+        # base records read, those with a tail chain, and tail records read, for the merge scheduler
+        base_reads = chains = tail_reads = 0
         for rid in selected_rids:
             page_idx = rid // Config.PAGE_CAPACITY
             record_idx = rid % Config.PAGE_CAPACITY
 
-            # Read base record to get initial values for all columns
-            base_record = self.table.page_directory.read_base_record(page_idx, record_idx)
+            # Read base record to get initial values for the columns we need
+            base_record = self.table.page_directory.read_base_record(page_idx, record_idx, read_columns)
             if base_record is None:
                 continue
+            base_reads += 1
 
             # Start with base record columns
             result_columns = base_record['columns'].copy()
-            indirection = base_record['indirection']
+            # tail records up to the TPS are merged into the base record, chains are followed down to it
+            # for the latest version; older ones are read from the whole chain
+            indirection = base_record['indirection'] if relative_version == 0 else base_record['last_tail']
 
             # Apply updates based on relative_version
             if indirection != -1:
@@ -191,43 +214,36 @@ class Query:
                     tail_chain = []
                     current_tail_rid = indirection
 
-                    while current_tail_rid != -1:
+                    while current_tail_rid > base_record['tps']:
                         tail_page_idx = current_tail_rid // Config.PAGE_CAPACITY
                         tail_record_idx = current_tail_rid % Config.PAGE_CAPACITY
-                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx)
+                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx, read_columns)
 
                         if tail_record is None:
                             break
 
                         tail_chain.append(tail_record)
                         current_tail_rid = tail_record['indirection']
+                    chains += 1
+                    tail_reads += len(tail_chain)
 
                     # Apply updates from oldest to newest (reverse order)
                     for tail_record in reversed(tail_chain):
                         schema = tail_record['schema_encoding']
                         for col_idx in range(len(result_columns)):
                             # Check if this column was updated in this tail record
-                            if (schema >> col_idx) & 1:
+                            if read_columns[col_idx] and (schema >> col_idx) & 1:
                                 result_columns[col_idx] = tail_record['columns'][col_idx]
 
                 elif relative_version < 0:
                     # Negative version: Apply updates up to a certain depth
                     depth = abs(relative_version)
 
-                    # Collect tail chain
-                    tail_chain = []
-                    current_tail_rid = indirection
-
-                    while current_tail_rid != -1:
-                        tail_page_idx = current_tail_rid // Config.PAGE_CAPACITY
-                        tail_record_idx = current_tail_rid % Config.PAGE_CAPACITY
-                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx)
-
-                        if tail_record is None:
-                            break
-
-                        tail_chain.append(tail_record)
-                        current_tail_rid = tail_record['indirection']
+                    # Collect tail chain, applied to the record as inserted (the base record may hold
+                    # merged values)
+                    tail_chain, result_columns = self.table.version_chain(base_record, read_columns)
+                    chains += 1
+                    tail_reads += len(tail_chain)
 
                     # tail_chain is ordered from newest to oldest
                     if depth < len(tail_chain):
@@ -239,7 +255,7 @@ class Query:
                         for tail_record in reversed(updates_to_apply):
                             schema = tail_record['schema_encoding']
                             for col_idx in range(len(result_columns)):
-                                if (schema >> col_idx) & 1:
+                                if read_columns[col_idx] and (schema >> col_idx) & 1:
                                     result_columns[col_idx] = tail_record['columns'][col_idx]
 
             # Project columns based on projected_columns_index
@@ -249,10 +265,11 @@ class Query:
                     res_col.append(result_columns[col_idx])
 
             # Filter by search key
-            if res_col[search_key_index] == search_key:
+            if result_columns[search_key_index] == search_key:
                 record_obj = Record(rid, self.table.key, res_col)
                 records_list.append(record_obj)
 
+        self.table.page_directory.record_version_reads(base_reads, chains, tail_reads)
         return records_list
 
     
@@ -292,18 +309,22 @@ class Query:
         base_record = self.table.page_directory.read_base_record(base_page_idx, base_record_idx)
         base_indirection = base_record['indirection']
         base_schema = base_record['schema_encoding']
-        base_rid = base_record['base_rid']
+        # the new tail record goes on from the newest one, merged or not, older versions stay reachable
+        last_tail = base_record['last_tail']
         
         # record logs
+        rollback_data = {
+            'rid': rid,
+            'old_indirection': last_tail,
+            'old_primary_key': primary_key if update_primary_key != primary_key else None,  # 新增
+            # indexed columns the update moves the rid between values of, filled in below
+            'index_changes': []
+        }
         if transaction is not None:
             transaction.log_operation(
                 table=self.table,
                 op_type='update',
-                rollback_data={
-                    'rid': rid,
-                    'old_indirection': base_indirection,
-                    'old_primary_key': primary_key if update_primary_key != primary_key else None  # 新增
-                }
+                rollback_data=rollback_data
             )
 
         updated_columns = base_record['columns'].copy()
@@ -331,42 +352,58 @@ class Query:
                     if ((base_schema >> i) & 1):
                         updated_columns[i] = latest_columns[i]
         
+        # latest values, before this update
+        old_columns = updated_columns.copy()
+
         updated_schema = base_schema
         for i in range(len(columns)):
             if columns[i] is not None:
                 updated_columns[i] = columns[i]
                 updated_schema = (updated_schema | (1 << i))
 
-        updated_indirection = base_indirection
+        updated_indirection = last_tail
         updated_timestamp = int(datetime.now().timestamp())
-        updated_base_rid = base_rid
-        
-        # create tail record
-        result = self.table.page_directory.append_tail_record_with_rid_alloc(
-            updated_indirection, 
-            updated_timestamp, 
-            updated_schema, 
-            updated_base_rid, 
-            updated_columns
-        )
-        
-        if result is None:
-            return False
+        # the tail record points back at its base record, merge finds it through this
+        updated_base_rid = rid
         
-        updated_rid, tail_page_index, tail_record_index = result
+        # the new values count for the zone map of the base page before they become current
+        self.table.page_directory.widen_zone(base_page_idx, columns)
+
+        # write-ahead: the update is logged once the tail rid is allocated, before the tail record is
+        # written and the base record points at it
+        log = None
+        if self.table.wal is not None:
+            txn = transaction.transaction_id if transaction else None
+            log = lambda tail_rid: self.table.wal.log_update(
+                self.table.name, txn, rid, tail_rid,
+                updated_indirection, updated_timestamp, updated_schema, updated_base_rid, updated_columns, base_schema
+            )
+
+        with self.table.logged_change():
+            # create tail record
+            result = self.table.page_directory.append_tail_record_with_rid_alloc(
+                updated_indirection, 
+                updated_timestamp, 
+                updated_schema, 
+                updated_base_rid, 
+                updated_columns,
+                log
+            )
+            
+            if result is None:
+                return False
+            
+            updated_rid, tail_page_index, tail_record_index = result
 
-        # update base record
-        self.table.page_directory.update_base_indirection(base_page_idx, base_record_idx, updated_rid)
-        self.table.page_directory.update_base_schema_encoding(base_page_idx, base_record_idx, updated_schema)
+            # update base record
+            self.table.page_directory.update_base_indirection(base_page_idx, base_record_idx, updated_rid)
+            self.table.page_directory.update_base_schema_encoding(base_page_idx, base_record_idx, updated_schema)
 
-        # Update index only when the primary key changes
-        if update_primary_key is not None and update_primary_key != primary_key:
-            # Remove old primary key
-            if self.table.index.indices[self.table.key]:
-                self.table.index.indices[self.table.key].remove_rid(primary_key, rid)
-            # Add new primary key
-            if self.table.index.indices[self.table.key]:
-                self.table.index.indices[self.table.key].add(update_primary_key, rid, "Base")
+        # Move the rid to the new value in every index on a changed column (the key and secondary ones)
+        for i, index in enumerate(self.table.index.indices):
+            if index is not None and columns[i] is not None and columns[i] != old_columns[i]:
+                self.table.index.move_value(i, old_columns[i], columns[i], rid)
+                rollback_data['index_changes'].append((i, old_columns[i], columns[i]))
 
         return True
 
@@ -411,6 +448,10 @@ class Query:
                     return False
 
         # print(f"\n range: ({start_range}, {end_range}), sum func. selected_rids: {selected_rids}")
+        # Only the aggregate column is read
+        read_columns = [0] * self.table.num_columns
+        read_columns[aggregate_column_index] = 1
+
         res = 0
         for rid in selected_rids:
             # page and record idx
@@ -418,13 +459,15 @@ class Query:
             record_idx = rid % Config.PAGE_CAPACITY
 
             # Read base record
-            base_record = self.table.page_directory.read_base_record(page_idx, record_idx)
+            base_record = self.table.page_directory.read_base_record(page_idx, record_idx, read_columns)
             if base_record is None:
                 continue
 
             # Start with base value for the aggregate column
             value = base_record['columns'][aggregate_column_index]
-            indirection = base_record['indirection']
+            # tail records up to the TPS are merged into the base record, chains are followed down to it
+            # for the latest version; older ones are read from the whole chain
+            indirection = base_record['indirection'] if relative_version == 0 else base_record['last_tail']
 
             # Apply updates based on relative_version
             if indirection != -1:
@@ -433,10 +476,10 @@ class Query:
                     tail_chain = []
                     current_tail_rid = indirection
 
-                    while current_tail_rid != -1:
+                    while current_tail_rid > base_record['tps']:
                         tail_page_idx = current_tail_rid // Config.PAGE_CAPACITY
                         tail_record_idx = current_tail_rid % Config.PAGE_CAPACITY
-                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx)
+                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx, read_columns)
 
                         if tail_record is None:
                             break
@@ -456,20 +499,10 @@ class Query:
                     # Version -1 means skip the latest 1 update
                     depth = abs(relative_version)
 
-                    # Collect tail chain
-                    tail_chain = []
-                    current_tail_rid = indirection
-
-                    while current_tail_rid != -1:
-                        tail_page_idx = current_tail_rid // Config.PAGE_CAPACITY
-                        tail_record_idx = current_tail_rid % Config.PAGE_CAPACITY
-                        tail_record = self.table.page_directory.read_tail_record(tail_page_idx, tail_record_idx)
-
-                        if tail_record is None:
-                            break
-
-                        tail_chain.append(tail_record)
-                        current_tail_rid = tail_record['indirection']
+                    # Collect tail chain, applied to the record as inserted (the base record may hold
+                    # merged values)
+                    tail_chain, columns = self.table.version_chain(base_record, read_columns)
+                    value = columns[aggregate_column_index]
 
                     # Apply updates if within the tail chain
                     # Skip the latest 'depth' updates
@@ -0,0 +1,130 @@
+"""
+Crash recovery, run by Database.open before any table is used.
+
+Everything logged before the checkpoint LSN in db_meta.json is already in the page files
+(Database.checkpoint / close note the LSN, write the pages and the table counts, then log a
+checkpoint record). Checkpoints are fuzzy, pages may also hold changes logged after that LSN,
+replaying them again leaves the same values. For the records from the checkpoint LSN on:
+
+    redo   repeat history: every insert / update / delete (and snapshot, written by a merge) is
+           applied to its base and tail pages again, committed or not, so the pages match the log
+           exactly; the rollback of an aborted transaction is repeated where its abort record is,
+           before the changes logged after it
+    undo   the changes of transactions with neither a commit nor an abort record are rolled back,
+           newest first, the way Table.rollback_* does it (uncommitted tail records are invalidated)
+
+Table counts (num_base_records / num_tail_records) grow to cover every logged rid, indexes are
+rebuilt from the recovered pages, and Database.checkpoint persists the result and logs a new checkpoint.
+"""
+
+import json
+from lstore.config import Config
+from lstore.index import Index
+from lstore.table import snapshot_link
+
+DATA_OPS = ("insert", "update", "delete", "snapshot")
+
+def recover(db):
+    # returns {"redone": n, "undone": n, "aborted": n, "tables": [...]}, None when there was nothing to
+    # replay (aborted: transactions whose rollback was repeated)
+    if db.wal is None:
+        return None
+
+    with open(db._meta_path(), "r") as f:
+        meta = json.load(f)
+
+    records = []
+    for _, record in db.wal.records(meta.get("checkpoint_lsn", 0)):
+        if record["op"] != "checkpoint":
+            records.append(record)
+        elif "lsn" not in record:
+            # checkpoint of a log written before checkpoint LSNs were kept in the metadata
+            records = []
+
+    committed = {record["txn"] for record in records if record["op"] == "commit"}
+    records = [record for record in records if record["op"] in DATA_OPS or record["op"] == "abort"]
+    if not records:
+        return None
+
+    # records of tables that were dropped since are skipped
+    tables = {}
+    for name in {record["table"] for record in records if record["op"] != "abort"}:
+        if name in meta.get("tables", {}):
+            tables[name] = db.get_table(name)
+    records = [record for record in records if record["op"] == "abort" or record["table"] in tables]
+    if not any(record["op"] != "abort" for record in records):
+        return None
+
+    # changes so far of the transactions that have not ended yet
+    running = {}
+    aborted = 0
+    for record in records:
+        if record["op"] == "abort":
+            # the rollback ran before the abort was logged, and before anyone else got the locks
+            changes = running.pop(record["txn"], [])
+            for change in reversed(changes):
+                _undo(tables[change["table"]].page_directory, change)
+            aborted += bool(changes)
+            continue
+        _redo(tables[record["table"]].page_directory, record)
+        # queries outside of a transaction (txn None) commit on their own
+        if record["txn"] is not None:
+            running.setdefault(record["txn"], []).append(record)
+
+    undone = 0
+    for record in reversed(records):
+        if record["op"] != "abort" and record["txn"] in running and record["txn"] not in committed:
+            _undo(tables[record["table"]].page_directory, record)
+            undone += 1
+
+    for table in tables.values():
+        table.index.discard_saved()
+        table.index = Index(table)
+
+    # write the recovered pages and counts, the checkpoint ends the replayed part
+    db.checkpoint()
+    redone = sum(record["op"] != "abort" for record in records)
+    return {"redone": redone, "undone": undone, "aborted": aborted, "tables": sorted(tables)}
+
+def _redo(page_range, record):
+    rid = record["rid"]
+    if record["op"] == "insert":
+        page_range.write_record_at("Base", rid, [-1, rid, record["ts"], 0, -1] + record["columns"])
+
+    elif record["op"] == "update":
+        columns = [value if value is not None else 0 for value in record["columns"]]
+        page_range.write_record_at("Tail", record["tail_rid"], [
+            record["indirection"], record["tail_rid"], record["ts"], record["schema"], record["base_rid"]
+        ] + columns)
+        page_idx, record_idx = divmod(rid, Config.PAGE_CAPACITY)
+        page_range.update_base_indirection(page_idx, record_idx, record["tail_rid"])
+        page_range.update_base_schema_encoding(page_idx, record_idx, record["schema"])
+
+    elif record["op"] == "delete":
+        page_idx, record_idx = divmod(rid, Config.PAGE_CAPACITY)
+        page_range.set_base_record_value(page_idx, record_idx, Config.RID_COLUMN, -1)
+
+    elif record["op"] == "snapshot":
+        page_range.write_record_at("Tail", record["tail_rid"], [
+            -1, record["tail_rid"], record["ts"], (1 << page_range.num_columns) - 1, -1
+        ] + record["columns"])
+        tail_page_idx, tail_record_idx = divmod(record["link"], Config.PAGE_CAPACITY)
+        page_range.set_tail_record_value(tail_page_idx, tail_record_idx, Config.INDIRECTION_COLUMN, snapshot_link(record["tail_rid"]))
+
+def _undo(page_range, record):
+    rid = record["rid"]
+    page_idx, record_idx = divmod(rid, Config.PAGE_CAPACITY)
+    if record["op"] == "insert":
+        page_range.set_base_record_value(page_idx, record_idx, Config.RID_COLUMN, -1)
+        page_range.update_base_indirection(page_idx, record_idx, -1)
+
+    elif record["op"] == "update":
+        page_range.update_base_indirection(page_idx, record_idx, record["indirection"])
+        page_range.update_base_schema_encoding(page_idx, record_idx, record["old_schema"])
+        tail_page_idx, tail_record_idx = divmod(record["tail_rid"], Config.PAGE_CAPACITY)
+        page_range.set_tail_record_value(tail_page_idx, tail_record_idx, Config.RID_COLUMN, -1)
+        # as Table.rollback_update does, no chain leads to it any more
+        page_range.retire_tail_records([record["tail_rid"]])
+
+    elif record["op"] == "delete":
+        page_range.set_base_record_value(page_idx, record_idx, Config.RID_COLUMN, rid)
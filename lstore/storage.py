@@ -0,0 +1,317 @@
+"""
+Storage backends for physical column pages. A page is addressed by (page_type, column_idx, page_idx)
+and is always Config.PAGE_SIZE bytes.
+
+FilePerPageStorage keeps the original layout, one file per physical page:
+    <table_path>/<column_idx>/<Base|Tail>/<page_idx>
+SegmentStorage packs every page of a table into preallocated segment files with fixed 4 KiB slots:
+    <table_path>/segment_<n>.dat    page slots
+    <table_path>/extent_map.json    (page_type, column_idx, page_idx) -> slot
+MmapSegmentStorage uses the same files but maps the segments into memory, reads hand out memoryview
+slices of the mapping (zero_copy) and flush() msyncs the dirty mapped pages. Pages only read through
+the mapping, they copy it before their first change (Page.attach_data) and are written back like any
+other dirty page, so the write-ahead rule holds.
+
+free() gives up a page that is no longer needed (tail pages reclaimed after a merge): its file is
+deleted, or its slot is recycled for the next page written.
+
+close() flushes and releases the open files and mappings, a storage used again afterwards reopens
+them on demand.
+"""
+
+import os
+import json
+import mmap
+import threading
+from lstore.config import Config
+
+class FilePerPageStorage:
+    # read() returns a private copy of the page bytes
+    zero_copy = False
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        # files written since the last flush() and their directories, fsynced by it
+        self.unsynced = set()
+        self.unsynced_dirs = set()
+        self.lock = threading.Lock()
+
+    def _file_path(self, page_type, column_idx, page_idx):
+        return os.path.join(self.table_path, str(column_idx), page_type, str(page_idx))
+
+    def exists(self, page_type, column_idx, page_idx):
+        return os.path.exists(self._file_path(page_type, column_idx, page_idx))
+
+    def read(self, page_type, column_idx, page_idx):
+        # raw page bytes, None if the page was never written
+        file_path = self._file_path(page_type, column_idx, page_idx)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "rb") as fp:
+            return fp.read()
+
+    def write(self, page_type, column_idx, page_idx, page_data):
+        page_path = os.path.join(self.table_path, str(column_idx), page_type)
+        if not os.path.exists(page_path):
+            os.makedirs(page_path, exist_ok=True)
+
+        file_path = os.path.join(page_path, str(page_idx))
+        with open(file_path, "wb") as fp:
+            fp.write(page_data)
+        with self.lock:
+            self.unsynced.add(file_path)
+            self.unsynced_dirs.add(page_path)
+
+    def free(self, page_type, column_idx, page_idx):
+        # the page is no longer needed, its file is deleted
+        file_path = self._file_path(page_type, column_idx, page_idx)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def flush(self):
+        # the pages written so far are on disk once this returns (checkpoints rely on it before the
+        # log they replace goes), one fsync per file and per directory that got new files
+        with self.lock:
+            files, self.unsynced = self.unsynced, set()
+            dirs, self.unsynced_dirs = self.unsynced_dirs, set()
+        for file_path in files:
+            try:
+                fd = os.open(file_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            except FileNotFoundError:
+                # freed since
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if hasattr(os, "O_DIRECTORY"):
+            for dir_path in dirs:
+                fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self):
+        # no file stays open between calls
+        self.flush()
+
+class SegmentStorage:
+    zero_copy = False
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        if not os.path.exists(table_path):
+            os.makedirs(table_path, exist_ok=True)
+
+        self.slot_size = Config.PAGE_SIZE
+        self.max_slots = Config.SEGMENT_MAX_SLOTS
+        # (page_type, column_idx, page_idx) -> slot
+        self.extents = {}
+        self.num_slots = 0
+        # slots of freed pages, handed out again before the segments grow; a slot is only reused once
+        # the extent map without its old page is on disk (pending_free until then)
+        self.free_slots = []
+        self.pending_free = []
+        # extents changed since the map was last saved, a read-only user (an index build worker) never
+        # writes the map
+        self.map_changed = False
+        # segment number -> [fd, number of preallocated slots]
+        self.segments = {}
+        self.lock = threading.Lock()
+
+        self._load_extent_map()
+
+    def _map_path(self):
+        return os.path.join(self.table_path, "extent_map.json")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.table_path, f"segment_{segment}.dat")
+
+    def _load_extent_map(self):
+        if not os.path.exists(self._map_path()):
+            return
+        with open(self._map_path(), "r") as f:
+            meta = json.load(f)
+        self.num_slots = meta["num_slots"]
+        self.max_slots = meta.get("slots_per_segment", self.max_slots)
+        for page_type, column_idx, page_idx, slot in meta["extents"]:
+            self.extents[(page_type, column_idx, page_idx)] = slot
+        self.free_slots = meta.get("free_slots", [])
+
+    def _segment(self, segment):
+        # open segment file, created on first use
+        if segment not in self.segments:
+            fd = os.open(self._segment_path(segment), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            self.segments[segment] = [fd, os.fstat(fd).st_size // self.slot_size]
+        return self.segments[segment]
+
+    def _locate(self, slot):
+        # segment fd and byte offset of a slot
+        segment, local_slot = divmod(slot, self.max_slots)
+        return self._segment(segment), local_slot * self.slot_size
+
+    def _allocate_slot(self):
+        if self.free_slots:
+            return self.free_slots.pop()
+        slot = self.num_slots
+        self.num_slots += 1
+
+        # grow the segment file ahead of time in chunks of slots
+        seg, _ = self._locate(slot)
+        local_slot = slot % self.max_slots
+        if local_slot >= seg[1]:
+            seg[1] = min(self.max_slots, local_slot + Config.SEGMENT_GROW_SLOTS)
+            os.ftruncate(seg[0], seg[1] * self.slot_size)
+        return slot
+
+    def exists(self, page_type, column_idx, page_idx):
+        return (page_type, column_idx, page_idx) in self.extents
+
+    def read(self, page_type, column_idx, page_idx):
+        with self.lock:
+            slot = self.extents.get((page_type, column_idx, page_idx))
+            if slot is None:
+                return None
+            seg, offset = self._locate(slot)
+            return _pread(seg[0], self.slot_size, offset)
+
+    def write(self, page_type, column_idx, page_idx, page_data):
+        with self.lock:
+            key = (page_type, column_idx, page_idx)
+            slot = self.extents.get(key)
+            if slot is None:
+                slot = self._allocate_slot()
+                self.extents[key] = slot
+                self.map_changed = True
+            seg, offset = self._locate(slot)
+            _pwrite(seg[0], bytes(page_data), offset)
+
+    def free(self, page_type, column_idx, page_idx):
+        # the page is no longer needed, its slot is recycled (the extent map is saved by flush())
+        with self.lock:
+            slot = self.extents.pop((page_type, column_idx, page_idx), None)
+            if slot is not None:
+                self.pending_free.append(slot)
+                self.map_changed = True
+
+    def flush(self):
+        # persist the extent map, the slots it points to are synced first
+        with self.lock:
+            self._sync_segments()
+            if not self.map_changed:
+                return
+
+            meta = {
+                "slot_size": self.slot_size,
+                "num_slots": self.num_slots,
+                "slots_per_segment": self.max_slots,
+                "extents": [[page_type, column_idx, page_idx, slot] for (page_type, column_idx, page_idx), slot in self.extents.items()],
+                "free_slots": self.free_slots + self.pending_free
+            }
+            tmp_path = self._map_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._map_path())
+            self.free_slots += self.pending_free
+            self.pending_free = []
+            self.map_changed = False
+
+    def _sync_segments(self):
+        for seg in self.segments.values():
+            os.fsync(seg[0])
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for seg in self.segments.values():
+                os.close(seg[0])
+            self.segments = {}
+
+class MmapSegmentStorage(SegmentStorage):
+    # read() returns a memoryview into the mapped segment, pages read through it until they change
+    zero_copy = True
+
+    def __init__(self, table_path):
+        super().__init__(table_path)
+        if not os.path.exists(self._map_path()):
+            self.max_slots = Config.MMAP_SEGMENT_SLOTS
+
+    def _segment(self, segment):
+        # segments are created at full (sparse) size and mapped once, the mapping is never resized
+        if segment not in self.segments:
+            fd = os.open(self._segment_path(segment), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            size = self.max_slots * self.slot_size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.segments[segment] = [fd, self.max_slots, mmap.mmap(fd, size)]
+        return self.segments[segment]
+
+    def read(self, page_type, column_idx, page_idx):
+        with self.lock:
+            slot = self.extents.get((page_type, column_idx, page_idx))
+            if slot is None:
+                return None
+            seg, offset = self._locate(slot)
+            return memoryview(seg[2])[offset:offset + self.slot_size]
+
+    def write(self, page_type, column_idx, page_idx, page_data):
+        with self.lock:
+            key = (page_type, column_idx, page_idx)
+            slot = self.extents.get(key)
+            if slot is None:
+                slot = self._allocate_slot()
+                self.extents[key] = slot
+                self.map_changed = True
+            seg, offset = self._locate(slot)
+
+            # pages read through this storage already live in the mapping
+            if isinstance(page_data, memoryview) and page_data.obj is seg[2]:
+                return
+            seg[2][offset:offset + self.slot_size] = page_data
+
+    def _sync_segments(self):
+        # msync dirty mapped pages
+        for seg in self.segments.values():
+            seg[2].flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for fd, _, mapping in self.segments.values():
+                os.close(fd)
+                try:
+                    mapping.close()
+                except BufferError:
+                    # pages still read through it, the mapping goes with the last of them
+                    pass
+            self.segments = {}
+
+# os.pread/os.pwrite are POSIX only, fall back to seek + read/write elsewhere
+_io_lock = threading.Lock()
+
+def _pread(fd, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    with _io_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    with _io_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.write(fd, data)
+
+STORAGE_ENGINES = {
+    "file": FilePerPageStorage,
+    "segment": SegmentStorage,
+    "mmap": MmapSegmentStorage,
+}
+
+def open_storage(table_path, engine=None):
+    engine = engine or Config.STORAGE_ENGINE
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine: {engine}")
+    return STORAGE_ENGINES[engine](table_path)
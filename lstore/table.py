@@ -1,14 +1,21 @@
 from lstore.index import Index
-from time import sleep, time
+from time import sleep, time, perf_counter
 from lstore.page import *
 from lstore.cache_policy import LRUCache
 from lstore.config import Config
 from lstore.lock_manager import LockManager
+from lstore.merge_scheduler import MergeScheduler
+from lstore.storage import open_storage
 from datetime import datetime
+from contextlib import contextmanager, nullcontext
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 import threading
 
 import math
-import copy
 import os
 import struct
 
@@ -32,15 +39,29 @@ class Record:
 # "These invalidated records will be removed during the next merge cycle for the corresponding page range."
 class PageRange:
     # Manage a set of base pages and tail pages
-    def __init__(self, table_path, range_id, num_columns, num_base_records = 0, num_tail_records = 0):
+    def __init__(self, table_path, range_id, num_columns, num_base_records = 0, num_tail_records = 0, storage_engine = None, flusher = None, buffer_pool = None, wal = None, merged_tail_records = 0, dead_tail_records = None):
         self.table_path = table_path
+        # where physical pages live on disk, see lstore/storage.py
+        self.storage = open_storage(table_path, storage_engine)
+
+        # background writer for evicted pages (None: write back synchronously)
+        self.flusher = flusher
+        # write-ahead log, records of a change reach the disk before the pages it changed
+        self.wal = wal
+        # evicted pages queued for the flusher: (page_type, column_idx, page_idx) -> [physical_page, queued count]
+        self.pending_writes = {}
+        self.pending_lock = threading.Lock()
 
         self.range_id = range_id
         self.num_columns = num_columns
                 
-        # LRU cache
-        self.cache_capacity = 1000
-        self.Buffer = LRUCache(self.cache_capacity)
+        # LRU cache, frames come from the database's shared buffer pool when given,
+        # otherwise from a private pool of 1000 record pages worth of physical column pages
+        self.cache_capacity = 1000 * (num_columns + Config.USER_COLUMN_START)
+        self.Buffer = LRUCache(self.cache_capacity, buffer_pool)
+        self.Buffer.owner = self
+        # serializes buffer misses so a page is only loaded once
+        self.load_lock = threading.RLock()
         
         self.current_base_page = None
         self.current_tail_page = None
@@ -49,9 +70,138 @@ class PageRange:
         # self.num_tail_records = 0
         self.num_base_records = num_base_records
         self.num_tail_records = num_tail_records
+        # merge watermark: tail records with a lower rid have been merged into the base pages
+        self.merged_tail_records = merged_tail_records
+
+        # Tail page reclamation: tail page index -> bitmask of the records no version read can reach
+        # any more (their base record was merged and its chain reset, or the update was rolled back),
+        # marking a record twice changes nothing. A page whose records are all dead is retired, dropped
+        # from the buffer, and its files are freed by the first save_to_disk that starts after it (the
+        # merged base pages are on disk by then).
+        self.all_dead = (1 << Config.PAGE_CAPACITY) - 1
+        self.dead_tail_records = {int(page_idx): mask for page_idx, mask in (dead_tail_records or {}).items()}
+        self.retired_tail_pages = {page_idx for page_idx, mask in self.dead_tail_records.items() if mask == self.all_dead}
+        # dead_tail_records and the merge watermark as of the start of the last save, what the table
+        # metadata records: the deaths a merge found and its watermark are saved together
+        self.saved_dead_tail_records = dict(self.dead_tail_records)
+        self.saved_merged_tail_records = merged_tail_records
+        self.reclaim_stats = {"retired_pages": 0, "reclaimed_pages": 0}
+        self.reclaim_lock = threading.Lock()
         
         self.lock = threading.Lock()
+
+        # disk I/O accounting by page type, clean pages are never rewritten (skipped)
+        self.io_stats = {page_type: self._new_io_stats() for page_type in ("Base", "Tail")}
+        self.stats_lock = threading.Lock()
+        # version reads of select_version, what the merge scheduler decides on
+        self.read_stats = {"base_reads": 0, "chains": 0, "tail_reads": 0}
+
+        # Zone maps: base page index -> [min, max] (None: unknown) per user column, bounds on the
+        # current values of the page's records. Inserts, updates and merges widen them, they never
+        # shrink. Kept in memory only, pages of a reopened table get theirs from the first scan.
+        self.zone_maps = {}
+        # base page index -> changes so far, a scan only stores the zone it computed if none came in between
+        self.zone_epochs = {}
+        self.zone_lock = threading.Lock()
         
+    @staticmethod
+    def _new_io_stats():
+        return {
+            "pages_read": 0,
+            "bytes_read": 0,
+            "read_seconds": 0.0,
+            "pages_written": 0,
+            "bytes_written": 0,
+            "write_seconds": 0.0,
+            "pages_skipped": 0,
+            "bytes_skipped": 0,
+        }
+
+    def _count_io(self, page_type, op, num_bytes, seconds=0.0):
+        # op: "read", "written" or "skipped"
+        with self.stats_lock:
+            stats = self.io_stats[page_type]
+            stats["pages_" + op] += 1
+            stats["bytes_" + op] += num_bytes
+            if op == "read":
+                stats["read_seconds"] += seconds
+            elif op == "written":
+                stats["write_seconds"] += seconds
+
+    def get_stats(self):
+        # buffer and disk counters by page type
+        buffer_stats = self.Buffer.get_stats()
+        with self.stats_lock:
+            return {page_type: dict(buffer_stats[page_type], **self.io_stats[page_type]) for page_type in ("Base", "Tail")}
+
+    def reset_stats(self):
+        self.Buffer.reset_stats()
+        with self.stats_lock:
+            for page_type in self.io_stats:
+                self.io_stats[page_type] = self._new_io_stats()
+
+    def record_version_reads(self, base_reads, chains, tail_reads):
+        # one select: base records read, how many of them had a tail chain, tail records read
+        with self.stats_lock:
+            self.read_stats["base_reads"] += base_reads
+            self.read_stats["chains"] += chains
+            self.read_stats["tail_reads"] += tail_reads
+
+    def get_read_stats(self):
+        # totals since the page range was opened, reset_stats leaves them alone (the merge scheduler
+        # works on their differences)
+        with self.stats_lock:
+            return dict(self.read_stats)
+
+    def widen_zone(self, page_index, columns, new_page=False):
+        # values (None: unchanged) a record of base page page_index now has, new_page: its first record
+        with self.zone_lock:
+            self.zone_epochs[page_index] = self.zone_epochs.get(page_index, 0) + 1
+            zone = self.zone_maps.get(page_index)
+            if zone is None:
+                if not new_page:
+                    return
+                zone = self.zone_maps[page_index] = [None] * self.num_columns
+            for column_idx, value in enumerate(columns):
+                if value is None:
+                    continue
+                bounds = zone[column_idx]
+                if bounds is None:
+                    # a column nobody scanned stays unknown, except on a new page
+                    if new_page:
+                        zone[column_idx] = [value, value]
+                elif value < bounds[0]:
+                    bounds[0] = value
+                elif value > bounds[1]:
+                    bounds[1] = value
+
+    def zone_epoch(self, page_index):
+        with self.zone_lock:
+            return self.zone_epochs.get(page_index, 0)
+
+    def set_zone(self, page_index, column_idx, low, high, epoch):
+        # bounds of a column computed by a scan that started at epoch
+        with self.zone_lock:
+            if self.zone_epochs.get(page_index, 0) != epoch:
+                return False
+            zone = self.zone_maps.setdefault(page_index, [None] * self.num_columns)
+            zone[column_idx] = [low, high]
+            return True
+
+    def drop_zone(self, page_index):
+        # values of the page went back to ones its zone map may not cover, the next scan rebuilds it
+        with self.zone_lock:
+            self.zone_epochs[page_index] = self.zone_epochs.get(page_index, 0) + 1
+            self.zone_maps.pop(page_index, None)
+
+    def zone_may_contain(self, page_index, column_idx, begin, end):
+        # False only if no record of the page can have a value in [begin, end] in column_idx
+        zone = self.zone_maps.get(page_index)
+        if zone is None:
+            return True
+        bounds = zone[column_idx]
+        return bounds is None or (bounds[0] <= end and bounds[1] >= begin)
+
     def _allocate_base_page(self):
         new_page = BasePage(self.num_columns)
         # self.base_pages.append(new_page)
@@ -60,9 +210,18 @@ class PageRange:
         idx = self.num_base_records // Config.PAGE_CAPACITY
         # (page_idx, page)
         # evict = self.base_pages.put(idx, new_page)
-        evict = self.Buffer.put(idx, new_page, "Base")
-        if evict != None: 
-            self.save_one_page_to_disk(evict[0], evict[1], "Base")
+        # the page being appended to stays pinned with all of its columns in memory,
+        # it is pinned as it goes in so the policy cannot pick it as the victim of its own put
+        if self.current_base_page is not None:
+            self.Buffer.unpin(idx - 1, "Base")
+        elif self.num_base_records % Config.PAGE_CAPACITY:
+            # reopened table whose last page is only partly filled, keep appending to it
+            page = self._resume_page(idx, "Base", self.num_base_records % Config.PAGE_CAPACITY)
+            if page is not None:
+                self.current_base_page = page
+                return page
+        evict = self.Buffer.put(idx, new_page, "Base", pin=True)
+        self.write_back(evict)
         self.current_base_page = new_page
         return new_page
     
@@ -74,13 +233,55 @@ class PageRange:
         idx = self.num_tail_records // Config.PAGE_CAPACITY
         # (page_idx, page)
         # evict = self.tail_pages.put(idx, new_page)
-        evict = self.Buffer.put(idx, new_page, "Tail")
-        if evict != None: 
-            self.save_one_page_to_disk(evict[0], evict[1], "Tail")
-
+        if self.current_tail_page is not None:
+            self.Buffer.unpin(idx - 1, "Tail")
+        elif self.num_tail_records % Config.PAGE_CAPACITY:
+            page = self._resume_page(idx, "Tail", self.num_tail_records % Config.PAGE_CAPACITY)
+            if page is not None:
+                self.current_tail_page = page
+                return page
+        evict = self.Buffer.put(idx, new_page, "Tail", pin=True)
+        self.write_back(evict)
         self.current_tail_page = new_page
         return new_page
     
+    def _resume_page(self, page_index, page_type, num_records):
+        # pinned page from disk whose columns hold num_records records, appends continue after them
+        page = self.get_page(page_index, page_type, None, pin=True)
+        if page is None:
+            return None
+        for physical_page in page.physical_pages:
+            physical_page.num_items = num_records
+        page.num_records = num_records
+        return page
+
+    def write_record_at(self, page_type, rid, values):
+        # recovery: put a whole record (every physical column) at its rid, creating the page when it
+        # never reached the disk. Slots skipped on a new page become empty records (rid -1).
+        page_index, record_index = divmod(rid, Config.PAGE_CAPACITY)
+        with self.load_lock:
+            page = self.get_page(page_index, page_type, None, pin=True)
+            if page is None:
+                page = BasePage(self.num_columns) if page_type == "Base" else TailPage(self.num_columns)
+                evict = self.Buffer.put(page_index, page, page_type, pin=True)
+                self.write_back(evict)
+        try:
+            for column_idx, value in enumerate(values):
+                physical_page = page.physical_pages[column_idx]
+                empty = -1 if column_idx in (Config.INDIRECTION_COLUMN, Config.RID_COLUMN) else 0
+                while physical_page.num_items <= record_index:
+                    physical_page.write(empty)
+                physical_page.update(record_index, value)
+            page.num_records = max(page.num_records, record_index + 1)
+        finally:
+            self.Buffer.unpin(page_index, page_type)
+
+        if page_type == "Base":
+            self.widen_zone(page_index, values[Config.USER_COLUMN_START:])
+            self.num_base_records = max(self.num_base_records, rid + 1)
+        else:
+            self.num_tail_records = max(self.num_tail_records, rid + 1)
+
     def has_base_capacity(self):
         # return self.current_base_page.has_capacity()
         return False if self.current_base_page == None else self.current_base_page.has_capacity()
@@ -90,14 +291,20 @@ class PageRange:
         return False if self.current_tail_page == None else self.current_tail_page.has_capacity()
     
     
-    def insert_base_record_with_rid_alloc(self, timestamp, columns):
+    def insert_base_record_with_rid_alloc(self, timestamp, columns, log=None):
         # Atomically allocate rid and insert base record
+        # log: called with the rid before the record is written (write-ahead logging)
         # return (rid, page_index, record_index) or None
         with self.lock:
             rid = self.num_base_records
             
             if not self.has_base_capacity():
                 self._allocate_base_page()
+
+            # widened before the record is visible, a concurrent scan may read it but not skip it
+            self.widen_zone(rid // Config.PAGE_CAPACITY, columns, new_page=rid % Config.PAGE_CAPACITY == 0)
+            if log is not None:
+                log(rid)
         
             success = self.current_base_page.insert_record(rid, timestamp, columns)
             if success:
@@ -107,14 +314,17 @@ class PageRange:
                 return (rid, page_index, record_index)
             return None
     
-    def append_tail_record_with_rid_alloc(self, indirection, timestamp, schema_encoding, base_rid, columns):
+    def append_tail_record_with_rid_alloc(self, indirection, timestamp, schema_encoding, base_rid, columns, log=None):
         # Atomically allocate rid and insert base record
+        # log: called with the rid before the record is written (write-ahead logging)
         # return (rid, page_index, record_index) or None
         with self.lock:
             rid = self.num_tail_records
             
             if not self.has_tail_capacity():
                 self._allocate_tail_page()
+            if log is not None:
+                log(rid)
         
             success = self.current_tail_page.append_update(
                 rid, indirection, timestamp, schema_encoding, base_rid, columns
@@ -126,274 +336,381 @@ class PageRange:
                 return (rid, page_index, record_index)
             return None
     
-    def read_base_record(self, page_index, record_index):
-        # if page_index >= len(self.base_pages):
-        #     return None
-
-        # if page_index not in self.base_pages.cache:
-        if page_index not in self.Buffer.base_cache:
-            base_page = self.load_one_base_page_from_disk(page_index)
-            if base_page == None:
-                return None
-            evict = self.Buffer.put(page_index, base_page, "Base")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Base")
-        else:
-            # base_page = self.base_pages[page_index]
-            # base_page = self.base_pages.get(page_index)
-            base_page = self.Buffer.get(page_index, "Base")
-            if record_index >= base_page.num_records:
-                # print("read_base_record: ", page_index, record_index, base_page.num_records)
-                return None
-        
-        # read every column independently
+    def _projected_physical_columns(self, projected_columns):
+        # physical columns touched by a read: everything, or the version metadata + projected user columns
+        if projected_columns is None:
+            return None
+        physical_columns = [Config.INDIRECTION_COLUMN, Config.SCHEMA_ENCODING_COLUMN]
+        for i, projected in enumerate(projected_columns):
+            if projected:
+                physical_columns.append(Config.USER_COLUMN_START + i)
+        return physical_columns
+
+    def _read_record(self, page, record_index, projected_columns):
+        if projected_columns is None:
+            # read every column independently
+            return {
+                'indirection': page.physical_pages[Config.INDIRECTION_COLUMN].read(record_index),
+                'rid': page.physical_pages[Config.RID_COLUMN].read(record_index),
+                'timestamp': page.physical_pages[Config.TIMESTAMP_COLUMN].read(record_index),
+                'schema_encoding': page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].read(record_index),
+                'base_rid': page.physical_pages[Config.BASE_RID_COLUMN].read(record_index),
+                'columns': [
+                    page.physical_pages[Config.USER_COLUMN_START + i].read(record_index)
+                    for i in range(self.num_columns)
+                ]
+            }
+
+        # projected read: only version metadata and the projected columns, others are None
         return {
-            'indirection': base_page.physical_pages[Config.INDIRECTION_COLUMN].read(record_index),
-            'rid': base_page.physical_pages[Config.RID_COLUMN].read(record_index),
-            'timestamp': base_page.physical_pages[Config.TIMESTAMP_COLUMN].read(record_index),
-            'schema_encoding': base_page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].read(record_index),
-            'base_rid': base_page.physical_pages[Config.BASE_RID_COLUMN].read(record_index),
+            'indirection': page.physical_pages[Config.INDIRECTION_COLUMN].read(record_index),
+            'schema_encoding': page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].read(record_index),
             'columns': [
-                base_page.physical_pages[Config.USER_COLUMN_START + i].read(record_index)
-                for i in range(self.num_columns)
+                page.physical_pages[Config.USER_COLUMN_START + i].read(record_index) if projected else None
+                for i, projected in enumerate(projected_columns)
             ]
         }
-    
-    def read_tail_record(self, page_index, record_index):
-        # if page_index >= len(self.tail_pages):
-        #     return None
-        # if page_index not in self.tail_pages.cache:
-        if page_index not in self.Buffer.tail_cache:
-            tail_page = self.load_one_tail_page_from_disk(page_index)
-            if tail_page == None:
+
+    def read_base_record(self, page_index, record_index, projected_columns=None):
+        # projected_columns: optional 0/1 mask over user columns, only those pages are touched
+        # 'tps': newest tail record merged into the base record, the tail records up to it are folded
+        # into its values; an indirection that goes no further reads as -1 (the base record is current),
+        # 'last_tail' is the newest tail record either way, where the version chain goes on from
+        physical_columns = self._projected_physical_columns(projected_columns)
+        if physical_columns is not None:
+            physical_columns.append(Config.BASE_RID_COLUMN)
+        # pinned without pinned_page(), the context manager costs more than the read on this path
+        base_page = self.get_page(page_index, "Base", physical_columns, pin=True)
+        if base_page is None:
+            return None
+        try:
+            if record_index >= base_page.num_records:
                 return None
-            
-            # evict = self.tail_pages.put(page_index, tail_page)
-            evict = self.Buffer.put(page_index, tail_page, "Tail")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Tail")
-        else:
-            # tail_page = self.tail_pages[page_index]
-            # tail_page = self.tail_pages.get(page_index)
-            tail_page = self.Buffer.get(page_index, "Tail")
+            record = self._read_record(base_page, record_index, projected_columns)
+            record['tps'] = base_page.physical_pages[Config.BASE_RID_COLUMN].read(record_index)
+            record['last_tail'] = record['indirection']
+            if record['indirection'] <= record['tps']:
+                record['indirection'] = -1
+            return record
+        finally:
+            self.Buffer.unpin(page_index, "Base")
+    
+    def read_tail_record(self, page_index, record_index, projected_columns=None):
+        tail_page = self.get_page(page_index, "Tail", self._projected_physical_columns(projected_columns), pin=True)
+        if tail_page is None:
+            return None
+        try:
             if record_index >= tail_page.num_records:
                 return None
-        
-        # read every column independently
-        return {
-            'indirection': tail_page.physical_pages[Config.INDIRECTION_COLUMN].read(record_index),
-            'rid': tail_page.physical_pages[Config.RID_COLUMN].read(record_index),
-            'timestamp': tail_page.physical_pages[Config.TIMESTAMP_COLUMN].read(record_index),
-            'schema_encoding': tail_page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].read(record_index),
-            'base_rid': tail_page.physical_pages[Config.BASE_RID_COLUMN].read(record_index),
-            'columns': [
-                tail_page.physical_pages[Config.USER_COLUMN_START + i].read(record_index)
-                for i in range(self.num_columns)
-            ]
-        }
+            return self._read_record(tail_page, record_index, projected_columns)
+        finally:
+            self.Buffer.unpin(page_index, "Tail")
     
     def set_base_record_value(self, page_index, record_index, column_idx, value):
-        # if page_index >= len(self.base_pages):
-        #     return None
-
-        # if page_index not in self.base_pages.cache:
-        if page_index not in self.Buffer.base_cache:
-            base_page = self.load_one_base_page_from_disk(page_index)
+        with self.pinned_page(page_index, "Base", [column_idx]) as base_page:
             if base_page == None:
                 return None
-            
-            # evict = self.base_pages.put(page_index, base_page)
-            evict = self.Buffer.put(page_index, base_page, "Base")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Base")
-        else:
-            # base_page = self.base_pages[page_index]
-            # base_page = self.base_pages.get(page_index)
-            base_page = self.Buffer.get(page_index, "Base")
             if record_index >= base_page.num_records:
-                # print("read_base_record: ", page_index, record_index)
                 return None
-        
-        # set value based on column_idx
-        base_page.physical_pages[column_idx].update(record_index, value)
+            
+            # set value based on column_idx
+            base_page.physical_pages[column_idx].update(record_index, value)
 
     def set_tail_record_value(self, page_index, record_index, column_idx, value):
-        # if page_index >= len(self.tail_pages):
-        #     return None
-
-        # if page_index not in self.tail_pages.cache:
-        if page_index not in self.Buffer.tail_cache:
-            tail_page = self.load_one_tail_page_from_disk(page_index)
+        with self.pinned_page(page_index, "Tail", [column_idx]) as tail_page:
             if tail_page == None:
                 return None
-            
-            # evict = self.tail_pages.put(page_index, tail_page)
-            evict = self.Buffer.put(page_index, tail_page, "Tail")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Tail")
-        else:
-            # tail_page = self.tail_pages[page_index]
-            # tail_page = self.tail_pages.get(page_index)
-            tail_page = self.Buffer.get(page_index, "Tail")
-
             if record_index >= tail_page.num_records:
                 return None
-        
-        # set value based on column_idx
-        tail_page.physical_pages[column_idx].update(record_index, value)
+            
+            # set value based on column_idx
+            tail_page.physical_pages[column_idx].update(record_index, value)
 
     
     def update_base_indirection(self, page_index, record_index, new_indirection):
-        # if page_index >= len(self.base_pages):
-        #     return False
-
-        # if page_index not in self.base_pages.cache:
-        if page_index not in self.Buffer.base_cache:
-            base_page = self.load_one_base_page_from_disk(page_index)
+        with self.pinned_page(page_index, "Base", [Config.INDIRECTION_COLUMN]) as base_page:
             if base_page == None:
                 return None
-
-            # evict = self.base_pages.put(page_index, base_page)
-            evict = self.Buffer.put(page_index, base_page, "Base")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Base")
-        else:
-            # base_page = self.base_pages[page_index]
-            # base_page = self.base_pages.get(page_index)
-            base_page = self.Buffer.get(page_index, "Base")
-        return base_page.physical_pages[Config.INDIRECTION_COLUMN].update(record_index, new_indirection)
+            return base_page.physical_pages[Config.INDIRECTION_COLUMN].update(record_index, new_indirection)
     
     def update_base_schema_encoding(self, page_index, record_index, new_encoding):
-        # if page_index >= len(self.base_pages):
-        #     return False
-
-        # if page_index not in self.base_pages.cache:
-        if page_index not in self.Buffer.base_cache:
-            base_page = self.load_one_base_page_from_disk(page_index)
+        with self.pinned_page(page_index, "Base", [Config.SCHEMA_ENCODING_COLUMN]) as base_page:
             if base_page == None:
                 return None
-
-            # evict = self.base_pages.put(page_index, base_page)
-            evict = self.Buffer.put(page_index, base_page, "Base")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Base")
-        else:
-            # base_page = self.base_pages[page_index]
-            # base_page = self.base_pages.get(page_index)
-            base_page = self.Buffer.get(page_index, "Base")
-        return base_page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].update(record_index, new_encoding)
+            return base_page.physical_pages[Config.SCHEMA_ENCODING_COLUMN].update(record_index, new_encoding)
     
     def update_base_tsp(self, page_index, record_index, new_tsp):
-        # if page_index >= len(self.base_pages):
-        #     return False
-        # if page_index not in self.base_pages.cache:
-        if page_index not in self.Buffer.base_cache:
-            base_page = self.load_one_base_page_from_disk(page_index)
+        with self.pinned_page(page_index, "Base", [Config.BASE_RID_COLUMN]) as base_page:
             if base_page == None:
                 return None
-
-            # evict = self.base_pages.put(page_index, base_page)
-            evict = self.Buffer.put(page_index, base_page, "Base")
-            if evict != None: 
-                self.save_one_page_to_disk(evict[0], evict[1], "Base")
-        else:
-            # base_page = self.base_pages[page_index]
-            base_page = self.Buffer.get(page_index, "Base")
+            return base_page.physical_pages[Config.BASE_RID_COLUMN].update(record_index, new_tsp)
     
-        return base_page.physical_pages[Config.BASE_RID_COLUMN].update(record_index, new_tsp)
+    def publish_base_version(self, page_index, rec_indices, tps, columns):
+        # Merged values go into a new version of the base page, built out of place: the user columns
+        # the merge changes and the TPS column (BASE_RID_COLUMN of base records) are copies with the
+        # merged values scattered in, the others are shared with the current version so updates to
+        # indirection / schema encoding land in both. One swap of the page directory entry publishes
+        # it; readers holding the old version keep reading a consistent page, nobody waits on the merge
+        # (only inserts into a page that is not full yet, while it is copied).
+        # columns: user column -> (record indices, values). Returns the TPS of rec_indices before, None
+        # if the page is gone.
+        with self.pinned_page(page_index, "Base") as page:
+            if page is None:
+                return None
+            insert_lock = self.lock if page.num_records < Config.PAGE_CAPACITY else nullcontext()
+            with insert_lock:
+                version = BasePage(self.num_columns, allocate=False)
+                version.physical_pages = list(page.physical_pages)
+                version.num_records = page.num_records
+
+                previous = page.physical_pages[Config.BASE_RID_COLUMN].gather(rec_indices)
+                tps_page = page.physical_pages[Config.BASE_RID_COLUMN].copy()
+                tps_page.scatter(rec_indices, tps)
+                version.physical_pages[Config.BASE_RID_COLUMN] = tps_page
+
+                for col_idx, (indices, values) in columns.items():
+                    physical_column = col_idx + Config.USER_COLUMN_START
+                    phy_page = page.physical_pages[physical_column].copy()
+                    phy_page.scatter(indices, values)
+                    version.physical_pages[physical_column] = phy_page
+                    # merged values widen the zone map of the page (the current ones are already in it)
+                    zone = [None] * self.num_columns
+                    for value in (min(values), max(values)):
+                        zone[col_idx] = value
+                        self.widen_zone(page_index, zone)
+
+                if not self.Buffer.swap(page_index, page, version, "Base"):
+                    return None
+                if self.current_base_page is page:
+                    self.current_base_page = version
+            return previous
+
+    def get_page(self, page_index, page_type="Base", column_indices=None, pin=False):
+        # fetch a page through the buffer, loading it from disk on a miss
+        # column_indices: physical columns the caller needs (all if None), others may stay unloaded
+        # pin: keep the page from being evicted until unpin(), see pinned_page()
+        page = self.Buffer.get(page_index, page_type, column_indices, pin)
+        if page is None:
+            with self.load_lock:
+                # another thread may have loaded it while we waited
+                page = self.Buffer.get(page_index, page_type, column_indices, pin)
+                if page is None:
+                    return self.load_one_page_from_disk(page_index, page_type, column_indices, pin)
+
+        # fault in the columns this caller touches for the first time
+        missing = page.missing_columns(column_indices)
+        if missing:
+            with self.load_lock:
+                missing = page.missing_columns(missing)
+                if missing and not self.load_columns_from_disk(page, page_index, page_type, missing):
+                    if pin:
+                        self.Buffer.unpin(page_index, page_type)
+                    return None
+            evict = self.Buffer.add_columns(page_index, page_type, missing)
+            self.write_back(evict)
+        return page
+
+    @contextmanager
+    def pinned_page(self, page_index, page_type="Base", column_indices=None):
+        # page (or None) that cannot be evicted while the block runs
+        page = self.get_page(page_index, page_type, column_indices, pin=True)
+        try:
+            yield page
+        finally:
+            if page is not None:
+                self.Buffer.unpin(page_index, page_type)
+
+    def write_back(self, evicted):
+        # persist physical column pages dropped by the buffer, each by the page range that owns it
+        for owner, page_idx, physical_page, page_type, column_idx in evicted:
+            if owner is not None:
+                owner.write_back_page(page_idx, physical_page, page_type, column_idx)
+
+    def write_back_page(self, page_idx, physical_page, page_type, column_idx):
+        if self.flusher is None or not physical_page.dirty:
+            if physical_page.dirty:
+                self.flush_log()
+            self.save_one_column_to_disk(page_idx, column_idx, physical_page, page_type)
+            return
+
+        # hand the page to the background writer, readers find it in pending_writes meanwhile
+        key = (page_type, column_idx, page_idx)
+        with self.pending_lock:
+            pending = self.pending_writes.get(key)
+            if pending is not None and pending[0] is physical_page:
+                pending[1] += 1
+            else:
+                self.pending_writes[key] = [physical_page, 1]
+        self.flusher.submit(self, page_idx, column_idx, physical_page, page_type)
+
+    def flush_pending(self, page_idx, column_idx, physical_page, page_type):
+        # called by the flusher thread for each queued page
+        self.save_one_column_to_disk(page_idx, column_idx, physical_page, page_type)
+
+        key = (page_type, column_idx, page_idx)
+        with self.pending_lock:
+            pending = self.pending_writes.get(key)
+            if pending is not None and pending[0] is physical_page:
+                pending[1] -= 1
+                if pending[1] == 0:
+                    del self.pending_writes[key]
+
+    def flush_log(self):
+        # write-ahead rule, called before dirty pages are written (the flusher calls it once per batch)
+        if self.wal is not None:
+            self.wal.flush()
+
+    def wait_for_writes(self):
+        # barrier for pages queued on the flusher
+        if self.flusher is not None:
+            self.flusher.flush()
+
+    def save_one_column_to_disk(self, page_idx, column_idx, physical_page, page_type):
+        # only dirty pages are written, clean ones already match the disk
+        if not physical_page.dirty:
+            self._count_io(page_type, "skipped", len(physical_page.data))
+            return False
+
+        # clear before writing, so a concurrent modification marks the page dirty again
+        physical_page.dirty = False
+        start = perf_counter()
+        self.storage.write(page_type, column_idx, page_idx, physical_page.get_data())
+        self._count_io(page_type, "written", len(physical_page.data), perf_counter() - start)
+        return True
+
+    def read_column_from_disk(self, page_type, column_idx, page_idx):
+        # raw page bytes (None if the page was never written), counted in io_stats
+        start = perf_counter()
+        page_data = self.storage.read(page_type, column_idx, page_idx)
+        if page_data is not None:
+            self._count_io(page_type, "read", len(page_data), perf_counter() - start)
+        return page_data
     
     def save_one_page_to_disk(self, page_idx, page, page_type):
         for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-            page_data = page.get_page_data(column_idx)
+            physical_page = page.get_a_page(column_idx)
+            # column is not loaded, the file on disk is still current
+            if physical_page is None:
+                continue
             # if idx == 0 and column_idx == 1: print(list(page_data))
-            
-            page_path = os.path.join(self.table_path, str(column_idx))
-            page_path = os.path.join(page_path, page_type)
-
-            if not os.path.exists(page_path):
-                os.makedirs(page_path)
-
-            # for record_byte in page_data:
-            file_path = os.path.join(page_path, str(page_idx))
-            with open(file_path, "wb") as fp:
-                fp.write(page_data)
+            self.save_one_column_to_disk(page_idx, column_idx, physical_page, page_type)
+
+    def load_columns_from_disk(self, page, page_idx, page_type, column_indices):
+        # read the given column files into page, False if any of them is missing
+        for column_idx in column_indices:
+            # a page still queued for write back is newer than the disk copy
+            with self.pending_lock:
+                pending = self.pending_writes.get((page_type, column_idx, page_idx))
+            if pending is not None:
+                page.set_a_page(column_idx, pending[0])
+                continue
+
+            page_data = self.read_column_from_disk(page_type, column_idx, page_idx)
+            if page_data is None:
+                return False
+
+            if self.storage.zero_copy:
+                page.attach_page_data(column_idx, page_data, len(page_data)//8)
+            else:
+                page.set_page_data(column_idx, page_data, len(page_data)//8)
+        return True
 
-    def load_one_base_page_from_disk(self, page_idx):
-        base_page = BasePage(self.num_columns)
-        for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-            file_path = f"{self.table_path}/{column_idx}/Base/{page_idx}"
-            if not os.path.exists(file_path):
-                return None
-            with open(file_path, "rb") as fp:
-                page_data = fp.read()
+    def load_one_page_from_disk(self, page_idx, page_type="Base", column_indices=None, pin=False):
+        # only column_indices are read (all columns if None), the rest are faulted in on demand
+        if page_type == "Base":
+            page = BasePage(self.num_columns, allocate=False)
+        else:
+            page = TailPage(self.num_columns, allocate=False)
 
-            # if idx == 0 and column_idx == 1: print(list(page_data))
-            base_page.set_page_data(column_idx, page_data, len(page_data)//8)
-            # print(len(page_data)//8, base_page.num_records)
+        if column_indices is None:
+            column_indices = range(self.num_columns + Config.USER_COLUMN_START)
+        if not self.load_columns_from_disk(page, page_idx, page_type, column_indices):
+            return None
         
-        # evict = self.base_pages.put(page_idx, base_page)
-        evict = self.Buffer.put(page_idx, base_page, "Base")
-        if evict != None: 
-            self.save_one_page_to_disk(evict[0], evict[1], "Base")
+        evict = self.Buffer.put(page_idx, page, page_type, pin)
+        self.write_back(evict)
         
-        return base_page
-
-    def load_one_tail_page_from_disk(self, page_idx):
-        tail_page = TailPage(self.num_columns)
-        for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-            file_path = f"{self.table_path}/{column_idx}/Tail/{page_idx}"
-            if not os.path.exists(file_path):
-                # print("no directory", page_idx)
-                return None
-            with open(file_path, "rb") as fp:
-                page_data = fp.read()
-            
-            tail_page.set_page_data(column_idx, page_data, len(page_data)//8)
-       
-        # evict = self.tail_pages.put(page_idx, tail_page)
-        evict = self.Buffer.put(page_idx, tail_page, "Tail")
-        if evict != None: 
-            self.save_one_page_to_disk(evict[0], evict[1], "Tail")
-
-        return tail_page
+        return page
+
+    def load_one_base_page_from_disk(self, page_idx, column_indices=None):
+        return self.load_one_page_from_disk(page_idx, "Base", column_indices)
+
+    def load_one_tail_page_from_disk(self, page_idx, column_indices=None):
+        return self.load_one_page_from_disk(page_idx, "Tail", column_indices)
+
+    def retire_tail_records(self, tail_rids, merged_tail_records=None):
+        # tail records no version read can reach any more, pages left without live records are retired.
+        # A merge moves its watermark (merged_tail_records) under the same lock, a save sees it together
+        # with the deaths before it.
+        with self.reclaim_lock:
+            retired = []
+            for tail_rid in tail_rids:
+                page_idx, record_idx = divmod(tail_rid, Config.PAGE_CAPACITY)
+                dead = self.dead_tail_records.get(page_idx, 0)
+                mask = dead | (1 << record_idx)
+                if mask == dead:
+                    continue
+                self.dead_tail_records[page_idx] = mask
+                if mask == self.all_dead:
+                    self.retired_tail_pages.add(page_idx)
+                    self.reclaim_stats["retired_pages"] += 1
+                    retired.append(page_idx)
+            if merged_tail_records is not None:
+                self.merged_tail_records = merged_tail_records
+        # out of the tail cache right away, changes written back: until its files are freed the page
+        # is what a restart reads (rolled back records marked). A page still in use is dropped when it
+        # is reclaimed
+        for page_idx in retired:
+            self.write_back(self.Buffer.remove(page_idx, "Tail") or [])
+
+    def reclaim_tail_pages(self, retired):
+        # free the files of retired tail pages (the ones retired before the save that calls this began)
+        reclaimed = []
+        for page_idx in retired:
+            if not self.Buffer.discard(page_idx, "Tail"):
+                continue
+            for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
+                self.storage.free("Tail", column_idx, page_idx)
+            reclaimed.append(page_idx)
+        if not reclaimed:
+            return
+        self.storage.flush()
+        with self.reclaim_lock:
+            for page_idx in reclaimed:
+                self.retired_tail_pages.discard(page_idx)
+                self.dead_tail_records.pop(page_idx, None)
+                self.saved_dead_tail_records.pop(page_idx, None)
+            self.reclaim_stats["reclaimed_pages"] += len(reclaimed)
 
     def save_to_disk(self):
-        # save all base pages
-        for idx in self.Buffer.base_cache:
-            for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-                # base_page = self.base_pages.cache[idx]
-                base_page = self.Buffer.base_cache[idx]
-                page_data = base_page.get_page_data(column_idx)
-                # if idx == 0 and column_idx == 1: print(list(page_data))
-                
-                page_path = os.path.join(self.table_path, str(column_idx))
-                page_path = os.path.join(page_path, "Base")
+        # pages retired so far: the base pages their merge changed are written by this save
+        with self.reclaim_lock:
+            retired = list(self.retired_tail_pages)
+            self.saved_dead_tail_records = dict(self.dead_tail_records)
+            self.saved_merged_tail_records = self.merged_tail_records
 
-                if not os.path.exists(page_path):
-                    os.makedirs(page_path)
+        self.write_dirty_pages()
+        self.reclaim_tail_pages(retired)
 
-                # for record_byte in page_data:
-                file_path = os.path.join(page_path, str(idx))
-                with open(file_path, "wb") as fp:
-                    fp.write(page_data)
+    def write_dirty_pages(self):
+        # write back every cached page and flush the storage, nothing is reclaimed
+        # evicted pages first, so the storage flush below covers them
+        self.wait_for_writes()
+        self.flush_log()
+
+        # save all base pages
+        for idx, base_page in list(self.Buffer.base_cache.items()):
+            self.save_one_page_to_disk(idx, base_page, "Base")
 
         # save all tail pages
-        for idx in self.Buffer.tail_cache:
-            for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-                # tail_page = self.tail_pages.cache[idx]
-                tail_page = self.Buffer.tail_cache[idx]
-                page_data = tail_page.get_page_data(column_idx)
-                
-                page_path = os.path.join(self.table_path, str(column_idx))
-                page_path = os.path.join(page_path, "Tail")
+        for idx, tail_page in list(self.Buffer.tail_cache.items()):
+            self.save_one_page_to_disk(idx, tail_page, "Tail")
 
-                if not os.path.exists(page_path):
-                    os.makedirs(page_path)
+        self.storage.flush()
 
-                # for record_byte in page_data:
-                file_path = os.path.join(page_path, str(idx))
-                with open(file_path, "wb") as fp:
-                    fp.write(page_data)
+    def close(self):
+        # after the last save: the storage is flushed and its files are closed
+        self.storage.close()
 
     def load_from_disk(self, num_base_pages, num_tail_pages):
         # load all base records
@@ -401,9 +718,7 @@ class PageRange:
             # print(idx)
             base_page = BasePage(self.num_columns)
             for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
-                file_path = f"{self.table_path}/{column_idx}/Base/{idx}"
-                with open(file_path, "rb") as fp:
-                    page_data = fp.read()
+                page_data = self.read_column_from_disk("Base", column_idx, idx)
                 
                 # if idx == 0 and column_idx == 1: print(list(page_data))
                 base_page.set_page_data(column_idx, page_data, len(page_data)//8)
@@ -412,8 +727,7 @@ class PageRange:
 
             # self.base_pages.append(base_page)
             evict = self.Buffer.put(idx, base_page, "Base")
-            if evict != None:
-                self.save_one_page_to_disk(evict[0], evict[1], "Base") 
+            self.write_back(evict)
         # self.current_base_page = self.base_pages[-1]
 
         # load all tail records
@@ -422,15 +736,12 @@ class PageRange:
             for column_idx in range(self.num_columns + Config.USER_COLUMN_START):
                 
 
-                file_path = f"{self.table_path}/{column_idx}/Tail/{idx}"
-                with open(file_path, "rb") as fp:
-                    page_data = fp.read()
+                page_data = self.read_column_from_disk("Tail", column_idx, idx)
                 
                 tail_page.set_page_data(column_idx, page_data, len(page_data)//8)
             # self.tail_pages.append(tail_page)
             evict = self.Buffer.put(idx, tail_page, "Tail")
-            if evict != None:
-                self.save_one_page_to_disk(evict[0], evict[1], "Tail") 
+            self.write_back(evict)
 
         # self.current_tail_page = self.tail_pages[-1]            
 
@@ -441,13 +752,16 @@ class Table:
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
     """
-    def __init__(self, name, dp_path, num_columns, key, num_base_records = 0, num_tail_records = 0):
+    def __init__(self, name, dp_path, num_columns, key, num_base_records = 0, num_tail_records = 0, storage_engine = None, flusher = None, buffer_pool = None, wal = None, merged_tail_records = 0, dead_tail_records = None):
         self.name = name
         self.key = key  # Which column is primary key?
         self.num_columns = num_columns
         # self.page_directory = {}
         self.table_path = os.path.join(dp_path, name)
-        self.page_directory = PageRange(self.table_path, 0, num_columns, num_base_records, num_tail_records)
+        self.storage_engine = storage_engine or Config.STORAGE_ENGINE
+        # write-ahead log shared with the other tables of the database, None when logging is off
+        self.wal = wal
+        self.page_directory = PageRange(self.table_path, 0, num_columns, num_base_records, num_tail_records, self.storage_engine, flusher, buffer_pool, wal, merged_tail_records, dead_tail_records)
         self.index = Index(self)
         
         # new added
@@ -457,23 +771,15 @@ class Table:
         self.lock_manager = LockManager()
         # Yanliang's Modification here: Add RID allocation lock
         self.rid_lock = threading.Lock()
+        self.merge_lock = threading.Lock()
         
-        self.is_merging = False
-        self.merge_thread = None
+        # merges tail records into the base pages in the background when they pay off
+        self.merge_scheduler = MergeScheduler(self)
+        if Config.MERGE_IN_BACKGROUND:
+            self.merge_scheduler.start()
         
         pass
     
-    def __merge_worker(self):
-        # This is the function that runs in the background thread
-        while self.is_merging:
-            # Check if there are tail records to merge 
-            if self.page_directory.num_tail_records > 0:
-                #TODO: the merge condition can be more sophisticated
-                self.merge()
-            
-            # pause for a while before next check
-            sleep(1) # try to merge every 1 second
-    
     def allocate_base_rid(self):
         # Allocate a new base RID atomically
         with self.rid_lock:
@@ -498,6 +804,9 @@ class Table:
             return rid, 'Base'
         
         indirection = base_record['indirection']
+        # older versions are read from the whole chain, merged tail records included
+        if relative_version != 0:
+            indirection = base_record['last_tail']
 
         # if no update records
         if indirection == -1:
@@ -511,7 +820,7 @@ class Table:
         tail_rids = []
         current_tail_rid = indirection
         
-        while current_tail_rid != -1:
+        while current_tail_rid >= 0:
             tail_rids.append(current_tail_rid)
             
             tail_page_idx = current_tail_rid // Config.PAGE_CAPACITY
@@ -529,10 +838,34 @@ class Table:
         if depth < len(tail_rids):
             # if the depth is within the Tail chain, return the corresponding tail rid
             return tail_rids[depth], 'Tail'
+        elif current_tail_rid < -1:
+            # the record as inserted, kept by the merge that overwrote the base record
+            return snapshot_link(current_tail_rid), 'Tail'
         else:
             # if the depth exceeds the Tail chain
             return rid, 'Base'
 
+    def version_chain(self, base_record, projected_columns=None):
+        # Tail records of every version of a base record, newest first, merged ones included, and its
+        # columns as inserted: the base record's own until a merge overwrites them, then the snapshot
+        # that merge linked to the end of the chain.
+        tail_chain = []
+        current_tail_rid = base_record['last_tail']
+        while current_tail_rid >= 0:
+            tail_page_idx, tail_record_idx = divmod(current_tail_rid, Config.PAGE_CAPACITY)
+            tail_record = self.page_directory.read_tail_record(tail_page_idx, tail_record_idx, projected_columns)
+            if tail_record is None:
+                break
+            tail_chain.append(tail_record)
+            current_tail_rid = tail_record['indirection']
+
+        columns = base_record['columns']
+        if current_tail_rid < -1:
+            snapshot = self.page_directory.read_tail_record(*divmod(snapshot_link(current_tail_rid), Config.PAGE_CAPACITY), projected_columns)
+            if snapshot is not None:
+                columns = snapshot['columns']
+        return tail_chain, list(columns)
+
     # may exist issues, change to read_tail_record and read_base_record
     def get_col_value(self, rid, column_idx, page_type = 'Base'):
         if column_idx > self.num_columns:
@@ -544,38 +877,60 @@ class Table:
         page_idx = rid // Config.PAGE_CAPACITY
         record_index =  rid % Config.PAGE_CAPACITY
 
+        projected_columns = [0] * self.num_columns
+        projected_columns[column_idx] = 1
+
         if page_type == 'Base':
-            cols = self.page_directory.read_base_record(page_idx, record_index)
+            cols = self.page_directory.read_base_record(page_idx, record_index, projected_columns)
             return cols['columns'][column_idx]
         else:
-            cols = self.page_directory.read_tail_record(page_idx, record_index)
+            cols = self.page_directory.read_tail_record(page_idx, record_index, projected_columns)
             return cols['columns'][column_idx]
 
     # return a column iteratively
-    def col_iterator(self, column_idx, page_type = 'Base'):
+    def col_iterator(self, column_idx, page_type = 'Base', latest = False, begin = None, end = None):
+        # latest: values of updated base records are taken from their newest tail record
+        # begin / end (with latest): base pages whose zone map rules out [begin, end] are skipped
         if column_idx > self.num_columns:
             raise ValueError("Invalid column idx")
         
         if page_type != 'Base' and page_type != 'Tail':
             raise ValueError("invalid page type")
+        latest = latest and page_type == 'Base'
 
         num_records = self.page_directory.num_base_records if page_type == 'Base' else self.page_directory.num_tail_records        
-        for i in range(num_records):
-            # get page index and local record index (in one page)
-            page_idx = i // Config.PAGE_CAPACITY
-            record_index = i % Config.PAGE_CAPACITY
-            # read from page
-            if(page_type == 'Base'):
-                res = self.page_directory.read_base_record(page_idx, record_index)
-            else:
-                res = self.page_directory.read_tail_record(page_idx, record_index)
-            col_value = res['columns'][column_idx]
-            rid = res['rid']
-
-            # print(res)
+        num_pages = math.ceil(num_records / Config.PAGE_CAPACITY)
+        physical_columns = [Config.RID_COLUMN, Config.USER_COLUMN_START + column_idx]
+        if latest:
+            physical_columns += [Config.INDIRECTION_COLUMN, Config.BASE_RID_COLUMN]
+        for page_idx in range(num_pages):
+            if latest and begin is not None and not self.page_directory.zone_may_contain(page_idx, column_idx, begin, end):
+                continue
+            epoch = self.page_directory.zone_epoch(page_idx) if latest else None
+
+            with self.page_directory.pinned_page(page_idx, page_type, physical_columns) as page:
+                if page is None:
+                    continue
+                # number of records in this page
+                n = min(Config.PAGE_CAPACITY, num_records - page_idx * Config.PAGE_CAPACITY)
+
+                # read the rid and target column as whole slices instead of record by record
+                rids = page.read_column(Config.RID_COLUMN, 0, n)
+                col_values = page.read_column(Config.USER_COLUMN_START + column_idx, 0, n)
+                indirections = page.read_column(Config.INDIRECTION_COLUMN, 0, n) if latest else None
+                tps = page.read_column(Config.BASE_RID_COLUMN, 0, n) if latest else None
+
+            # tail records hold every column, the newest one has the current value unless it is merged
+            # (up to the TPS) into the base record (deleted records included, a rollback can bring them back)
+            if latest:
+                for i, indirection in enumerate(indirections):
+                    if indirection > tps[i]:
+                        col_values[i] = self.get_col_value(indirection, column_idx, 'Tail')
+                if col_values:
+                    self.page_directory.set_zone(page_idx, column_idx, min(col_values), max(col_values), epoch)
 
             # return rid, col_value Iteratively
-            yield rid, col_value
+            yield from zip(rids, col_values)
 
     # don't need this (?) directly call page range func: insert_base_record() & append_tail_record()
     def add_record(self, columns, page_type = 'Base'):
@@ -608,6 +963,29 @@ class Table:
     def get_record_by_rid(self, rid):
         pass
     
+    def logged_change(self):
+        # block in which a query logs a change and then makes it, see WriteAheadLog.change()
+        return self.wal.change() if self.wal is not None else nullcontext()
+
+    def retire_deleted(self, rid):
+        # A deleted record no version read can reach (the delete is final: outside of a transaction or
+        # committed): every tail record of its chain is retired, its snapshot included.
+        base_record = self.page_directory.read_base_record(rid // Config.PAGE_CAPACITY, rid % Config.PAGE_CAPACITY, [0] * self.num_columns)
+        if base_record is None:
+            return
+        dead = []
+        tail_rid = base_record['last_tail']
+        while tail_rid != -1:
+            if tail_rid < -1:
+                tail_rid = snapshot_link(tail_rid)
+            dead.append(tail_rid)
+            page_idx, rec_idx = divmod(tail_rid, Config.PAGE_CAPACITY)
+            with self.page_directory.pinned_page(page_idx, "Tail", [Config.INDIRECTION_COLUMN]) as tail_page:
+                if tail_page is None:
+                    break
+                tail_rid = tail_page.physical_pages[Config.INDIRECTION_COLUMN].read(rec_idx)
+        self.page_directory.retire_tail_records(dead)
+
     # TODO: implement delete by rid
     def delete(self, primary_key):
         rids_list = self.index.locate(self.key, primary_key)
@@ -634,92 +1012,169 @@ class Table:
                 self.page_directory.set_tail_record_value(page_idx, record_idx, Config.RID_COLUMN, -1)
     
     def merge(self):
-        # obtain the number of tail pages
-        num_tail_pages = math.ceil(self.page_directory.num_tail_records / Config.PAGE_CAPACITY)
-        if num_tail_pages == 0:
-            return
+        # Incremental: only the tail records appended since the last merge (from the watermark up to
+        # the tail count when the merge starts) are consumed, older ones are already in the base pages.
+        # One merge runs at a time (the scheduler's thread and explicit calls).
+        with self.merge_lock:
+            merge_start = self.page_directory.merged_tail_records
+            merge_end = self.page_directory.num_tail_records
+            if merge_end <= merge_start:
+                return
+
+            # Records a running transaction holds exclusively may have uncommitted tail records, they
+            # keep their chains. Taken after merge_end and before the tail records are read: a
+            # transaction that ended in between has marked its rolled back tail records already.
+            skip = self.lock_manager.exclusive_lock_ids()
+
+            tail = self._read_tail_columns(merge_start, merge_end)
+            if np is not None and Config.USE_NUMPY:
+                merged, consolidated = _latest_tail_values_numpy(tail, self.num_columns, skip)
+            else:
+                merged, consolidated = _latest_tail_values(tail, self.num_columns, skip)
+
+            # the values the records were inserted with are kept for older versions before the first
+            # merge of each overwrites them
+            snapshots = self._snapshot_originals(tail, consolidated)
+
+            # one new version per base page, with the merged values and the newest merged tail rid of
+            # each record as its TPS; readers of the latest version stop following a chain there, the
+            # merge never writes indirection, so it cannot lose a concurrent update
+            for base_page_idx, (rec_indices, tail_rids) in consolidated.items():
+                columns = {col_idx: merged[col_idx][base_page_idx] for col_idx in range(self.num_columns) if base_page_idx in merged[col_idx]}
+                self.page_directory.publish_base_version(base_page_idx, rec_indices, tail_rids, columns)
+
+            # the merged chains stay, older versions are read from them; the next merge starts where
+            # this one ended, past the snapshots appended right after its records (none to merge there)
+            for snapshot_rid in snapshots:
+                if snapshot_rid != merge_end:
+                    break
+                merge_end += 1
+            self.page_directory.retire_tail_records([], merge_end)
+
+    def _snapshot_originals(self, tail, consolidated):
+        # For the merged records no merge has changed yet (TPS -1): a tail record with every column
+        # as inserted, linked to the end of the chain (snapshot_link) before the base record changes.
+        # Deleted records get none, their chains are retired. Returns the tail rids of the snapshots,
+        # in the order they were appended.
+        user_columns = [col_idx + Config.USER_COLUMN_START for col_idx in range(self.num_columns)]
+        originals = {}
+        for base_page_idx, (rec_indices, _) in consolidated.items():
+            with self.page_directory.pinned_page(base_page_idx, "Base", [Config.RID_COLUMN, Config.BASE_RID_COLUMN] + user_columns) as page:
+                if page is None:
+                    continue
+                tps = page.gather_column(Config.BASE_RID_COLUMN, rec_indices)
+                rids = page.gather_column(Config.RID_COLUMN, rec_indices)
+                first = [rec_idx for rec_idx, record_tps, rid in zip(rec_indices, tps, rids) if record_tps == -1 and rid != -1]
+                if not first:
+                    continue
+                values = [page.gather_column(column, first) for column in user_columns]
+            page_start = base_page_idx * Config.PAGE_CAPACITY
+            for i, rec_idx in enumerate(first):
+                originals[page_start + rec_idx] = [column[i] for column in values]
+        snapshots = []
+        if not originals:
+            return snapshots
+
+        timestamp = int(datetime.now().timestamp())
+        schema = (1 << self.num_columns) - 1
+        with self.logged_change():
+            for base_rid, tail_rid in self._chain_ends(tail, originals).items():
+                columns = originals[base_rid]
+                log = None
+                if self.wal is not None:
+                    log = lambda snapshot_rid: self.wal.log_snapshot(self.name, base_rid, snapshot_rid, timestamp, columns, tail_rid)
+                # no base rid, merges leave it out
+                result = self.page_directory.append_tail_record_with_rid_alloc(-1, timestamp, schema, -1, columns, log)
+                if result is None:
+                    continue
+                self.page_directory.set_tail_record_value(*divmod(tail_rid, Config.PAGE_CAPACITY), Config.INDIRECTION_COLUMN, snapshot_link(result[0]))
+                snapshots.append(result[0])
+        return snapshots
+
+    def _chain_ends(self, tail, base_rids):
+        # base rid -> oldest tail record of its chain, for the base_rids without a snapshot yet
+        if np is not None and Config.USE_NUMPY:
+            wanted = np.fromiter(base_rids, dtype=np.int64, count=len(base_rids))
+            chained = (tail["rid"] != -1) & np.isin(tail["base_rid"], wanted)
+            # first occurrence per base record = its oldest tail record here
+            found, oldest = np.unique(tail["base_rid"][chained], return_index=True)
+            older = zip(found.tolist(), tail["rid"][chained][oldest].tolist(), tail["indirection"][chained][oldest].tolist())
+        else:
+            older, seen = [], set()
+            for i, base_rid in enumerate(tail["base_rid"]):
+                if tail["rid"][i] != -1 and base_rid in base_rids and base_rid not in seen:
+                    seen.add(base_rid)
+                    older.append((base_rid, tail["rid"][i], tail["indirection"][i]))
+
+        ends = {}
+        for base_rid, tail_rid, indirection in older:
+            # records merges skipped before (while a transaction held them) have chains below this merge
+            while indirection >= 0:
+                tail_rid = indirection
+                page_idx, rec_idx = divmod(tail_rid, Config.PAGE_CAPACITY)
+                with self.page_directory.pinned_page(page_idx, "Tail", [Config.INDIRECTION_COLUMN]) as tail_page:
+                    if tail_page is None:
+                        break
+                    indirection = tail_page.physical_pages[Config.INDIRECTION_COLUMN].read(rec_idx)
+            # a chain already linked to a snapshot (merged again after a restart) keeps it
+            if indirection == -1:
+                ends[base_rid] = tail_rid
+        return ends
+
+    def _read_tail_columns(self, start, end):
+        # tail records [start, end) as column slices, one pinned read per tail page:
+        # {"rid": [...], "indirection": [...], "base_rid": [...], "schema": [...], "columns": [[...] per user column]}
+        physical_columns = [Config.INDIRECTION_COLUMN, Config.RID_COLUMN, Config.SCHEMA_ENCODING_COLUMN, Config.BASE_RID_COLUMN] + \
+            [col_idx + Config.USER_COLUMN_START for col_idx in range(self.num_columns)]
+        slices = {column: [] for column in physical_columns}
+        for tail_page_idx in range(start // Config.PAGE_CAPACITY, math.ceil(end / Config.PAGE_CAPACITY)):
+            page_start = tail_page_idx * Config.PAGE_CAPACITY
+            with self.page_directory.pinned_page(tail_page_idx, "Tail", physical_columns) as tail_page:
+                if tail_page is None:
+                    continue
+                first = max(start - page_start, 0)
+                last = min(end - page_start, tail_page.num_records)
+                for column in physical_columns:
+                    # copied, the page may change once it is unpinned
+                    values = tail_page.physical_pages[column].column_slice(first, last)
+                    slices[column].append(values.copy() if hasattr(values, "copy") else values.tolist())
+
+        def concat(parts):
+            if np is not None and Config.USE_NUMPY:
+                return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            return [value for part in parts for value in part]
 
-        # reverse order of tail pages to merge from latest to oldest
-        merge_tail_page_indices = list(range(num_tail_pages))
-        merge_tail_page_indices.reverse() # [N, N-1, ... 0]
-        # create a list to hold base page copies for each column
-        base_page_copies = [{} for _ in range(self.num_columns)]
-        
-        # record RIDs that have been consolidated
-        consolidated_rids = set()
+        return {
+            "rid": concat(slices[Config.RID_COLUMN]),
+            "indirection": concat(slices[Config.INDIRECTION_COLUMN]),
+            "base_rid": concat(slices[Config.BASE_RID_COLUMN]),
+            "schema": concat(slices[Config.SCHEMA_ENCODING_COLUMN]),
+            "columns": [concat(slices[col_idx + Config.USER_COLUMN_START]) for col_idx in range(self.num_columns)],
+        }
 
-        # for each column, process all tail pages
-        for col_idx in range(self.num_columns):
-            updated_in_this_col = set() # record RIDs that have been updated in this column
+    def get_stats(self):
+        # buffer hits/misses/evictions, resident pages and disk I/O, by page type (Base/Tail)
+        stats = {
+            "num_base_records": self.page_directory.num_base_records,
+            "num_tail_records": self.page_directory.num_tail_records,
+            "storage_engine": self.storage_engine,
+            "merged_tail_records": self.page_directory.merged_tail_records,
+            "version_reads": self.page_directory.get_read_stats(),
+            "tail_reclaim": dict(self.page_directory.reclaim_stats, retired=len(self.page_directory.retired_tail_pages)),
+            "merge": dict(self.merge_scheduler.stats),
+        }
+        stats.update(self.page_directory.get_stats())
+        return stats
 
-            for tail_page_idx in merge_tail_page_indices:
-                # Load Tail Page
-                tail_page = self.page_directory.Buffer.get(tail_page_idx, "Tail")
-                if tail_page is None:
-                    tail_page = self.page_directory.load_one_tail_page_from_disk(tail_page_idx)
-                if tail_page is None: continue
-
-                # Get physical page data
-                tail_col_data = tail_page.get_a_page(col_idx + Config.USER_COLUMN_START)
-                tail_base_rids = tail_page.get_a_page(Config.BASE_RID_COLUMN)
-                tail_schemas = tail_page.get_a_page(Config.SCHEMA_ENCODING_COLUMN)
-
-                # Traverse records in reverse order (ensure latest records are processed first)
-                for rec_idx in range(tail_col_data.num_items - 1, -1, -1):
-                    base_rid = tail_base_rids.read(rec_idx)
-
-                    # If the RID for this column is already the latest value, skip old updates
-                    if base_rid in updated_in_this_col:
-                        continue
-
-                    # Check Schema to confirm if the Tail Record has updated the current column
-                    schema_val = tail_schemas.read(rec_idx)
-                    if (schema_val >> col_idx) & 1:
-                        # Load or get Base Page copy
-                        base_page_idx = base_rid // Config.PAGE_CAPACITY
-                        if base_page_idx not in base_page_copies[col_idx]:
-                            base_page = self.page_directory.Buffer.get(base_page_idx, "Base")
-                            if base_page is None:
-                                base_page = self.page_directory.load_one_base_page_from_disk(base_page_idx)
-                            
-                            if base_page is None:
-                                continue
-                            
-                            base_page_copies[col_idx][base_page_idx] = copy.deepcopy(base_page.physical_pages[col_idx + Config.USER_COLUMN_START])
-
-                        # Update Base Page copy with Tail value
-                        base_rec_idx = base_rid % Config.PAGE_CAPACITY
-                        val = tail_col_data.read(rec_idx)
-                        base_page_copies[col_idx][base_page_idx].update(base_rec_idx, val)
-                        
-                        # tag the RID as updated in this column
-                        updated_in_this_col.add(base_rid)
-                        consolidated_rids.add(base_rid)
-
-        for col_idx in range(self.num_columns):
-            for base_page_idx, phy_page in base_page_copies[col_idx].items():
-                base_page = self.page_directory.Buffer.get(base_page_idx, "Base")
-                if base_page:
-                     base_page.physical_pages[col_idx + Config.USER_COLUMN_START] = phy_page
-
-        # reset indirection and schema encoding for consolidated RIDs
-        for rid in consolidated_rids:
-            page_idx = rid // Config.PAGE_CAPACITY
-            rec_idx = rid % Config.PAGE_CAPACITY
-            
-            # Indirection -> -1 (the base record is now the latest)
-            self.page_directory.update_base_indirection(page_idx, rec_idx, -1)
-            # Schema -> 0 (no Tail Update)
-            self.page_directory.update_base_schema_encoding(page_idx, rec_idx, 0)
-                    
+    def reset_stats(self):
+        self.page_directory.reset_stats()
 
     # close function for Table class
     def close(self):
-        self.is_merging = False # close the thread
-        if self.merge_thread:
-            self.merge_thread.join()
-        # save all records
+        self.merge_scheduler.stop() # close the thread
+        # save all records, then the indexes that describe them
         self.page_directory.save_to_disk()
+        self.index.save()
         pass
     
     # TODO: Write the following rollback logic
@@ -760,11 +1215,12 @@ class Table:
 
     
     
-    def rollback_update(self, rid, old_indirection, old_primary_key=None):
+    def rollback_update(self, rid, old_indirection, old_primary_key=None, index_changes=None):
         """
         Undoes an update operation.
         1. Locates the base record using RID.
         2. Reverts the INDIRECTION column to point to 'old_indirection'.
+        3. Moves the RID back to the old values of the indexed columns the update changed.
         """
         # Yanliang's Modification here: We only restore indirection here, leaving newly created tail records
         # New design here:
@@ -780,8 +1236,9 @@ class Table:
         
         new_tail_rid = record['indirection']
         
-        # Restore indirection
+        # Restore indirection, the old values may be outside a zone map computed since the update
         self.page_directory.update_base_indirection(page_idx, record_idx, old_indirection)
+        self.page_directory.drop_zone(page_idx)
         
         # Mark new tail record as ineffective (RID => -1)
         if new_tail_rid != -1 and new_tail_rid != old_indirection:
@@ -796,9 +1253,16 @@ class Table:
                     Config.RID_COLUMN, 
                     -1
                 )
+                # no chain leads to it any more
+                self.page_directory.retire_tail_records([new_tail_rid])
+
+        # Restore the indexed values, (column, old value, new value) as recorded by Query.update
+        if index_changes is not None:
+            for column, old_value, new_value in reversed(index_changes):
+                self.index.move_value(column, new_value, old_value, rid)
 
         # Restore index only when the primary key changes
-        if old_primary_key is not None:
+        elif old_primary_key is not None:
             current_primary_key = record['columns'][self.key]
             if old_primary_key != current_primary_key:
                 # Remove new
@@ -836,4 +1300,69 @@ class Table:
                 self.key_to_rid[key_value] = rid
         else:
             self.key_to_rid[key_value] = rid
-            
\ No newline at end of file
+            
+
+def snapshot_link(tail_rid):
+    # The chain of a record a merge has changed ends in a link to the snapshot of its original values
+    # instead of -1: -tail_rid - 2, below -1 so readers of the latest version stop there as well. The
+    # same function turns a link back into the tail rid.
+    return -tail_rid - 2
+
+def _latest_tail_values_numpy(tail, num_columns, skip=()):
+    # Merge kernel over the tail columns as arrays. Returns
+    #   merged:       per user column, base page index -> (record indices, newest value of each)
+    #   consolidated: base page index -> (record indices, newest tail rid of each)
+    # Rolled back tail records (rid -1), ones without a base rid and the ones of base records in skip are
+    # left out, for each base record and column the newest tail record whose schema has the column's bit wins.
+    valid = (tail["rid"] != -1) & (tail["base_rid"] >= 0)
+    if skip:
+        valid &= ~np.isin(tail["base_rid"], np.fromiter(skip, dtype=np.int64, count=len(skip)))
+    merged = []
+    for col_idx in range(num_columns):
+        selected = np.flatnonzero(valid & (((tail["schema"] >> col_idx) & 1) == 1))
+        base_rids = tail["base_rid"][selected][::-1]
+        # first occurrence in the reversed order = newest tail record
+        base_rids, newest = np.unique(base_rids, return_index=True)
+        merged.append(_by_base_page(base_rids, tail["columns"][col_idx][selected][::-1][newest]))
+
+    selected = np.flatnonzero(valid)
+    base_rids, newest = np.unique(tail["base_rid"][selected][::-1], return_index=True)
+    consolidated = _by_base_page(base_rids, tail["rid"][selected][::-1][newest])
+    return merged, consolidated
+
+def _by_base_page(base_rids, values):
+    # sorted base rids and their values -> base page index -> (record indices, values) as python lists
+    pages = base_rids // Config.PAGE_CAPACITY
+    page_indices, bounds = np.unique(pages, return_index=True)
+    bounds = list(bounds) + [len(base_rids)]
+    rec_indices = (base_rids % Config.PAGE_CAPACITY).tolist()
+    values = values.tolist()
+    return {
+        int(page_idx): (rec_indices[bounds[i]:bounds[i + 1]], values[bounds[i]:bounds[i + 1]])
+        for i, page_idx in enumerate(page_indices)
+    }
+
+def _latest_tail_values(tail, num_columns, skip=()):
+    # same as _latest_tail_values_numpy, over python lists (newest tail record first)
+    merged = [{} for _ in range(num_columns)]
+    consolidated = {}
+    seen = [set() for _ in range(num_columns)]
+    seen_any = set()
+    for i in range(len(tail["rid"]) - 1, -1, -1):
+        base_rid = tail["base_rid"][i]
+        if tail["rid"][i] == -1 or base_rid < 0 or base_rid in skip:
+            continue
+        page_idx, rec_idx = divmod(base_rid, Config.PAGE_CAPACITY)
+        schema = tail["schema"][i]
+        for col_idx in range(num_columns):
+            if (schema >> col_idx) & 1 and base_rid not in seen[col_idx]:
+                seen[col_idx].add(base_rid)
+                rec_indices, values = merged[col_idx].setdefault(page_idx, ([], []))
+                rec_indices.append(rec_idx)
+                values.append(tail["columns"][col_idx][i])
+        if base_rid not in seen_any:
+            seen_any.add(base_rid)
+            rec_indices, tail_rids = consolidated.setdefault(page_idx, ([], []))
+            rec_indices.append(rec_idx)
+            tail_rids.append(tail["rid"][i])
+    return merged, consolidated
@@ -71,7 +71,8 @@ class Transaction:
                     rid = rollback_data['rid']
                     old_indirection = rollback_data['old_indirection']
                     old_primary_key = rollback_data.get('old_primary_key', None)
-                    table.rollback_update(rid, old_indirection, old_primary_key)
+                    index_changes = rollback_data.get('index_changes', None)
+                    table.rollback_update(rid, old_indirection, old_primary_key, index_changes)
                     
                 elif op_type == 'delete':
                     rid = rollback_data['rid']
@@ -80,6 +81,11 @@ class Transaction:
             except Exception as e:
                 print(f"Rollback error: {op_type} on rid {rollback_data.get('rid')}: {e}")
         
+        # no need to wait, recovery treats a transaction without commit record as aborted
+        if self.operations_log:
+            for wal in self._wals():
+                wal.abort(self.transaction_id)
+
         # Strong Strict 2PL: Release ALL locks at abort
         for table in self.tables:
             table.lock_manager.release_all_locks(self.transaction_id)
@@ -88,6 +94,17 @@ class Transaction:
         return False
     
     def commit(self):
+        # Durable before anything becomes visible: the commit record is fsynced (together with the
+        # commits of concurrent transactions) before the locks are released. Read-only transactions skip it.
+        if self.operations_log:
+            for wal in self._wals():
+                wal.commit(self.transaction_id)
+
+        # deleted records are gone for good, while their locks are held no merge or read gets to them
+        for table, op_type, rollback_data in self.operations_log:
+            if op_type == 'delete':
+                table.retire_deleted(rollback_data['rid'])
+
         # Release all locks once sucess
         for table in self.tables:
             table.lock_manager.release_all_locks(self.transaction_id)
@@ -97,4 +114,15 @@ class Transaction:
     
     def log_operation(self, table, op_type, rollback_data):
         # Log operation for potential rollback.
-        self.operations_log.append((table, op_type, rollback_data))
\ No newline at end of file
+        self.operations_log.append((table, op_type, rollback_data))
+        # queries run with transaction= directly (not through add_query) release their locks too
+        self.tables.add(table)
+
+    def _wals(self):
+        # write-ahead logs of the tables involved, tables of one database share theirs
+        wals = []
+        for table in self.tables:
+            wal = getattr(table, "wal", None)
+            if wal is not None and wal not in wals:
+                wals.append(wal)
+        return wals
@@ -0,0 +1,254 @@
+"""
+Write-ahead log shared by the tables of a database, <db path>/wal.log.<start lsn>.
+
+Queries append a record for every change they make to base or tail pages (insert, update,
+delete) before they make it, inside a change() block, merges one for each snapshot of original
+values they write (snapshot), Transaction.commit appends a commit
+record and waits until it is on disk. Records
+carry the id of their transaction, None for queries that run outside of a transaction
+(those count as committed on their own).
+
+Each record is a header (payload length, crc32 of the payload) followed by a JSON payload.
+The LSN of a record is its log offset just past its end. The log is split into segment files
+named after the LSN they start at, a new segment is started once the current one exceeds
+Config.WAL_SEGMENT_BYTES. A checkpoint records the LSN recovery has to start from, the segments
+that end before it are deleted (truncate()).
+
+Group commit: appends only go to an in-memory buffer. The first committer that finds its
+record not yet durable becomes the leader, writes out everything buffered so far and fsyncs
+once; committers that arrive meanwhile wait and are covered by the next leader's fsync.
+"""
+
+import os
+import json
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from time import sleep
+from lstore.config import Config
+
+HEADER = struct.Struct("<II")
+
+DATA_OPS = ("insert", "update", "delete")
+
+class WriteAheadLog:
+
+    def __init__(self, path, group_commit_delay=None, segment_bytes=None):
+        self.path = path
+        # seconds a leader waits for more commits to join its fsync
+        self.group_commit_delay = Config.WAL_GROUP_COMMIT_DELAY if group_commit_delay is None else group_commit_delay
+        self.segment_bytes = segment_bytes or Config.WAL_SEGMENT_BYTES
+
+        # a log from before segments becomes the first segment
+        if os.path.exists(path):
+            os.replace(path, self._segment_path(0))
+        # [(start lsn, file path)] in log order
+        self.segments = self._list_segments() or [(0, self._segment_path(0))]
+
+        # A record torn by a crash is cut off, new records must follow the last complete one
+        start, segment_path = self.segments[-1]
+        self.fd = os.open(segment_path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        length = 0
+        for offset, _ in _scan(_read_file(segment_path)):
+            length = offset
+        if os.fstat(self.fd).st_size > length:
+            os.ftruncate(self.fd, length)
+
+        # records appended but not yet written
+        self.buffer = bytearray()
+        # LSN past the last appended record, and past the last record known to be on disk
+        self.end_lsn = start + length
+        self.durable_lsn = self.end_lsn
+        self.syncing = False
+        self.cond = threading.Condition()
+
+        # transactions with logged changes but no commit / abort record yet -> LSN of their first record
+        self.active = {}
+        # change() blocks running -> log end when they began: their records may be logged while the
+        # pages do not have the change yet
+        self.changing = {}
+
+        self.stats = {"records": 0, "commits": 0, "fsyncs": 0, "bytes": 0, "checkpoints": 0, "truncated_segments": 0}
+
+    def _segment_path(self, start_lsn):
+        return f"{self.path}.{start_lsn:020d}"
+
+    def _list_segments(self):
+        directory, name = os.path.split(self.path)
+        segments = []
+        for file_name in os.listdir(directory or "."):
+            suffix = file_name[len(name) + 1:]
+            if file_name.startswith(name + ".") and suffix.isdigit():
+                segments.append((int(suffix), os.path.join(directory, file_name)))
+        return sorted(segments)
+
+    def append(self, record):
+        # returns the LSN of the record
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        data = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.cond:
+            txn = record.get("txn")
+            if txn is not None:
+                if record["op"] in DATA_OPS:
+                    self.active.setdefault(txn, self.end_lsn)
+                else:
+                    self.active.pop(txn, None)
+            self.buffer += data
+            self.end_lsn += len(data)
+            self.stats["records"] += 1
+            self.stats["bytes"] += len(data)
+            return self.end_lsn
+
+    def log_insert(self, table, txn, rid, timestamp, columns):
+        return self.append({"op": "insert", "table": table, "txn": txn, "rid": rid, "ts": timestamp, "columns": list(columns)})
+
+    def log_update(self, table, txn, rid, tail_rid, indirection, timestamp, schema, base_rid, columns, old_schema):
+        # tail record as appended, plus the base schema it replaced (the old indirection is the tail's)
+        return self.append({
+            "op": "update", "table": table, "txn": txn, "rid": rid, "tail_rid": tail_rid,
+            "indirection": indirection, "ts": timestamp, "schema": schema, "base_rid": base_rid,
+            "columns": list(columns), "old_schema": old_schema,
+        })
+
+    def log_snapshot(self, table, rid, tail_rid, timestamp, columns, link):
+        # original values of a record written by a merge, linked from the oldest tail record of its chain
+        return self.append({
+            "op": "snapshot", "table": table, "txn": None, "rid": rid, "tail_rid": tail_rid,
+            "ts": timestamp, "columns": list(columns), "link": link,
+        })
+
+    def log_delete(self, table, txn, rid):
+        return self.append({"op": "delete", "table": table, "txn": txn, "rid": rid})
+
+    def commit(self, txn):
+        # durable once this returns
+        lsn = self.append({"op": "commit", "txn": txn})
+        with self.cond:
+            self.stats["commits"] += 1
+        self.flush(lsn)
+        return lsn
+
+    def abort(self, txn):
+        # the rollback already ran, recovery treats the transaction as uncommitted either way
+        return self.append({"op": "abort", "txn": txn})
+
+    @contextmanager
+    def change(self):
+        # a change is logged and then applied to the pages inside the block (write-ahead): a
+        # checkpoint begun meanwhile starts no later than its record
+        token = object()
+        with self.cond:
+            self.changing[token] = self.end_lsn
+        try:
+            yield
+        finally:
+            with self.cond:
+                del self.changing[token]
+
+    def begin_checkpoint(self):
+        # LSN recovery has to start from once the pages written after this call are on disk: the end
+        # of the log, the first record of a transaction still running (it may have to be undone), or
+        # the record of a change not applied yet
+        with self.cond:
+            return min([self.end_lsn] + list(self.active.values()) + list(self.changing.values()))
+
+    def end_checkpoint(self, checkpoint_lsn):
+        # pages and metadata cover everything logged before checkpoint_lsn, older segments can go
+        lsn = self.append({"op": "checkpoint", "lsn": checkpoint_lsn})
+        self.flush(lsn)
+        with self.cond:
+            self.stats["checkpoints"] += 1
+        self.truncate(checkpoint_lsn)
+        return lsn
+
+    def truncate(self, lsn):
+        # delete the segments that end at or before lsn, the current segment always stays
+        with self.cond:
+            while len(self.segments) > 1 and self.segments[1][0] <= lsn:
+                _, segment_path = self.segments.pop(0)
+                os.remove(segment_path)
+                self.stats["truncated_segments"] += 1
+
+    def size(self):
+        # bytes of log kept on disk (or buffered)
+        with self.cond:
+            return self.end_lsn - self.segments[0][0]
+
+    def flush(self, lsn=None):
+        # wait until every record up to lsn (all appended records if None) is on disk
+        with self.cond:
+            if lsn is None:
+                lsn = self.end_lsn
+            while self.durable_lsn < lsn:
+                if self.syncing:
+                    self.cond.wait()
+                    continue
+
+                # become the leader for everything buffered so far
+                self.syncing = True
+                if self.group_commit_delay:
+                    self.cond.release()
+                    sleep(self.group_commit_delay)
+                    self.cond.acquire()
+                data, self.buffer = self.buffer, bytearray()
+                target = self.end_lsn
+                self.cond.release()
+                try:
+                    _write_all(self.fd, data)
+                    os.fsync(self.fd)
+                    # the next records go to a new segment once this one is full
+                    if target - self.segments[-1][0] >= self.segment_bytes:
+                        self._roll(target)
+                finally:
+                    self.cond.acquire()
+                    self.syncing = False
+                    self.cond.notify_all()
+                self.durable_lsn = target
+                self.stats["fsyncs"] += 1
+
+    def _roll(self, start_lsn):
+        # called by the flush leader, the only thread that writes to self.fd
+        segment_path = self._segment_path(start_lsn)
+        fd = os.open(segment_path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        old_fd, self.fd = self.fd, fd
+        with self.cond:
+            self.segments.append((start_lsn, segment_path))
+        os.close(old_fd)
+
+    def records(self, from_lsn=0):
+        # every complete record on disk that starts at or after from_lsn (a record boundary),
+        # in log order, as (lsn, record)
+        self.flush()
+        with self.cond:
+            segments = list(self.segments)
+        for i, (start, segment_path) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= from_lsn:
+                continue
+            for offset, payload in _scan(_read_file(segment_path), max(0, from_lsn - start)):
+                yield start + offset, json.loads(payload)
+
+    def close(self):
+        self.flush()
+        os.close(self.fd)
+        self.fd = None
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _scan(data, offset=0):
+    # (offset past the record, payload) of each complete record, a torn or corrupt record ends the log
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        payload = data[offset + HEADER.size:offset + HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        offset += HEADER.size + length
+        yield offset, payload
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
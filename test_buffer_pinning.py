@@ -0,0 +1,52 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+def test_pinned_page_not_evicted():
+    print("\n[TEST] Starting Buffer Pinning Test...")
+    path = "./TestBufferPinning"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    # room for two pages of 3 + 5 physical columns
+    db = Database(path, buffer_pool_bytes=16 * Config.PAGE_SIZE)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(Config.PAGE_CAPACITY):
+        query.insert(key, key, 0)
+    page_range = table.page_directory
+    pool = db.buffer_pool
+
+    pin_key = (page_range.Buffer, "Base", 0)
+    with page_range.pinned_page(0, "Base") as page:
+        assert pool.pins[pin_key] >= 1
+        # inserts and reads of other pages push the unpinned frames out, the pinned page keeps all
+        # of its columns
+        for key in range(Config.PAGE_CAPACITY, 10 * Config.PAGE_CAPACITY):
+            query.insert(key, key, 0)
+        for key in range(Config.PAGE_CAPACITY, 10 * Config.PAGE_CAPACITY, 50):
+            assert query.select(key, 0, [1, 1, 1])[0].columns == [key, key, 0]
+        stats = table.get_stats()["Base"]
+        print("evictions while pinned:", stats["evictions"])
+        assert stats["evictions"] > 0
+        assert page_range.Buffer.base_cache.get(0) is page
+        assert all(physical_page is not None for physical_page in page.physical_pages)
+        assert page.physical_pages[Config.USER_COLUMN_START + 1].read(7) == 7
+
+    # unpinned, it is an ordinary page again
+    assert pin_key not in pool.pins
+    for key in range(Config.PAGE_CAPACITY, 10 * Config.PAGE_CAPACITY, 50):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, key, 0]
+    assert 0 not in page_range.Buffer.base_cache
+    assert pool.get_stats()["used_frames"] <= pool.capacity
+    assert query.select(7, 0, [1, 1, 1])[0].columns == [7, 7, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Buffer Pinning Test Completed.\n")
+
+if __name__ == "__main__":
+    test_pinned_page_not_evicted()
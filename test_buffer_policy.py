@@ -0,0 +1,31 @@
+from lstore.cache_policy import REPLACEMENT_POLICIES
+
+def test_buffer_policy_scan_resistance():
+    print("\n[TEST] Starting Buffer Policy Test...")
+    not_pinned = lambda frame: False
+
+    # CLOCK only gives referenced frames a second chance, so its scan is shorter than a revolution
+    for name, scan_length in [("clock", 8), ("2q", 20), ("lru-k", 20)]:
+        policy = REPLACEMENT_POLICIES[name](8)
+        # hot frames are referenced twice
+        for frame in range(4):
+            policy.admit(frame)
+            policy.hit(frame)
+
+        # a scan reads each of its frames once
+        for frame in range(100, 100 + scan_length):
+            policy.admit(frame)
+            while len(policy) > 8:
+                assert policy.victim(not_pinned) >= 100, name
+
+        assert all(frame in policy for frame in range(4)), name
+
+        # pinned frames are never picked
+        pinned = lambda frame: frame != 3
+        assert policy.victim(pinned) == 3, name
+        assert policy.victim(lambda frame: True) is None, name
+
+    print("[TEST] Buffer Policy Test Completed.\n")
+
+if __name__ == "__main__":
+    test_buffer_policy_scan_resistance()
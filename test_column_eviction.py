@@ -0,0 +1,51 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+def test_partial_column_eviction():
+    print("\n[TEST] Starting Column Eviction Test...")
+    path = "./TestColumnEviction"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(4 * Config.PAGE_CAPACITY):
+        query.insert(key, key * 2, key * 3)
+    db.close()
+
+    # room for 16 column pages: projected reads of the other pages push out the columns of the first
+    # that the projection does not touch, the page stays cached with the ones it reads
+    db = Database(path, buffer_pool_bytes=16 * Config.PAGE_SIZE)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert query.update(5, None, None, 99)
+    for key in list(range(Config.PAGE_CAPACITY, 4 * Config.PAGE_CAPACITY, Config.PAGE_CAPACITY)) + [0]:
+        assert query.select(key, 0, [0, 1, 0])[0].columns == [key * 2]
+    page = table.page_directory.Buffer.base_cache[0]
+    loaded = [physical_page is not None for physical_page in page.physical_pages]
+    print("columns of page 0 still loaded:", loaded)
+    assert loaded[Config.USER_COLUMN_START + 1] and not loaded[Config.USER_COLUMN_START + 2]
+    assert table.get_stats()["Base"]["evictions"] > 0
+
+    # the record reads back whole, evicted columns come from disk, the updated one from its tail record
+    assert query.select(5, 0, [1, 1, 1])[0].columns == [5, 10, 99]
+    assert query.select(6, 0, [1, 1, 1])[0].columns == [6, 12, 18]
+    db.close()
+
+    db = Database(path)
+    db.open(path)
+    query = Query(db.get_table('Grades'))
+    assert query.select(5, 0, [1, 1, 1])[0].columns == [5, 10, 99]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Column Eviction Test Completed.\n")
+
+if __name__ == "__main__":
+    test_partial_column_eviction()
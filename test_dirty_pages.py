@@ -0,0 +1,63 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+def test_clean_pages_not_rewritten():
+    print("\n[TEST] Starting Dirty Page Write Back Test...")
+    path = "./TestDirtyPages"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    # two base pages of 3 + 5 physical columns
+    for key in range(1000):
+        query.insert(key, 0, 0)
+    table.page_directory.save_to_disk()
+    indirection = table.page_directory.Buffer.base_cache[0].physical_pages[Config.INDIRECTION_COLUMN]
+    assert not indirection.dirty
+
+    # reads leave every page clean, the next save writes nothing
+    db.reset_stats()
+    for key in range(1000):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, 0, 0]
+    table.page_directory.save_to_disk()
+    stats = table.get_stats()["Base"]
+    print("after reads:", stats["pages_written"], "written,", stats["pages_skipped"], "skipped")
+    assert stats["pages_written"] == 0
+    assert stats["pages_skipped"] == 16 and stats["bytes_skipped"] == 16 * Config.PAGE_SIZE
+
+    # an update dirties the indirection and schema encoding columns of one base page, and the new tail page
+    db.reset_stats()
+    assert query.update(5, None, 1, None)
+    assert indirection.dirty
+    table.page_directory.save_to_disk()
+    assert not indirection.dirty
+    stats = table.get_stats()
+    print("after one update:", stats["Base"]["pages_written"], "base and", stats["Tail"]["pages_written"], "tail pages written")
+    assert stats["Base"]["pages_written"] == 2 and stats["Base"]["pages_skipped"] == 14
+    assert stats["Tail"]["pages_written"] == 3 + 5
+    db.close()
+
+    # clean pages pushed out of a small buffer are dropped without a write
+    db = Database(path, buffer_pool_bytes=8 * Config.PAGE_SIZE)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    db.reset_stats()
+    for key in range(1000):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, 1 if key == 5 else 0, 0]
+    stats = table.get_stats()
+    assert stats["Base"]["evictions"] + stats["Tail"]["evictions"] > 0
+    assert stats["Base"]["pages_written"] == stats["Tail"]["pages_written"] == 0
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Dirty Page Write Back Test Completed.\n")
+
+if __name__ == "__main__":
+    test_clean_pages_not_rewritten()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import threading
+import time
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.flusher import PageFlusher
+from lstore.query import Query
+
+class SlowPageRange:
+    # stands in for a PageRange, writes wait until release is set
+    def __init__(self):
+        self.release = threading.Event()
+        self.events = []
+
+    def flush_log(self):
+        self.events.append("log")
+
+    def flush_pending(self, page_idx, column_idx, physical_page, page_type):
+        self.release.wait()
+        self.events.append(page_idx)
+
+def test_flusher_back_pressure_and_barrier():
+    print("\n[TEST] Starting Page Flusher Test...")
+    page_range = SlowPageRange()
+    flusher = PageFlusher(queue_size=2, batch_size=1)
+
+    # the writer holds one page, the queue takes two more, the fourth submit blocks
+    submitted = []
+    def submit_pages():
+        for page_idx in range(4):
+            flusher.submit(page_range, page_idx, 0, None, "Base")
+            submitted.append(page_idx)
+    submitter = threading.Thread(target=submit_pages, daemon=True)
+    submitter.start()
+    time.sleep(0.2)
+    print("submitted while the writer is stuck:", submitted)
+    assert submitted == [0, 1, 2]
+    assert submitter.is_alive() and flusher.queue.full()
+
+    # the barrier returns once every page is written, the log is flushed before each batch (of one page)
+    page_range.release.set()
+    submitter.join(5)
+    assert not submitter.is_alive()
+    flusher.flush()
+    assert page_range.events == ["log", 0, "log", 1, "log", 2, "log", 3]
+    assert flusher.queue.unfinished_tasks == 0
+
+    # with a table: evicted dirty pages are queued, after the barrier none is waiting and the disk
+    # copies are current
+    path = "./TestFlusher"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path, buffer_pool_bytes=16 * Config.PAGE_SIZE)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(5000):
+        query.insert(key, key, 0)
+    db.flusher.flush()
+    assert table.page_directory.pending_writes == {}
+    assert table.get_stats()["Base"]["evictions"] > 0
+    for key in range(0, 5000, 97):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, key, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Page Flusher Test Completed.\n")
+
+if __name__ == "__main__":
+    test_flusher_back_pressure_and_barrier()
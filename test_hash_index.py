@@ -0,0 +1,104 @@
+import os
+import pickle
+import shutil
+import threading
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.index import HashIndex
+from lstore.query import Query
+
+def test_hash_index_operations():
+    print("\n[TEST] Starting Hash Index Test...")
+    index = HashIndex(segments=4)
+    for key in range(5000):
+        index.add(key * 3 - 7000, key, "Base")
+    # tail rids are not indexed
+    index.add(5, 99, "Tail")
+    assert len(index) == 5000
+    assert index.get(-7000) == [[0], []]
+    assert index.get(-6999) is None
+
+    # several rids under one key, removed one at a time
+    index.add(-7000, 6000, "Base")
+    index.add(-7000, 6001, "Base")
+    assert index.get(-7000) == [[0, 6000, 6001], []]
+    assert index.remove_rid(-7000, 6000)
+    assert not index.remove_rid(-7000, 6000)
+    assert index.get(-7000) == [[0, 6001], []]
+
+    # deleted slots are reused and skipped by lookups
+    for key in range(0, 5000, 2):
+        assert index.remove_rid(key * 3 - 7000, key)
+    assert index.get(-7000 + 6) is None
+    assert index.get(-7000 + 3) == [[1], []]
+    index.add(-7000 + 6, 7000, "Base")
+    assert index.get(-7000 + 6) == [[7000], []]
+
+    # ranges scan the keys
+    assert index.value_in_range(-6999, -6990) == [[[1], []], [[7000], []], [[3], []]]
+    assert [k for k, _ in index.items()] == sorted(k for k, _ in index.items())
+
+    # survives pickling (Index.save)
+    copy = pickle.loads(pickle.dumps(index))
+    assert list(copy.items()) == list(index.items())
+    copy.add(10 ** 12, 1, "Base")
+    assert copy.get(10 ** 12) == [[1], []]
+
+    # concurrent inserts on distinct keys
+    index = HashIndex()
+    def worker(thread_id):
+        for i in range(2000):
+            index.add(thread_id * 100000 + i, i, "Base")
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(index) == 16000
+    assert all(index.get(t * 100000 + 1999) == [[1999], []] for t in range(8))
+    print("[TEST] Hash Index Test Completed.\n")
+
+def test_hash_key_index_table():
+    print("\n[TEST] Starting Hash Key Index Table Test...")
+    path = "./TestHashIndex"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    key_index_type = Config.KEY_INDEX_TYPE
+    Config.KEY_INDEX_TYPE = "hash"
+    try:
+        db = Database(path)
+        db.open(path)
+        table = db.create_table('Grades', 3, 0)
+        assert isinstance(table.index.indices[0], HashIndex)
+        table.index.create_index(2, kind="hash")
+        query = Query(table)
+        for key in range(1000):
+            query.insert(key, key % 10, key % 4)
+        assert query.update(7, None, None, 9)
+        assert query.update(8, 2008, None, None)
+        assert query.delete(9)
+
+        assert query.select(7, 0, [1, 1, 1])[0].columns == [7, 7, 9]
+        assert query.select(9, 0, [1, 1, 1]) == []
+        assert query.select(8, 0, [1, 1, 1]) == []
+        assert query.select(2008, 0, [1, 1, 1])[0].columns == [2008, 8, 0]
+        assert [r.columns[0] for r in query.select(9, 2, [1, 1, 1])] == [7]
+        assert query.sum(0, 10, 1) == sum(key % 10 for key in range(11) if key not in (8, 9))
+        db.close()
+
+        # saved and loaded as a hash index
+        db = Database(path)
+        db.open(path)
+        table = db.get_table('Grades')
+        assert isinstance(table.index.indices[0], HashIndex)
+        assert Query(table).select(2008, 0, [1, 1, 1])[0].columns == [2008, 8, 0]
+        db.close()
+    finally:
+        Config.KEY_INDEX_TYPE = key_index_type
+    shutil.rmtree(path)
+    print("[TEST] Hash Key Index Table Test Completed.\n")
+
+if __name__ == "__main__":
+    test_hash_index_operations()
+    test_hash_key_index_table()
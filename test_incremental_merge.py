@@ -0,0 +1,256 @@
+import os
+import random
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore import table as table_module
+
+def tail_page_reads(table):
+    stats = table.get_stats()["Tail"]
+    return stats["hits"] + stats["misses"]
+
+def base_columns(table, rid):
+    # values stored in the base record itself, without following its tail records
+    record = table.page_directory.read_base_record(rid // Config.PAGE_CAPACITY, rid % Config.PAGE_CAPACITY)
+    return record['indirection'], record['columns']
+
+def test_incremental_merge():
+    print("\n[TEST] Starting Incremental Merge Test...")
+    path = "./TestIncrementalMerge"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, 0, 0)
+
+    # several tail pages of updates, merged into the base records
+    for i in range(4 * Config.PAGE_CAPACITY):
+        assert query.update(i % 1000, None, i, None)
+    table.merge()
+    # the watermark moves past the snapshots of the 1000 records as inserted, appended by the merge
+    assert table.page_directory.merged_tail_records == 4 * Config.PAGE_CAPACITY + 1000
+    assert base_columns(table, 5) == (-1, [5, 2005, 0])
+    assert query.select(5, 0, [1, 1, 1])[0].columns == [5, 2005, 0]
+
+    # nothing new, nothing to read
+    table.reset_stats()
+    table.merge()
+    assert tail_page_reads(table) == 0
+
+    # a few new updates: only the tail page after the watermark is read
+    for key in range(10):
+        assert query.update(key, None, None, key + 1)
+    table.reset_stats()
+    table.merge()
+    print("tail page reads for 10 new updates:", tail_page_reads(table))
+    assert 0 < tail_page_reads(table) <= 4 * Config.USER_COLUMN_START
+    assert base_columns(table, 5) == (-1, [5, 2005, 6])
+    assert base_columns(table, 500) == (-1, [500, 1500, 0])
+    # the new tail records go on from the merged ones (key 5 was last updated by tail record 2005)
+    last_tail = table.page_directory.read_base_record(0, 5)['last_tail']
+    assert last_tail == 4 * Config.PAGE_CAPACITY + 1000 + 5
+    assert table.page_directory.read_tail_record(*divmod(last_tail, Config.PAGE_CAPACITY))['indirection'] == 2005
+
+    # a rolled back update is not merged
+    transaction = Transaction()
+    assert query.update(7, None, 99, None, transaction=transaction)
+    transaction.abort()
+    table.merge()
+    assert base_columns(table, 7) == (-1, [7, 2007, 8])
+    assert query.select(7, 0, [1, 1, 1])[0].columns == [7, 2007, 8]
+
+    # a record updated after the merge picked its tail records keeps its newer tail record
+    assert query.update(8, None, 77, None)
+    merged = table.page_directory.merged_tail_records
+    assert query.update(8, None, 78, None)
+    table.page_directory.num_tail_records -= 1
+    table.merge()
+    table.page_directory.num_tail_records += 1
+    assert base_columns(table, 8)[0] == merged + 1
+    assert query.select(8, 0, [1, 1, 1])[0].columns == [8, 78, 9]
+    db.close()
+
+    # the watermark survives a reopen
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert table.page_directory.merged_tail_records == merged + 1
+    table.merge()
+    assert base_columns(table, 8) == (-1, [8, 78, 9])
+    assert query.select(8, 0, [1, 1, 1])[0].columns == [8, 78, 9]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Incremental Merge Test Completed.\n")
+
+def normalized(merged, consolidated):
+    # kernel output with the records of each page in rid order
+    def pages(by_page):
+        return {page_idx: sorted(zip(*pairs)) for page_idx, pairs in by_page.items()}
+    return [pages(by_page) for by_page in merged], pages(consolidated)
+
+def test_merge_kernel_matches_reads():
+    print("\n[TEST] Starting Merge Kernel Test...")
+    path = "./TestMergeKernel"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 4, 0)
+    query = Query(table)
+    for key in range(3000):
+        query.insert(key, key, key, key)
+
+    # updates of random column subsets, merged in several steps
+    rng = random.Random(165)
+    for step in range(3):
+        for _ in range(5000):
+            columns = [None] + [rng.randrange(10 ** 6) if rng.random() < 0.5 else None for _ in range(3)]
+            assert query.update(rng.randrange(3000), *columns)
+        expected = [query.select(key, 0, [1, 1, 1, 1])[0].columns for key in range(3000)]
+
+        # both kernels pick the same values
+        tail = table._read_tail_columns(table.page_directory.merged_tail_records, table.page_directory.num_tail_records)
+        fallback = {name: (values.tolist() if name != "columns" else [c.tolist() for c in values]) for name, values in tail.items()}
+        assert normalized(*table_module._latest_tail_values_numpy(tail, 4)) == normalized(*table_module._latest_tail_values(fallback, 4))
+
+        table.merge()
+        for key in range(3000):
+            indirection, columns = base_columns(table, key)
+            assert indirection == -1 and columns == expected[key], (step, key)
+        assert [query.select(key, 0, [1, 1, 1, 1])[0].columns for key in range(3000)] == expected
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Merge Kernel Test Completed.\n")
+
+def test_merge_publishes_base_versions():
+    print("\n[TEST] Starting Merge Base Version Test...")
+    path = "./TestMergeVersions"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    # the last base page is still being appended to
+    for key in range(600):
+        query.insert(key, 0, 0)
+    for key in range(600):
+        assert query.update(key, None, key + 1, None)
+    page_directory = table.page_directory
+    old_versions = [page_directory.Buffer.get(page_idx, "Base") for page_idx in range(2)]
+
+    # an update that comes in after the merge read the tail records, before its page is published
+    publish = page_directory.publish_base_version
+    def publish_after_update(page_index, *args):
+        if page_index == 1:
+            assert query.update(550, None, None, 7)
+        return publish(page_index, *args)
+    page_directory.publish_base_version = publish_after_update
+    table.merge()
+    page_directory.publish_base_version = publish
+
+    # new versions: merged values and TPS in copies, indirection shared with the old version
+    for page_idx, old in enumerate(old_versions):
+        new = page_directory.Buffer.get(page_idx, "Base")
+        assert new is not old
+        assert new.physical_pages[Config.INDIRECTION_COLUMN] is old.physical_pages[Config.INDIRECTION_COLUMN]
+        assert old.physical_pages[Config.USER_COLUMN_START + 1].read(5) == 0
+    assert page_directory.current_base_page is page_directory.Buffer.get(1, "Base")
+    record = page_directory.read_base_record(0, 5)
+    assert record['tps'] == 5 and record['indirection'] == -1 and record['columns'] == [5, 6, 0]
+
+    # the update is not lost (its tail record follows the snapshots of the merged records), its chain
+    # stops at the merged record
+    record = page_directory.read_base_record(1, 550 - Config.PAGE_CAPACITY)
+    assert record['tps'] == 550 and record['indirection'] == 600 + 600
+    assert query.select(550, 0, [1, 1, 1])[0].columns == [550, 551, 7]
+    assert query.select_version(550, 0, [1, 1, 1], -1)[0].columns == [550, 551, 0]
+
+    # inserts keep going to the published version of the last page
+    for key in range(600, 700):
+        query.insert(key, key, key)
+    assert query.select(650, 0, [1, 1, 1])[0].columns == [650, 650, 650]
+    assert query.sum(0, 699, 1) == sum(key + 1 for key in range(600)) + sum(range(600, 700))
+    db.close()
+
+    # versions and TPS survive a reopen
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert query.select(550, 0, [1, 1, 1])[0].columns == [550, 551, 7]
+    assert query.select(5, 0, [1, 1, 1])[0].columns == [5, 6, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Merge Base Version Test Completed.\n")
+
+def check_versions_after_merge():
+    path = "./TestMergeOlderVersions"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, key, 0)
+
+    def check(versions):
+        # versions: the values of column 1 and 2 of key k, newest first, as functions of k
+        for key in (0, 5, 511, 512, 999):
+            for depth, version in enumerate(versions):
+                assert query.select_version(key, 0, [1, 1, 1], -depth)[0].columns == [key] + version(key), (key, depth)
+        for depth, version in enumerate(versions):
+            assert query.sum_version(0, 999, 1, -depth) == sum(version(key)[0] for key in range(1000))
+            assert query.sum_version(0, 999, 2, -depth) == sum(version(key)[1] for key in range(1000))
+
+    # merged after every round of updates, the older versions stay readable
+    for key in range(1000):
+        assert query.update(key, None, key + 1, None)
+    table.merge()
+    versions = [lambda key: [key + 1, 0], lambda key: [key, 0]]
+    check(versions)
+    for key in range(1000):
+        assert query.update(key, None, None, key + 2)
+    table.merge()
+    versions.insert(0, lambda key: [key + 1, key + 2])
+    check(versions)
+
+    # a version older than the chain reads the record as inserted
+    assert query.select_version(5, 0, [1, 1, 1], -5)[0].columns == [5, 5, 0]
+
+    # and after a reopen
+    db.close()
+    db = Database(path)
+    db.open(path)
+    query = Query(db.get_table('Grades'))
+    check(versions)
+    db.close()
+
+    shutil.rmtree(path)
+
+def test_merge_keeps_older_versions():
+    print("\n[TEST] Starting Merged Older Versions Test...")
+    use_numpy = Config.USE_NUMPY
+    try:
+        for Config.USE_NUMPY in (True, False):
+            check_versions_after_merge()
+    finally:
+        Config.USE_NUMPY = use_numpy
+    print("[TEST] Merged Older Versions Test Completed.\n")
+
+if __name__ == "__main__":
+    test_incremental_merge()
+    test_merge_kernel_matches_reads()
+    test_merge_publishes_base_versions()
+    test_merge_keeps_older_versions()
@@ -0,0 +1,69 @@
+import os
+import pickle
+import shutil
+
+from lstore.db import Database
+from lstore.index import Index
+from lstore.query import Query
+
+def test_index_persistence():
+    print("\n[TEST] Starting Index Persistence Test...")
+    path = "./TestIndexPersistence"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    table.index.create_index(2)
+    query = Query(table)
+    for key in range(2000):
+        query.insert(key, key % 10, key % 7)
+    for key in range(0, 2000, 3):
+        query.update(key, None, None, 100 + key % 5)
+    query.delete(5)
+    db.close()
+    index_path = os.path.join(path, 'Grades', Index.INDEX_FILE)
+    assert os.path.exists(index_path)
+    with open(index_path, "rb") as f:
+        saved = f.read()
+
+    # loaded as saved, secondary indexes included
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert table.index.indices[2] is not None
+    assert query.select(5, 0, [1, 1, 1]) == []
+    assert query.select(3, 0, [1, 1, 1])[0].columns == [3, 3, 103]
+    assert sorted(table.index.locate(2, 4)[0]) == [key for key in range(4, 2000, 7) if key % 3 != 0]
+    assert len(table.index.locate(2, 103)[0]) == len(range(3, 2000, 15))
+
+    # a fuzzy checkpoint leaves no index file behind that could look current after a crash, only
+    # which columns are indexed
+    query.insert(5000, 1, 2)
+    db.checkpoint()
+    with open(index_path, "rb") as f:
+        assert pickle.load(f) == {"version": None, "layout": {0: "ordered", 2: "ordered"}}
+    db.close()
+
+    # an index file from before the last insert (rid 2000) is stale, the indexes it lists are rebuilt from
+    # the pages
+    with open(index_path, "wb") as f:
+        f.write(saved)
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert table.index.indices[2] is not None
+    assert query.select(5000, 0, [1, 1, 1])[0].columns == [5000, 1, 2]
+    assert query.select(3, 0, [1, 1, 1])[0].columns == [3, 3, 103]
+    assert sorted(table.index.locate(2, 2)[0]) == [key for key in range(2, 2000, 7) if key % 3 != 0] + [2000]
+    assert len(table.index.locate(2, 103)[0]) == len(range(3, 2000, 15))
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Index Persistence Test Completed.\n")
+
+if __name__ == "__main__":
+    test_index_persistence()
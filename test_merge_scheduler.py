@@ -0,0 +1,145 @@
+import os
+import shutil
+from time import sleep
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.merge_scheduler import MergeScheduler
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+def test_merge_scheduler_policy():
+    print("\n[TEST] Starting Merge Scheduler Test...")
+    path = "./TestMergeScheduler"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, 0, 0)
+    scheduler = MergeScheduler(table, min_tail_pages=4, max_tail_pages=64, chain_length=3,
+                               read_amplification=10, backoff_writes=10 ** 9)
+
+    # a few updates: not worth a merge
+    for key in range(100):
+        assert query.update(key, None, 1, None)
+    assert scheduler.check() is None
+
+    # enough tail pages, but reads do not touch the chains
+    for i in range(4 * Config.PAGE_CAPACITY):
+        assert query.update(100 + i % 10, None, i, None)
+    for key in range(500, 600):
+        query.select(key, 0, [1, 1, 1])
+    assert scheduler.check() is None
+
+    # reads walk the long chains of keys 100-109
+    for key in range(100, 110):
+        query.select(key, 0, [1, 1, 1])
+    assert scheduler.check() == "chain length"
+    table.merge()
+    assert scheduler.check() is None
+
+    # write-heavy: the check backs off, doubling its wait
+    scheduler.backoff_writes = 1
+    for i in range(4 * Config.PAGE_CAPACITY):
+        assert query.update(i % 1000, None, None, i)
+    for key in range(10):
+        query.select(key, 0, [1, 1, 1])
+    assert scheduler.check() is None
+    assert scheduler.stats["backoffs"] == 1 and scheduler.delay == 2 * scheduler.poll
+
+    # until there are too many tail pages to wait any longer
+    scheduler.max_tail_pages = 4
+    assert scheduler.check() == "tail pages"
+    assert scheduler.delay == scheduler.poll
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Merge Scheduler Test Completed.\n")
+
+def test_merge_skips_uncommitted_updates():
+    print("\n[TEST] Starting Merge Uncommitted Update Test...")
+    path = "./TestMergeUncommitted"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, 0, 0)
+    assert query.update(3, None, 1, None)
+    table.merge()
+
+    # the merge leaves the record of a running transaction alone, its abort restores the committed value
+    transaction = Transaction()
+    assert query.update(3, None, 2, None, transaction=transaction)
+    assert query.update(4, None, 5, None)
+    table.merge()
+    transaction.abort()
+    assert query.select(3, 0, [1, 1, 1])[0].columns == [3, 1, 0]
+    assert query.select(4, 0, [1, 1, 1])[0].columns == [4, 5, 0]
+
+    # the background thread merges once the chains grow
+    scheduler = MergeScheduler(table, poll=0.05, min_tail_pages=1, chain_length=2, backoff_writes=10 ** 9)
+    scheduler.start()
+    for i in range(2 * Config.PAGE_CAPACITY):
+        assert query.update(i % 10, None, None, i)
+    for _ in range(100):
+        query.select(5, 0, [1, 1, 1])
+        if scheduler.stats["merges"]:
+            break
+        sleep(0.05)
+    scheduler.stop()
+    assert scheduler.stats["merges"] >= 1 and scheduler.stats["last_reason"] == "chain length"
+    assert query.select(5, 0, [1, 1, 1])[0].columns == [5, 0, max(i for i in range(2 * Config.PAGE_CAPACITY) if i % 10 == 5)]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Merge Uncommitted Update Test Completed.\n")
+
+def test_background_merge_keeps_versions():
+    print("\n[TEST] Starting Background Merge Version Read Test...")
+    path = "./TestMergeSchedulerVersions"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    settings = (Config.MERGE_IN_BACKGROUND, Config.MERGE_POLL, Config.MERGE_MIN_TAIL_PAGES, Config.MERGE_BACKOFF_WRITES)
+    # the scheduler of the table merges as soon as there is a new tail page and reads walk its chains
+    Config.MERGE_IN_BACKGROUND, Config.MERGE_POLL, Config.MERGE_MIN_TAIL_PAGES, Config.MERGE_BACKOFF_WRITES = True, 0.01, 0, 10 ** 9
+    try:
+        db = Database(path)
+        db.open(path)
+        table = db.create_table('Grades', 3, 0)
+        query = Query(table)
+        for key in range(200):
+            query.insert(key, key, 0)
+
+        # rounds of updates, every version read while merges run in between
+        def version(key, round):
+            return [key, 1000 * round + key if round else key, 0]
+        for round in range(1, 11):
+            for key in range(200):
+                assert query.update(key, None, 1000 * round + key, None)
+            for key in range(0, 200, 7):
+                for depth in range(3):
+                    assert query.select_version(key, 0, [1, 1, 1], -depth)[0].columns == version(key, max(round - depth, 0)), (round, key, depth)
+            for depth in range(3):
+                assert query.sum_version(0, 199, 1, -depth) == sum(version(key, max(round - depth, 0))[1] for key in range(200))
+            sleep(0.02)
+        table.merge_scheduler.stop()
+        print("background merges:", table.merge_scheduler.stats["merges"])
+        assert table.merge_scheduler.stats["merges"] >= 2
+        assert query.select_version(5, 0, [1, 1, 1], -10)[0].columns == version(5, 0)
+        db.close()
+    finally:
+        Config.MERGE_IN_BACKGROUND, Config.MERGE_POLL, Config.MERGE_MIN_TAIL_PAGES, Config.MERGE_BACKOFF_WRITES = settings
+
+    shutil.rmtree(path)
+    print("[TEST] Background Merge Version Read Test Completed.\n")
+
+if __name__ == "__main__":
+    test_merge_scheduler_policy()
+    test_merge_skips_uncommitted_updates()
+    test_background_merge_keeps_versions()
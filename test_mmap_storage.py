@@ -0,0 +1,50 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.storage import open_storage
+
+def test_mmap_pages_copied_before_change():
+    print("\n[TEST] Starting Mmap Copy On Change Test...")
+    path = "./TestMmapStorage"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path, storage_engine="mmap")
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, key, 0)
+    db.close()
+    # closing the database releases the segment files and their mappings
+    assert table.page_directory.storage.segments == {}
+
+    # pages read back use the mapping as their buffer
+    db = Database(path, storage_engine="mmap")
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 1, 0]
+    indirection = table.page_directory.Buffer.base_cache[0].physical_pages[Config.INDIRECTION_COLUMN]
+    assert indirection.attached
+    on_disk = bytes(open_storage(table.table_path, "segment").read("Base", Config.INDIRECTION_COLUMN, 0))
+
+    # the first change copies the page, the file keeps the old bytes until the page is written back
+    assert query.update(1, None, 6, None)
+    assert not indirection.attached
+    assert bytes(open_storage(table.table_path, "segment").read("Base", Config.INDIRECTION_COLUMN, 0)) == on_disk
+    db.close()
+
+    db = Database(path, storage_engine="mmap")
+    db.open(path)
+    query = Query(db.get_table('Grades'))
+    assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 6, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Mmap Copy On Change Test Completed.\n")
+
+if __name__ == "__main__":
+    test_mmap_pages_copied_before_change()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from lstore.db import Database
+from lstore.query import Query
+
+# Writer process: key 1 is committed at 6, the database is reopened so its pages are read back from
+# disk (through the mapping with the mmap engine), then a transaction that never commits sets it to
+# 999 and the writer waits to be killed
+WRITER = r"""
+import sys, time
+sys.path.insert(0, sys.argv[3])
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path, engine = sys.argv[1], sys.argv[2]
+db = Database(path, storage_engine=engine)
+db.open(path)
+table = db.create_table('Grades', 3, 0)
+query = Query(table)
+for key in range(10):
+    query.insert(key, key, 0)
+assert query.update(1, None, 6, None)
+db.close()
+
+db = Database(path, storage_engine=engine)
+db.open(path)
+table = db.get_table('Grades')
+query = Query(table)
+assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 6, 0]
+transaction = Transaction()
+assert query.update(1, None, 999, None, transaction=transaction)
+assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 999, 0]
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+def uncommitted_after_kill(engine):
+    path = "./TestMmapWAL"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER, path, engine, os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, text=True
+    )
+    assert writer.stdout.readline().strip() == "ready"
+    writer.kill()
+    writer.wait()
+
+    db = Database(path, storage_engine=engine)
+    db.open(path)
+    columns = Query(db.get_table('Grades')).select(1, 0, [1, 1, 1])[0].columns
+    db.close()
+    shutil.rmtree(path)
+    return columns
+
+def test_uncommitted_changes_do_not_reach_pages():
+    print("\n[TEST] Starting Write-Ahead Rule Test...")
+    # pages read through the mapping are copied before they change, nothing reaches the files before
+    # the log does; the uncommitted update is gone after the kill with either engine
+    for engine in ("file", "mmap"):
+        columns = uncommitted_after_kill(engine)
+        print(engine, "engine after kill:", columns)
+        assert columns == [1, 6, 0], engine
+    print("[TEST] Write-Ahead Rule Test Completed.\n")
+
+if __name__ == "__main__":
+    test_uncommitted_changes_do_not_reach_pages()
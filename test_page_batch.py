@@ -0,0 +1,54 @@
+import mmap
+
+from lstore.config import Config
+from lstore.page import BasePage, Page
+
+def check_batch_api():
+    page = Page()
+
+    # appends stop at the page capacity
+    assert page.write_batch(list(range(10))) == 10
+    assert page.write_batch(list(range(10, Config.PAGE_CAPACITY + 5))) == Config.PAGE_CAPACITY - 10
+    assert page.write_batch([1]) == 0
+    assert page.read_batch(0, 5) == [0, 1, 2, 3, 4]
+    assert page.read_batch(Config.PAGE_CAPACITY - 2) == [Config.PAGE_CAPACITY - 2, Config.PAGE_CAPACITY - 1]
+
+    # scatter writes what gather reads back, the other cells keep their values
+    page.scatter([3, 100, 7], [-3, -100, -7])
+    assert page.gather([7, 3, 100, 4]) == [-7, -3, -100, 4]
+    assert page.read(100) == -100 and page.read(101) == 101
+
+    # gather_column of a page goes to the same cells
+    base_page = BasePage(1)
+    column = Config.USER_COLUMN_START
+    base_page.physical_pages[column].write_batch([5, 6, 7])
+    assert base_page.gather_column(column, [2, 0]) == [7, 5]
+
+    # a page over a mapping reads from it in place, batch writes copy it first
+    mapping = mmap.mmap(-1, Config.PAGE_SIZE)
+    source = Page()
+    source.write_batch([10, 20, 30])
+    mapping[:] = source.data
+    attached = Page()
+    attached.attach_data(memoryview(mapping), 3)
+    assert attached.read_batch() == [10, 20, 30] and attached.gather([2, 0]) == [30, 10]
+    attached.scatter([1], [25])
+    assert not attached.attached and attached.dirty
+    assert attached.write_batch([40]) == 1
+    assert attached.read_batch() == [10, 25, 30, 40]
+    assert bytes(mapping) == bytes(source.data)
+    attached = None
+    mapping.close()
+
+def test_page_batch_api():
+    print("\n[TEST] Starting Page Batch API Test...")
+    use_numpy = Config.USE_NUMPY
+    try:
+        for Config.USE_NUMPY in (True, False):
+            check_batch_api()
+    finally:
+        Config.USE_NUMPY = use_numpy
+    print("[TEST] Page Batch API Test Completed.\n")
+
+if __name__ == "__main__":
+    test_page_batch_api()
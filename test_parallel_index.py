@@ -0,0 +1,82 @@
+import os
+import shutil
+from concurrent.futures.process import BrokenProcessPool
+
+from lstore import index
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+def test_parallel_index_build():
+    print("\n[TEST] Starting Parallel Index Build Test...")
+    for storage_engine in ["file", "segment", "mmap"]:
+        path = "./TestParallelIndex"
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        db = Database(path, storage_engine=storage_engine)
+        db.open(path)
+        table = db.create_table('Grades', 4, 0)
+        query = Query(table)
+        for key in range(5000):
+            query.insert(key, key % 10, (key * 7919) % 1000, 0)
+        for key in range(0, 5000, 4):
+            query.update(key, None, None, None, key % 3)
+        for key in range(0, 5000, 9):
+            query.delete(key)
+
+        # worker processes read the page files, the result matches the build in this thread
+        for column in [1, 2, 3]:
+            table.index.create_index(column, workers=1)
+            serial = list(table.index.indices[column].items())
+            table.index.drop_index(column)
+            table.index.create_index(column, workers=3)
+            parallel = list(table.index.indices[column].items())
+            assert serial == parallel, (storage_engine, column)
+        assert table.index.locate(1, 3)[0] == [key for key in range(3, 5000, 10) if key % 9 != 0]
+        db.close()
+        shutil.rmtree(path)
+    print("[TEST] Parallel Index Build Test Completed.\n")
+
+def test_index_build_falls_back_to_serial():
+    print("\n[TEST] Starting Index Build Fallback Test...")
+    path = "./TestIndexBuildFallback"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(2000):
+        query.insert(key, key % 10, key % 7)
+
+    # workers are opt-in
+    assert Config.INDEX_BUILD_WORKERS == 1 and table.index._build_workers(None) == 1
+
+    # a main module that runs code outside of its __main__ guard is not imported again by workers
+    script = os.path.join(path, "script.py")
+    with open(script, "w") as f:
+        f.write('import os\nN = 3\ndef main():\n    pass\nif __name__ == "__main__":\n    main()\n')
+    assert index._source_guarded(os.path.abspath(script))
+    with open(script, "a") as f:
+        f.write('main()\n')
+    index._source_guarded.cache_clear()
+    assert not index._source_guarded(os.path.abspath(script))
+
+    # a pool that breaks leaves the build to this thread, the column gets its index once
+    build_parallel = table.index._build_parallel
+    def broken(*args):
+        raise BrokenProcessPool("worker died")
+    table.index._build_parallel = broken
+    try:
+        table.index.create_index(1, workers=2)
+    finally:
+        table.index._build_parallel = build_parallel
+    assert table.index.locate(1, 3)[0] == list(range(3, 2000, 10))
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Index Build Fallback Test Completed.\n")
+
+if __name__ == "__main__":
+    test_parallel_index_build()
+    test_index_build_falls_back_to_serial()
@@ -0,0 +1,43 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+def test_projection_loads_requested_columns():
+    print("\n[TEST] Starting Projection Read Test...")
+    path = "./TestProjection"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, key * 2, key * 3)
+    db.close()
+
+    # after a reopen nothing is cached, a projected read faults in only what it reads
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert query.select(5, 0, [0, 1, 0])[0].columns == [10]
+    page = table.page_directory.Buffer.base_cache[0]
+    loaded = [column_idx for column_idx, physical_page in enumerate(page.physical_pages) if physical_page is not None]
+    print("columns loaded by the projected read:", loaded)
+    assert Config.USER_COLUMN_START + 1 in loaded
+    assert Config.USER_COLUMN_START + 2 not in loaded
+    assert Config.RID_COLUMN not in loaded and Config.TIMESTAMP_COLUMN not in loaded
+
+    # a full read of the same page loads the rest
+    assert query.select(6, 0, [1, 1, 1])[0].columns == [6, 12, 18]
+    assert page.physical_pages[Config.USER_COLUMN_START + 2] is not None
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Projection Read Test Completed.\n")
+
+if __name__ == "__main__":
+    test_projection_loads_requested_columns()
@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from lstore.db import Database
+from lstore.query import Query
+
+# Writer process: every transaction inserts key i and updates key i - 1, and reports i once
+# it has committed. A small buffer pool makes evicted pages (with uncommitted changes) hit the
+# disk while it runs. At i == 1000 it also leaves a transaction open that inserts key -1 and
+# updates key 0, its changes are logged by later group commits but it never commits. Every 400
+# transactions it takes a fuzzy checkpoint, recovery starts from the last one.
+WRITER = r"""
+import sys
+sys.path.insert(0, sys.argv[2])
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path = sys.argv[1]
+db = Database(path, buffer_pool_bytes=64 * 4096)
+db.open(path)
+table = db.create_table('Grades', 3, 0)
+query = Query(table)
+i = 0
+while True:
+    t = Transaction()
+    t.add_query(query.insert, table, i, i, 0)
+    if i > 0:
+        t.add_query(query.update, table, i - 1, None, None, i)
+    if t.run():
+        print(i, flush=True)
+    if i % 400 == 399:
+        db.checkpoint()
+    if i == 1000:
+        open_transaction = Transaction()
+        query.insert(-1, 0, 0, transaction=open_transaction)
+        query.update(0, None, None, 999, transaction=open_transaction)
+    i += 1
+"""
+
+def test_recovery_after_kill():
+    print("\n[TEST] Starting Crash Recovery Test...")
+    path = "./TestRecovery"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    # kill the writer once it has committed enough to span several base and tail pages
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER, path, os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, text=True
+    )
+    last_committed = -1
+    for line in writer.stdout:
+        last_committed = int(line)
+        if last_committed >= 1500:
+            break
+    writer.kill()
+    writer.wait()
+    print("writer killed after commit", last_committed)
+
+    # the last checkpoint is held back by the open transaction
+    with open(os.path.join(path, "db_meta.json")) as f:
+        assert json.load(f)["checkpoint_lsn"] > 0
+
+    db = Database(path)
+    db.open(path)
+    print("recovery:", db.recovery)
+    assert db.recovery is not None
+    table = db.get_table('Grades')
+    query = Query(table)
+
+    # every acknowledged commit survived
+    for key in range(last_committed + 1):
+        record = query.select(key, 0, [1, 1, 1])[0]
+        expected = [key, key, key + 1 if key < last_committed else record.columns[2]]
+        assert record.columns == expected, (key, record.columns)
+
+    # the transaction that never committed is undone
+    assert query.select(-1, 0, [1, 1, 1]) == []
+    assert query.select(0, 0, [1, 1, 1])[0].columns == [0, 0, 1]
+
+    # counts cover every recovered record, appends continue after them
+    num_base_records = table.page_directory.num_base_records
+    assert num_base_records >= last_committed + 1
+    assert query.insert(10 ** 6, 1, 2)
+    assert query.select(10 ** 6, 0, [1, 1, 1])[0].columns == [10 ** 6, 1, 2]
+    db.close()
+
+    # a clean close leaves nothing to replay
+    db = Database(path)
+    db.open(path)
+    assert db.recovery is None
+    query = Query(db.get_table('Grades'))
+    assert query.select(10 ** 6, 0, [1, 1, 1])[0].columns == [10 ** 6, 1, 2]
+    assert query.select(last_committed, 0, [1, 1, 1])[0].columns[:2] == [last_committed, last_committed]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Crash Recovery Test Completed.\n")
+
+# Writer process: transactions that abort, followed by committed ones changing the same records,
+# then it waits to be killed
+ABORT_WRITER = r"""
+import sys, time
+sys.path.insert(0, sys.argv[2])
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path = sys.argv[1]
+db = Database(path)
+db.open(path)
+table = db.create_table('Grades', 3, 0)
+query = Query(table)
+for key in range(10):
+    query.insert(key, 10, 100)
+db.checkpoint()
+
+def run(*queries):
+    t = Transaction()
+    for q, *args in queries:
+        t.add_query(q, table, *args)
+    return t.run()
+
+# an update rolled back (the second update of the transaction finds no key 99), then one committed
+assert not run((query.update, 1, None, 11, None), (query.update, 99, None, 0, None))
+assert run((query.update, 1, None, 12, None))
+# a delete rolled back, then one committed
+assert not run((query.delete, 2), (query.update, 99, None, 0, None))
+assert run((query.delete, 2))
+# a delete rolled back, then an update committed
+assert not run((query.delete, 3), (query.update, 99, None, 0, None))
+assert run((query.update, 3, None, 13, None))
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+def test_recovery_after_abort():
+    print("\n[TEST] Starting Recovery After Abort Test...")
+    path = "./TestRecoveryAbort"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    writer = subprocess.Popen(
+        [sys.executable, "-c", ABORT_WRITER, path, os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, text=True
+    )
+    assert writer.stdout.readline().strip() == "ready"
+    writer.kill()
+    writer.wait()
+
+    # the rollbacks are repeated where they happened, the committed changes after them stay
+    db = Database(path)
+    db.open(path)
+    print("recovery:", db.recovery)
+    query = Query(db.get_table('Grades'))
+    assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 12, 100]
+    assert query.select(2, 0, [1, 1, 1]) == []
+    assert query.select(3, 0, [1, 1, 1])[0].columns == [3, 13, 100]
+    assert query.select(4, 0, [1, 1, 1])[0].columns == [4, 10, 100]
+    assert db.recovery["aborted"] == 3 and db.recovery["undone"] == 0
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Recovery After Abort Test Completed.\n")
+
+# Writer process: updates merged after the checkpoint, the merge's snapshots of the original values
+# reach the log with the commit after them, then it waits to be killed
+MERGE_WRITER = r"""
+import sys, time
+sys.path.insert(0, sys.argv[2])
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path = sys.argv[1]
+db = Database(path)
+db.open(path)
+table = db.create_table('Grades', 3, 0)
+query = Query(table)
+for key in range(10):
+    query.insert(key, 10, 100)
+db.checkpoint()
+for key in range(10):
+    assert query.update(key, None, 11, None)
+    assert query.update(key, None, None, 101)
+table.merge()
+t = Transaction()
+t.add_query(query.update, table, 9, None, 12, None)
+assert t.run()
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+def test_recovery_after_merge():
+    print("\n[TEST] Starting Recovery After Merge Test...")
+    path = "./TestRecoveryMerge"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    writer = subprocess.Popen(
+        [sys.executable, "-c", MERGE_WRITER, path, os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, text=True
+    )
+    assert writer.stdout.readline().strip() == "ready"
+    writer.kill()
+    writer.wait()
+
+    # the snapshots are redone with the links to them, every version reads back, before and after
+    # the next merge (which writes no second snapshot)
+    db = Database(path)
+    db.open(path)
+    print("recovery:", db.recovery)
+    table = db.get_table('Grades')
+    query = Query(table)
+    num_tail_records = table.page_directory.num_tail_records
+    for merged in (False, True):
+        if merged:
+            table.merge()
+        assert table.page_directory.num_tail_records == num_tail_records
+        for key in (0, 9):
+            newest = [key, 12 if key == 9 else 11, 101]
+            assert query.select(key, 0, [1, 1, 1])[0].columns == newest
+            assert query.select_version(key, 0, [1, 1, 1], -2 if key == 9 else -1)[0].columns == [key, 11, 100]
+            assert query.select_version(key, 0, [1, 1, 1], -3 if key == 9 else -2)[0].columns == [key, 10, 100]
+        assert query.sum_version(0, 9, 1, -3) == 10 * 10
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Recovery After Merge Test Completed.\n")
+
+if __name__ == "__main__":
+    test_recovery_after_kill()
+    test_recovery_after_abort()
+    test_recovery_after_merge()
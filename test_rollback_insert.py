@@ -1,3 +1,6 @@
+import os
+import shutil
+
 from lstore.db import Database
 from lstore.query import Query
 from lstore.transaction import Transaction
@@ -5,9 +8,12 @@ from lstore.config import Config
 
 def test_rollback_insert():
     print("\n[TEST] Starting Rollback Insert Test...")
+    path = "./TestRollbackInsert"
+    if os.path.exists(path):
+        shutil.rmtree(path)
     
-    db = Database()
-    db.open('./ECS165') 
+    db = Database(path)
+    db.open(path)
     
     grades_table = db.create_table('Grades', 5, 0)
     query = Query(grades_table)
@@ -26,6 +32,8 @@ def test_rollback_insert():
         print("   -> Check: Record exists before abort. (Correct)")
     else:
         print("   -> ERROR: Record failed to insert initially.")
+        db.close()
+        shutil.rmtree(path)
         return
 
     rids = grades_table.index.locate(0, key)
@@ -74,6 +82,8 @@ def test_rollback_insert():
     except Exception as e:
         print(f"   -> Internal check skipped or failed: {e}")
 
+    db.close()
+    shutil.rmtree(path)
     print("[TEST] Rollback Insert Test Completed.\n")
 
 if __name__ == "__main__":
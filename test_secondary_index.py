@@ -0,0 +1,58 @@
+import os
+import shutil
+
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+def test_secondary_index_update():
+    print("\n[TEST] Starting Secondary Index Update Test...")
+    path = "./TestSecondaryIndex"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    table.index.create_index(2)
+    query = Query(table)
+    for key in range(100):
+        query.insert(key, 0, key % 10)
+
+    # an update moves the rid to the new value
+    rid = table.index.locate(0, 7)[0][0]
+    assert query.update(7, None, None, 42)
+    assert table.index.locate(2, 42)[0] == [rid]
+    assert rid not in table.index.locate(2, 7)[0]
+    assert [r.columns for r in query.select(42, 2, [1, 1, 1])] == [[7, 0, 42]]
+    assert [r.columns[0] for r in query.select(7, 2, [1, 1, 1])] == [17, 27, 37, 47, 57, 67, 77, 87, 97]
+
+    # updating another column leaves the index alone
+    assert query.update(7, None, 5, None)
+    assert table.index.locate(2, 42)[0] == [rid]
+
+    # an aborted update moves it back, the primary key included
+    transaction = Transaction()
+    assert query.update(7, 1007, None, 43, transaction=transaction)
+    assert table.index.locate(2, 43)[0] == [rid]
+    assert table.index.locate(0, 1007)[0] == [rid]
+    transaction.abort()
+    assert table.index.locate(2, 43)[0] == []
+    assert table.index.locate(2, 42)[0] == [rid]
+    assert table.index.locate(0, 1007)[0] == []
+    assert [r.columns for r in query.select(7, 0, [1, 1, 1])] == [[7, 5, 42]]
+
+    # a rebuilt index agrees with the maintained one
+    maintained = list(table.index.indices[2].items())
+    table.index.drop_index(2)
+    table.index.create_index(2)
+    assert [(k, v[0]) for k, v in table.index.indices[2].items() if v[0]] == [(k, v[0]) for k, v in maintained if v[0]]
+    table.index.drop_index(2)
+    table.index.create_index(2, workers=2)
+    assert table.index.locate(2, 42)[0] == [rid]
+
+    db.close()
+    shutil.rmtree(path)
+    print("[TEST] Secondary Index Update Test Completed.\n")
+
+if __name__ == "__main__":
+    test_secondary_index_update()
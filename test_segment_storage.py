@@ -0,0 +1,52 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.storage import open_storage
+
+def page_bytes(value):
+    return value.to_bytes(8, "little", signed=True) * Config.PAGE_CAPACITY
+
+def check_round_trip(engine):
+    path = "./TestSegmentStorage"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    storage = open_storage(path, engine)
+    for page_idx in range(3):
+        storage.write("Tail", 5, page_idx, page_bytes(page_idx))
+    storage.write("Base", 0, 0, page_bytes(-1))
+    storage.close()
+
+    # the extent map and the slots come back on reopen
+    storage = open_storage(path, engine)
+    assert storage.exists("Tail", 5, 2) and not storage.exists("Tail", 5, 3)
+    assert bytes(storage.read("Tail", 5, 1)) == page_bytes(1)
+    assert bytes(storage.read("Base", 0, 0)) == page_bytes(-1)
+    assert storage.read("Tail", 6, 0) is None
+
+    # a freed slot is handed out again once the map without its page is on disk, the file does not grow
+    slot = storage.extents[("Tail", 5, 1)]
+    num_slots = storage.num_slots
+    storage.free("Tail", 5, 1)
+    assert not storage.exists("Tail", 5, 1)
+    storage.flush()
+    storage.write("Tail", 5, 3, page_bytes(3))
+    assert storage.extents[("Tail", 5, 3)] == slot and storage.num_slots == num_slots
+    storage.close()
+
+    storage = open_storage(path, engine)
+    assert storage.read("Tail", 5, 1) is None
+    assert [bytes(storage.read("Tail", 5, page_idx)) for page_idx in (0, 2, 3)] == [page_bytes(0), page_bytes(2), page_bytes(3)]
+    storage.close()
+
+    shutil.rmtree(path)
+
+def test_segment_storage_round_trip():
+    print("\n[TEST] Starting Segment Storage Test...")
+    for engine in ("segment", "mmap"):
+        check_round_trip(engine)
+    print("[TEST] Segment Storage Test Completed.\n")
+
+if __name__ == "__main__":
+    test_segment_storage_round_trip()
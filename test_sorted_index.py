@@ -0,0 +1,49 @@
+from random import shuffle, seed
+
+from lstore.index import SortedDictList
+
+def test_sorted_index_range():
+    print("\n[TEST] Starting Sorted Index Range Test...")
+    seed(551)
+
+    index = SortedDictList()
+    keys = list(range(0, 2000, 2))
+    shuffle(keys)
+    for rid, key in enumerate(keys):
+        index.add(key, rid, "Base")
+
+    # range lookups return values in key order
+    res = index.value_in_range(100, 120)
+    assert [index.data[k] for k in range(100, 121, 2)] == res
+
+    # keys added after the first range lookup land in the overflow run
+    index.add(101, 5000, "Base")
+    index.add(101, 5001, "Tail")
+    assert index.value_in_range(100, 102) == [[[keys.index(100)], []], [[5000], [5001]], [[keys.index(102)], []]]
+
+    # a short overflow run is read next to the key array, not merged into it
+    assert index.pending == [101] and 101 not in index.keys
+
+    # lookups hand out copies, changing them leaves the index alone
+    index.get(101)[0].append(7000)
+    index.value_in_range(101, 101)[0][1].append(7001)
+    assert index.get(101) == [[5000], [5001]]
+
+    # removed keys disappear from ranges, re-added keys come back once
+    index.remove_rid(101, 5000)
+    index.remove_rid(101, 5001)
+    assert len(index.value_in_range(100, 102)) == 2
+    index.add(101, 6000, "Base")
+    assert len(index.value_in_range(100, 102)) == 3
+    assert [k for k, _ in index.items()] == sorted(set(keys) | {101})
+
+    # a long one is merged by the next range lookup
+    for key in range(3001, 3001 + 2 * SortedDictList.MERGE_THRESHOLD, 2):
+        index.add(key, key, "Base")
+    assert len(index.value_in_range(3000, 5000)) == SortedDictList.MERGE_THRESHOLD
+    assert index.pending == []
+
+    print("[TEST] Sorted Index Range Test Completed.\n")
+
+if __name__ == "__main__":
+    test_sorted_index_range()
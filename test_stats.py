@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+
+COUNTERS = ["hits", "misses", "evictions", "pages_read", "bytes_read", "pages_written", "bytes_written", "pages_skipped", "bytes_skipped"]
+
+def test_stats_counts():
+    print("\n[TEST] Starting Statistics Test...")
+    path = "./TestStats"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, key, 0)
+    for key in range(0, 1000, 10):
+        query.update(key, None, None, 1)
+    db.close()
+
+    # a cold buffer: every frame a read needs is one miss and one page read from disk
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    db.reset_stats()
+    stats = db.get_stats()
+    assert stats["buffer_pool"]["hits"] == stats["buffer_pool"]["misses"] == 0
+    for page_type in ("Base", "Tail"):
+        assert all(stats["tables"]["Grades"][page_type][name] == 0 for name in COUNTERS)
+
+    for key in range(1000):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, key, 1 if key % 10 == 0 else 0]
+    stats = db.get_stats()
+    pool, base, tail = stats["buffer_pool"], stats["tables"]["Grades"]["Base"], stats["tables"]["Grades"]["Tail"]
+    print("pool:", pool["hits"], "hits", pool["misses"], "misses; base:", base["misses"], "misses", base["pages_read"], "read")
+    for page_stats in (base, tail):
+        assert page_stats["misses"] == page_stats["pages_read"] > 0
+        assert page_stats["bytes_read"] == page_stats["pages_read"] * Config.PAGE_SIZE
+        assert page_stats["pages_written"] == page_stats["evictions"] == 0
+    # one table, the pool counts what its caches count
+    assert pool["hits"] == base["hits"] + tail["hits"] > 0
+    assert pool["misses"] == base["misses"] + tail["misses"]
+    assert pool["used_frames"] == base["frames"] + tail["frames"]
+
+    # warm, a read only hits
+    query.select(500, 0, [1, 1, 1])
+    warm = db.get_stats()["tables"]["Grades"]["Base"]
+    assert warm["hits"] > base["hits"] and warm["misses"] == base["misses"]
+
+    # the dump is what get_stats reports
+    dumped = db.dump_stats()
+    with open(os.path.join(path, "stats.json")) as f:
+        assert json.load(f) == json.loads(json.dumps(dumped))
+    assert dumped["tables"]["Grades"]["version_reads"]["base_reads"] >= 1001
+
+    # reset zeroes the counters, what is resident stays
+    db.reset_stats()
+    stats = db.get_stats()
+    assert stats["buffer_pool"]["hits"] == 0 and stats["buffer_pool"]["used_frames"] == pool["used_frames"]
+    assert all(stats["tables"]["Grades"]["Base"][name] == 0 for name in COUNTERS)
+    assert stats["tables"]["Grades"]["Base"]["frames"] == base["frames"]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Statistics Test Completed.\n")
+
+if __name__ == "__main__":
+    test_stats_counts()
@@ -0,0 +1,195 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+def tail_page_stored(table, page_idx):
+    return table.page_directory.storage.exists("Tail", Config.RID_COLUMN, page_idx)
+
+def dead_counts(dead_tail_records):
+    # page -> number of dead records, from the per page bitmasks
+    return {page_idx: mask.bit_count() for page_idx, mask in dead_tail_records.items()}
+
+def test_tail_reclaim():
+    print("\n[TEST] Starting Tail Page Reclamation Test...")
+    path = "./TestTailReclaim"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, 0, 0)
+
+    # three full tail pages, one update rolled back; the merge keeps every chain for older versions
+    for i in range(3 * Config.PAGE_CAPACITY - 1):
+        assert query.update(i % 100, None, i, None)
+    transaction = Transaction()
+    assert query.update(500, None, -5, None, transaction=transaction)
+    transaction.abort()
+    db.checkpoint()
+    assert all(tail_page_stored(table, page_idx) for page_idx in range(3))
+    table.merge()
+    assert table.page_directory.retired_tail_pages == set()
+    assert query.select_version(5, 0, [1, 1, 1], -1)[0].columns == [5, 1405, 0]
+    assert query.select_version(5, 0, [1, 1, 1], -16)[0].columns == [5, 0, 0]
+
+    # deleting the updated records retires their chains, the snapshots the merge wrote included
+    for key in range(100):
+        assert query.delete(key)
+    assert table.page_directory.retired_tail_pages == {0, 1, 2}
+    assert not any(page_idx in table.page_directory.Buffer.tail_cache for page_idx in range(3))
+
+    # the files go with the next save
+    db.checkpoint()
+    assert not any(tail_page_stored(table, page_idx) for page_idx in range(3))
+    stats = table.get_stats()["tail_reclaim"]
+    print("tail pages reclaimed:", stats)
+    assert stats["reclaimed_pages"] == 3 and stats["retired"] == 0
+    assert query.select(5, 0, [1, 1, 1]) == []
+    assert query.select(999, 0, [1, 1, 1])[0].columns == [999, 0, 0]
+
+    # a delete in a transaction keeps the chain until it commits; rolled back, nothing is retired
+    for i in range(4):
+        assert query.update(200, None, i, None)
+    dead = dead_counts(table.page_directory.dead_tail_records)
+    transaction = Transaction()
+    assert query.delete(200, transaction=transaction)
+    assert dead_counts(table.page_directory.dead_tail_records) == dead
+    transaction.abort()
+    assert dead_counts(table.page_directory.dead_tail_records) == dead
+    assert query.select_version(200, 0, [1, 1, 1], -1)[0].columns == [200, 2, 0]
+    transaction = Transaction()
+    assert query.delete(200, transaction=transaction)
+    assert transaction.commit()
+    assert dead_counts(table.page_directory.dead_tail_records) == {3: 100 + 4}
+
+    # the counts of partly dead pages survive a reopen, so do the chains of merged records
+    assert query.update(300, None, 1, None)
+    assert query.update(300, None, 2, None)
+    table.merge()
+    db.close()
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert dead_counts(table.page_directory.dead_tail_records) == {3: 100 + 4}
+    assert table.get_stats()["tail_reclaim"]["retired"] == 0
+    assert not any(tail_page_stored(table, page_idx) for page_idx in range(3))
+    assert query.select(300, 0, [1, 1, 1])[0].columns == [300, 2, 0]
+    assert query.select_version(300, 0, [1, 1, 1], -1)[0].columns == [300, 1, 0]
+    assert query.select_version(300, 0, [1, 1, 1], -2)[0].columns == [300, 0, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Tail Page Reclamation Test Completed.\n")
+
+def test_tail_reclaim_recycles_segment_slots():
+    print("\n[TEST] Starting Segment Slot Recycling Test...")
+    path = "./TestTailReclaimSegment"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path, storage_engine="segment")
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+
+    # after the first rounds, rounds that update, merge and delete their records reuse the slots of
+    # the tail pages they reclaim
+    slots = []
+    for round in range(5):
+        keys = range(round * 100, (round + 1) * 100)
+        for key in keys:
+            query.insert(key, 0, 0)
+        for i in range(2 * Config.PAGE_CAPACITY):
+            assert query.update(keys[i % 100], None, round, i)
+        table.merge()
+        for key in keys:
+            assert query.delete(key)
+        db.checkpoint()
+        slots.append(table.page_directory.storage.num_slots)
+    print("segment slots after each round:", slots)
+    assert slots[1] == slots[2] == slots[3] == slots[4]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Segment Slot Recycling Test Completed.\n")
+
+# Writer process: fills tail pages 0 and 1, the last record of page 1 by a transaction that is still
+# open when the merge runs and the records updated before are deleted, which retires page 0; the
+# checkpoint after it saves the dead records. Then it waits to be killed.
+CRASH_WRITER = r"""
+import sys, time
+sys.path.insert(0, sys.argv[2])
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path = sys.argv[1]
+db = Database(path)
+db.open(path)
+table = db.create_table('Grades', 3, 0)
+query = Query(table)
+for key in range(1000):
+    query.insert(key, 0, 0)
+for i in range(2 * Config.PAGE_CAPACITY - 1):
+    assert query.update(i % 500, None, i, None)
+transaction = Transaction()
+assert query.update(900, None, -900, None, transaction=transaction)
+table.merge()
+for key in range(500):
+    assert query.delete(key)
+assert table.page_directory.retired_tail_pages == {0}
+db.checkpoint()
+print("ready", flush=True)
+time.sleep(60)
+"""
+
+def test_tail_reclaim_after_crash():
+    print("\n[TEST] Starting Tail Page Reclamation After Crash Test...")
+    path = "./TestTailReclaimCrash"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    writer = subprocess.Popen(
+        [sys.executable, "-c", CRASH_WRITER, path, os.path.dirname(os.path.abspath(__file__))],
+        stdout=subprocess.PIPE, text=True
+    )
+    assert writer.stdout.readline().strip() == "ready"
+    writer.kill()
+    writer.wait()
+
+    # recovery rolls the open transaction back, which kills the last live record of page 1, and
+    # the save that ends recovery frees it
+    db = Database(path)
+    db.open(path)
+    print("recovery:", db.recovery)
+    assert db.recovery["undone"] == 1
+    table = db.get_table('Grades')
+    query = Query(table)
+    assert not tail_page_stored(table, 0) and not tail_page_stored(table, 1)
+    # the snapshots of the deleted records, on page 2
+    assert dead_counts(table.page_directory.dead_tail_records) == {2: 500}
+    assert query.select(900, 0, [1, 1, 1])[0].columns == [900, 0, 0]
+    assert query.select(499, 0, [1, 1, 1]) == []
+
+    # updates after the restart go on from the tail pages left
+    assert query.update(900, None, 9, None)
+    table.merge()
+    assert query.select(900, 0, [1, 1, 1])[0].columns == [900, 9, 0]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Tail Page Reclamation After Crash Test Completed.\n")
+
+if __name__ == "__main__":
+    test_tail_reclaim()
+    test_tail_reclaim_recycles_segment_slots()
+    test_tail_reclaim_after_crash()
@@ -0,0 +1,217 @@
+import os
+import shutil
+import threading
+
+from lstore.db import Database
+from lstore.query import Query
+from lstore.wal import WriteAheadLog
+
+def test_wal_group_commit():
+    print("\n[TEST] Starting WAL Group Commit Test...")
+    path = "./TestWAL"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    wal = WriteAheadLog(os.path.join(path, "wal.log"))
+    num_threads = 8
+    commits_per_thread = 50
+
+    def worker(thread_id):
+        for i in range(commits_per_thread):
+            txn = thread_id * commits_per_thread + i
+            wal.log_insert("Grades", txn, txn, 0, [txn, 1, 2])
+            lsn = wal.commit(txn)
+            # durable once commit returns
+            assert wal.durable_lsn >= lsn
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total = num_threads * commits_per_thread
+    assert wal.stats["commits"] == total
+    # concurrent commits share fsyncs
+    assert wal.stats["fsyncs"] <= total
+    print("commits:", wal.stats["commits"], "fsyncs:", wal.stats["fsyncs"])
+
+    records = [record for _, record in wal.records()]
+    assert len(records) == 2 * total
+    assert sorted(r["txn"] for r in records if r["op"] == "commit") == list(range(total))
+    segment_path = wal.segments[-1][1]
+    wal.close()
+
+    # a torn record at the end is cut off, new records follow the last complete one
+    with open(segment_path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00\x00")
+    wal = WriteAheadLog(os.path.join(path, "wal.log"))
+    assert len(list(wal.records())) == 2 * total
+    wal.commit(total)
+    assert [r for _, r in wal.records()][-1] == {"op": "commit", "txn": total}
+    wal.close()
+
+    shutil.rmtree(path)
+    print("[TEST] WAL Group Commit Test Completed.\n")
+
+def test_wal_checkpoint_truncation():
+    print("\n[TEST] Starting WAL Checkpoint Truncation Test...")
+    path = "./TestWALCheckpoint"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    # small segments, every commit starts a new one
+    wal = WriteAheadLog(os.path.join(path, "wal.log"), segment_bytes=64)
+    for txn in range(10):
+        wal.log_insert("Grades", txn, txn, 0, [txn, 1, 2])
+        wal.commit(txn)
+    # a transaction still running holds the checkpoint back to its first record
+    wal.log_insert("Grades", 10, 10, 0, [10, 1, 2])
+    running_lsn = wal.end_lsn
+    wal.log_insert("Grades", None, 11, 0, [11, 1, 2])
+    wal.flush()
+    assert len(wal.segments) >= 10
+
+    checkpoint_lsn = wal.begin_checkpoint()
+    assert checkpoint_lsn < running_lsn
+    wal.end_checkpoint(checkpoint_lsn)
+    print("segments left:", len(wal.segments), "truncated:", wal.stats["truncated_segments"])
+    assert wal.stats["truncated_segments"] > 0
+    assert wal.segments[0][0] <= checkpoint_lsn
+    records = [r for _, r in wal.records(checkpoint_lsn)]
+    assert [r["rid"] for r in records if r["op"] == "insert"] == [10, 11]
+
+    # once it commits nothing before the end of the log is needed
+    wal.commit(10)
+    checkpoint_lsn = wal.begin_checkpoint()
+    assert checkpoint_lsn == wal.end_lsn
+    wal.end_checkpoint(checkpoint_lsn)
+    wal.close()
+
+    # reopened, the log continues after the remaining segments
+    wal = WriteAheadLog(os.path.join(path, "wal.log"), segment_bytes=64)
+    assert wal.end_lsn > checkpoint_lsn
+    assert [r["op"] for _, r in wal.records(checkpoint_lsn)] == ["checkpoint"]
+    wal.close()
+
+    shutil.rmtree(path)
+    print("[TEST] WAL Checkpoint Truncation Test Completed.\n")
+
+def test_checkpoint_syncs_pages_first():
+    print("\n[TEST] Starting Checkpoint Page Sync Test...")
+    path = "./TestWALSync"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        query.insert(key, 0, 0)
+    storage = table.page_directory.storage
+
+    # when the checkpoint record goes out (and the log before it with it), every page file written
+    # by the checkpoint has been fsynced
+    synced = []
+    fsync, end_checkpoint = os.fsync, db.wal.end_checkpoint
+    def record_fsync(fd):
+        synced.append(fd)
+        return fsync(fd)
+    def check_end_checkpoint(lsn):
+        assert not storage.unsynced and not storage.unsynced_dirs
+        assert len(synced) >= 2 * (3 + 5)
+        return end_checkpoint(lsn)
+    os.fsync, db.wal.end_checkpoint = record_fsync, check_end_checkpoint
+    try:
+        db.checkpoint()
+    finally:
+        os.fsync = fsync
+        db.wal.end_checkpoint = end_checkpoint
+    print("fsyncs during the checkpoint:", len(synced))
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Checkpoint Page Sync Test Completed.\n")
+
+def test_records_logged_before_pages_change():
+    print("\n[TEST] Starting Write-Ahead Order Test...")
+    path = "./TestWALOrder"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+    page_range = table.page_directory
+
+    # what the pages hold, and where a checkpoint would start, when each record is appended
+    seen = []
+    append = db.wal.append
+    def observe(record):
+        start = db.wal.end_lsn
+        base = page_range.read_base_record(0, record["rid"]) if record["rid"] < page_range.num_base_records else None
+        seen.append((record["op"], base, page_range.num_tail_records, db.wal.begin_checkpoint() <= start))
+        return append(record)
+    db.wal.append = observe
+    try:
+        assert query.insert(1, 2, 3)
+        assert query.update(1, None, 5, None)
+        assert query.delete(1)
+    finally:
+        db.wal.append = append
+
+    insert, update, delete = seen
+    # the insert is logged before its rid is used, the update before its tail record is written and
+    # linked, the delete before the record is marked
+    assert insert[0] == "insert" and insert[1] is None
+    assert update[0] == "update" and update[1]["indirection"] == -1 and update[2] == 0
+    assert delete[0] == "delete" and delete[1]["rid"] == 0 and delete[1]["indirection"] == 0
+    # a checkpoint begun meanwhile replays the record
+    assert insert[3] and update[3] and delete[3]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Write-Ahead Order Test Completed.\n")
+
+def test_wal_open_until_close():
+    print("\n[TEST] Starting WAL Lifecycle Test...")
+    path = "./TestWALLifecycle"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    def wal_files():
+        return [name for name in os.listdir(path) if name.startswith("wal.log")]
+
+    # the log is opened by open(), not by the constructor
+    db = Database(path)
+    assert db.wal is None and wal_files() == []
+    db.open(path)
+    wal = db.wal
+    assert wal is not None and wal_files()
+    query = Query(db.create_table('Grades', 3, 0))
+    assert query.insert(1, 2, 3)
+
+    # close() closes it, a reopen with the same database logs to a new one
+    db.close()
+    assert db.wal is None and wal.fd is None
+    db.open(path)
+    assert db.wal is not wal and db.get_table('Grades').wal is db.wal
+    assert query.update(1, None, 5, None)
+    assert [r["op"] for _, r in db.wal.records()][-1] == "update"
+    db.close()
+
+    db = Database(path)
+    db.open(path)
+    assert Query(db.get_table('Grades')).select(1, 0, [1, 1, 1])[0].columns == [1, 5, 3]
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] WAL Lifecycle Test Completed.\n")
+
+if __name__ == "__main__":
+    test_wal_group_commit()
+    test_wal_checkpoint_truncation()
+    test_checkpoint_syncs_pages_first()
+    test_records_logged_before_pages_change()
+    test_wal_open_until_close()
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+from lstore.config import Config
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+def base_page_reads(table):
+    # column pages read, a scan reads the same columns of every base page it does not skip
+    stats = table.get_stats()["Base"]
+    return stats["hits"] + stats["misses"]
+
+def test_zone_map_pruned_scan():
+    print("\n[TEST] Starting Zone Map Scan Test...")
+    path = "./TestZoneMap"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    db = Database(path)
+    db.open(path)
+    table = db.create_table('Grades', 3, 0)
+    query = Query(table)
+
+    # column 1 follows the insert order, column 2 does not
+    num_records = 10 * Config.PAGE_CAPACITY
+    for key in range(num_records):
+        query.insert(key, key, key % 7)
+
+    # no page can be ruled out on the unclustered column
+    table.reset_stats()
+    assert len(table.index.locate(2, 3)[0]) == num_records // 7 + (num_records % 7 > 3)
+    page_reads = base_page_reads(table) // 10
+
+    # a lookup on the unindexed, clustered one reads a single base page
+    table.reset_stats()
+    assert table.index.locate(1, 3000)[0] == [3000]
+    print("clustered lookup, base page reads:", base_page_reads(table) / page_reads)
+    assert base_page_reads(table) == page_reads
+
+    # range scans without an index group the rids by value
+    table.reset_stats()
+    ranged = table.index.locate_range(1000, 1003, 1)
+    assert ranged == [[[rid], []] for rid in range(1000, 1004)]
+    assert base_page_reads(table) == page_reads
+
+    # an update moves a value outside of its page's zone, it is still found
+    assert query.update(10, None, 4 * num_records, None)
+    assert table.index.locate(1, 4 * num_records)[0] == [10]
+    assert table.index.locate(1, 10)[0] == []
+
+    # and so is the old value once the update is rolled back
+    transaction = Transaction()
+    assert query.update(20, None, 5 * num_records, None, transaction=transaction)
+    assert table.index.locate(1, 5 * num_records)[0] == [20]
+    assert table.index.locate(1, 20)[0] == []
+    transaction.abort()
+    assert table.index.locate(1, 20)[0] == [20]
+    db.close()
+
+    # zones are not saved, the first scan after a reopen builds them, the next one prunes
+    db = Database(path)
+    db.open(path)
+    table = db.get_table('Grades')
+    table.reset_stats()
+    assert table.index.locate(1, 3000)[0] == [3000]
+    assert base_page_reads(table) == 10 * page_reads
+    table.reset_stats()
+    assert table.index.locate(1, 4 * num_records)[0] == [10]
+    print("after reopen, base page reads:", base_page_reads(table) / page_reads)
+    assert base_page_reads(table) == page_reads
+    db.close()
+
+    shutil.rmtree(path)
+    print("[TEST] Zone Map Scan Test Completed.\n")
+
+if __name__ == "__main__":
+    test_zone_map_pruned_scan()